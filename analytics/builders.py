@@ -0,0 +1,223 @@
+"""
+Построение листа 'Анализ продаж' из строк финотчетов
+
+Вместо загрузки готовых чисел из Excel показатели по каждой паре
+(бренд, артикул, размер) считаются одним сгруппированным запросом к
+FinancialReport с условными суммами по обоснованию для оплаты (аналог
+SUMIFS по столбцу K), дополняются себестоимостью из номенклатуры и
+остатками и записываются в базу одной пачкой.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from analytics.db_utils import fit_decimal
+from analytics.models import FinancialReport, Nomenclature, SalesAnalysis, StockBalance
+
+
+# Значения столбца 'Обоснование для оплаты'
+PAYMENT_SALE = 'Продажа'
+PAYMENT_RETURN = 'Возврат'
+PAYMENT_LOGISTICS = 'Логистика'
+PAYMENT_SUBSTITUTION = ('Компенсация подмененного товара',)
+PAYMENT_DEFECT = ('Компенсация брака', 'Частичная компенсация брака')
+
+COMMISSION_PERCENT_FIELD = SalesAnalysis._meta.get_field('commission_percent')
+
+
+def normalize_size(value):
+    """Размер для сопоставления листов: '0.0' из числового столбца равен '0'"""
+    value = str(value or '').strip()
+    if value.endswith('.0') and value[:-2].lstrip('-').isdigit():
+        return value[:-2]
+    return value or '0'
+
+
+def _sum(expression, condition=None):
+    """Условная сумма (SUMIFS) с нулем вместо NULL"""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return Coalesce(Sum(expression, filter=condition, output_field=money), Value(Decimal('0')), output_field=money)
+
+
+class SalesAnalysisBuilder:
+    """Расчет строк анализа продаж из финотчетов, номенклатуры и остатков"""
+
+    # Поля, которые заполняет построитель; остальные считает CalculationService
+    BUILT_FIELDS = (
+        'subject', 'barcode',
+        'in_transit_to_client', 'in_transit_from_client', 'in_warehouses', 'total_stock_wb',
+        'orders', 'rejections', 'sales', 'returns',
+        'logistics_for_returns', 'sales_before_spp', 'sales_with_spp',
+        'sales_minus_commission', 'sales_minus_commission_no_returns',
+        'return_amount', 'sales_minus_returns_amount',
+        'commission', 'commission_percent', 'logistics', 'acquiring', 'fine',
+        'additional_payments', 'substitution_compensation', 'defect_compensation',
+        'cost_per_unit',
+    )
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def period_queryset(date_from=None, date_to=None):
+        """Строки финотчетов за период по дате продажи (границы включительно)"""
+        queryset = FinancialReport.objects.all()
+        if date_from:
+            queryset = queryset.filter(
+                sale_date__gte=timezone.make_aware(datetime.combine(date_from, time.min))
+            )
+        if date_to:
+            queryset = queryset.filter(
+                sale_date__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+            )
+        return queryset
+
+    @staticmethod
+    def aggregate_reports(queryset):
+        """Один сгруппированный запрос: суммы по (бренд, артикул, размер)"""
+        sale = Q(payment_basis=PAYMENT_SALE)
+        refund = Q(payment_basis=PAYMENT_RETURN)
+        logistics = Q(payment_basis=PAYMENT_LOGISTICS)
+
+        return queryset.order_by().values('brand', 'supplier_article', 'size').annotate(
+            subject_value=Max('subject'),
+            barcode_value=Max('barcode'),
+            orders_count=_sum('delivery_count', logistics),
+            rejections_count=_sum('return_count', logistics),
+            sales_count=_sum('quantity', sale),
+            returns_count=_sum('quantity', refund),
+            sales_before_spp_sum=_sum(F('retail_price_with_discount') * F('quantity'), sale),
+            returns_before_spp_sum=_sum(F('retail_price_with_discount') * F('quantity'), refund),
+            sales_with_spp_sum=_sum('wb_sold_product', sale),
+            returns_with_spp_sum=_sum('wb_sold_product', refund),
+            payment_sales_sum=_sum('payment_to_seller', sale),
+            payment_returns_sum=_sum('payment_to_seller', refund),
+            logistics_sum=_sum('delivery_services'),
+            logistics_returns_sum=_sum('delivery_services', logistics & Q(return_count__gt=0)),
+            acquiring_sales_sum=_sum('acquiring_commission', sale),
+            acquiring_returns_sum=_sum('acquiring_commission', refund),
+            fines_sum=_sum('total_fines'),
+            additional_payments_sum=_sum('additional_payments'),
+            substitution_sum=_sum('payment_to_seller', Q(payment_basis__in=PAYMENT_SUBSTITUTION)),
+            defect_sum=_sum('payment_to_seller', Q(payment_basis__in=PAYMENT_DEFECT)),
+        )
+
+    @staticmethod
+    def reference_data():
+        """Себестоимость из номенклатуры и остатки по ключу (бренд, артикул, размер)"""
+        cost_prices = {
+            (brand, article, normalize_size(size)): cost_price
+            for brand, article, size, cost_price in Nomenclature.objects.values_list(
+                'brand', 'supplier_article', 'size', 'cost_price'
+            )
+        }
+        stocks = {
+            (row['brand'], row['supplier_article'], normalize_size(row['item_size'])): row
+            for row in StockBalance.objects.values(
+                'brand', 'subject', 'supplier_article', 'item_size',
+                'in_transit_to_client', 'in_transit_from_client', 'total_in_warehouses',
+            )
+        }
+        return cost_prices, stocks
+
+    @staticmethod
+    def build_rows(date_from=None, date_to=None):
+        """Значения полей анализа продаж по ключу (бренд, артикул, размер)"""
+        cost_prices, stocks = SalesAnalysisBuilder.reference_data()
+        rows = {}
+
+        for group in SalesAnalysisBuilder.aggregate_reports(
+            SalesAnalysisBuilder.period_queryset(date_from, date_to)
+        ):
+            key = (group['brand'], group['supplier_article'], normalize_size(group['size']))
+
+            sales_before_spp = group['sales_before_spp_sum'] - group['returns_before_spp_sum']
+            sales_minus_commission = group['payment_sales_sum'] - group['payment_returns_sum']
+            commission = sales_before_spp - sales_minus_commission
+
+            rows[key] = {
+                'subject': group['subject_value'] or '',
+                'barcode': group['barcode_value'] or '',
+                'orders': int(group['orders_count']),
+                'rejections': int(group['rejections_count']),
+                'sales': int(group['sales_count']),
+                'returns': int(group['returns_count']),
+                'logistics_for_returns': group['logistics_returns_sum'],
+                'sales_before_spp': sales_before_spp,
+                'sales_with_spp': group['sales_with_spp_sum'] - group['returns_with_spp_sum'],
+                'sales_minus_commission': sales_minus_commission,
+                'sales_minus_commission_no_returns': group['payment_sales_sum'],
+                'return_amount': group['payment_returns_sum'],
+                'sales_minus_returns_amount': sales_minus_commission,
+                'commission': commission,
+                # Комиссия %: =IFERROR(Комиссия / Продажи до СПП, ); доля больше 10
+                # (комиссия при почти нулевых продажах) не помещается в поле
+                'commission_percent': fit_decimal(
+                    COMMISSION_PERCENT_FIELD, commission / sales_before_spp if sales_before_spp else 0
+                ),
+                'logistics': group['logistics_sum'],
+                'acquiring': group['acquiring_sales_sum'] - group['acquiring_returns_sum'],
+                'fine': group['fines_sum'],
+                'additional_payments': group['additional_payments_sum'],
+                'substitution_compensation': group['substitution_sum'],
+                'defect_compensation': group['defect_sum'],
+            }
+
+        # Товары без движения за период, но с остатками, тоже попадают в анализ
+        for key, stock in stocks.items():
+            rows.setdefault(key, {'subject': stock['subject'], 'barcode': ''})
+
+        for key, values in rows.items():
+            stock = stocks.get(key)
+            to_client = stock['in_transit_to_client'] if stock else 0
+            from_client = stock['in_transit_from_client'] if stock else 0
+            in_warehouses = stock['total_in_warehouses'] if stock else 0
+            values.update({
+                'in_transit_to_client': to_client,
+                'in_transit_from_client': from_client,
+                'in_warehouses': in_warehouses,
+                'total_stock_wb': to_client + from_client + in_warehouses,
+                'cost_per_unit': cost_prices.get(key, Decimal('0')),
+            })
+
+        return rows
+
+    @staticmethod
+    def build(date_from=None, date_to=None, batch_size=None):
+        """
+        Пересборка таблицы анализа продаж за период.
+
+        Существующие строки обновляются по ключу, новые добавляются, строки
+        без продаж и остатков за период удаляются. Возвращает число строк.
+        """
+        rows = SalesAnalysisBuilder.build_rows(date_from, date_to)
+        fields = SalesAnalysisBuilder.BUILT_FIELDS
+
+        instances = [
+            SalesAnalysis(brand=brand, article=article, size=size, **values)
+            for (brand, article, size), values in rows.items()
+        ]
+
+        with transaction.atomic():
+            SalesAnalysis.objects.bulk_create(
+                instances,
+                batch_size=batch_size or SalesAnalysisBuilder.BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['brand', 'article', 'size'],
+                update_fields=list(fields) + ['is_dirty'],
+            )
+
+            keep = set(rows)
+            stale = [
+                pk for pk, brand, article, size in
+                SalesAnalysis.objects.values_list('pk', 'brand', 'article', 'size').iterator()
+                if (brand, article, size) not in keep
+            ]
+            for start in range(0, len(stale), SalesAnalysisBuilder.BATCH_SIZE):
+                SalesAnalysis.objects.filter(pk__in=stale[start:start + SalesAnalysisBuilder.BATCH_SIZE]).delete()
+
+        return len(instances)
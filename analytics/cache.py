@@ -0,0 +1,156 @@
+"""
+Кеш обзорных данных дашборда
+
+Сводные данные считаются один раз после изменения данных (импорт или
+пересчет), а запросы на чтение берут готовый ответ из кеша процесса или,
+если настроен SUMMARY_CACHE_ALIAS, из общего кеша Django.
+
+Актуальность определяется версией данных - токеном в файле
+DATA_VERSION_FILE, который меняют импорт и пересчет. Файл общий для всех
+процессов, поэтому сброс из management-команды виден и веб-серверу.
+"""
+
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Avg, Sum
+
+from analytics.models import DailySalesRollup, SalesAnalysis
+from analytics.serializers import SalesAnalysisSerializer
+
+
+OVERVIEW_KEY = 'analytics:overview:{version}'
+
+_local = {}
+_lock = threading.Lock()
+
+
+def data_version():
+    """Текущая версия данных; пустая строка, если данные еще не менялись"""
+    try:
+        with open(settings.DATA_VERSION_FILE, encoding='utf-8') as version_file:
+            return version_file.read().strip()
+    except FileNotFoundError:
+        return ''
+
+
+def data_version_modified():
+    """Время смены версии данных (mtime файла версии) или None"""
+    try:
+        return os.stat(settings.DATA_VERSION_FILE).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def invalidate():
+    """Новая версия данных: кеши всех процессов становятся неактуальными"""
+    version = uuid.uuid4().hex
+    path = settings.DATA_VERSION_FILE
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as version_file:
+        version_file.write(version)
+    os.replace(temp_path, path)
+
+    with _lock:
+        _local.clear()
+    return version
+
+
+def shared_cache():
+    """Общий кеш Django из настроек или None, если используется только кеш процесса"""
+    alias = settings.SUMMARY_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+# Запросы дашборда; индексы под них объявлены в моделях (миграция 0005)
+
+def top_products_query():
+    """Топ-10 товаров по марже после налогов"""
+    return SalesAnalysis.objects.filter(
+        margin_after_tax__gt=0
+    ).order_by('-margin_after_tax')[:10]
+
+
+def brand_stats_query():
+    """Топ-5 брендов по марже"""
+    return SalesAnalysis.objects.values('brand').annotate(
+        total_sales=Sum('sales_minus_returns'),
+        total_margin=Sum('margin_after_tax'),
+        avg_margin_percent=Avg('margin_percent')
+    ).order_by('-total_margin')[:5]
+
+
+def sales_by_day_query():
+    """Продажи по дням из дневных итогов, без чтения строк финотчетов"""
+    return DailySalesRollup.objects.values('day').annotate(
+        total_sales=Sum('wb_sold_product'),
+        total_quantity=Sum('quantity')
+    ).order_by('day')
+
+
+def margin_by_product_query():
+    """Топ-20 товаров по марже для графика маржинальности"""
+    return SalesAnalysis.objects.filter(
+        margin_percent__gt=0
+    ).values('brand', 'article').annotate(
+        margin_percent=Avg('margin_percent'),
+        total_margin=Sum('margin_after_tax')
+    ).order_by('-total_margin')[:20]
+
+
+DASHBOARD_QUERIES = (top_products_query, brand_stats_query, sales_by_day_query, margin_by_product_query)
+
+
+def build_overview():
+    """Обзорные данные дашборда: сводка, топ товаров по марже, статистика брендов"""
+    # Импортируется здесь: services сам сбрасывает этот кеш после пересчета
+    from analytics.services import CalculationService
+
+    # Сводка считается по формулам без записи в базу, один раз на версию данных
+    summary = CalculationService.build_summary_values()
+
+    top_products = top_products_query()
+    brand_stats = brand_stats_query()
+
+    return {
+        'summary': {
+            'sales_minus_returns_count': summary['sales_minus_returns_count'],
+            'purchase_percentage': float(summary['purchase_percentage']),
+            'average_check_after_spp': float(summary['average_check_after_spp']),
+            'margin_after_all_expenses': float(summary['margin_after_all_expenses']),
+            'margin_percent_with_spp': float(summary['margin_percent_with_spp']),
+        },
+        'top_products': [dict(item) for item in SalesAnalysisSerializer(top_products, many=True).data],
+        'brand_stats': list(brand_stats),
+    }
+
+
+def build_charts_data():
+    """Данные графиков дашборда: продажи по дням и маржинальность по товарам"""
+    return {
+        'sales_by_day': list(sales_by_day_query()),
+        'margin_by_product': list(margin_by_product_query()),
+    }
+
+
+def get_overview():
+    """Обзорные данные из кеша; расчет только при смене версии данных"""
+    version = data_version()
+    cached = _local.get('overview')
+    if cached and cached[0] == version:
+        return cached[1]
+
+    shared = shared_cache()
+    key = OVERVIEW_KEY.format(version=version or 'initial')
+    overview = shared.get(key) if shared else None
+    if overview is None:
+        overview = build_overview()
+        if shared:
+            shared.set(key, overview, timeout=None)
+
+    with _lock:
+        _local['overview'] = (version, overview)
+    return overview
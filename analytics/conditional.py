@@ -0,0 +1,51 @@
+"""
+Условные ответы API: ETag и Last-Modified
+
+Валидаторы строятся без обращения к базе и без чтения JSON-файлов: в
+статическом режиме - по времени изменения и размеру файла static/data/,
+иначе - по версии данных, которую меняют импорт, пересчет и запись через
+API. ETag слабые: сжатый и несжатый ответы семантически одинаковы.
+"""
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from analytics import cache
+from analytics.static_data import store
+
+
+def static_validators(filename):
+    """ETag и время изменения статического файла по его mtime и размеру"""
+    signature = store.file_signature(store.path(filename))
+    if signature is None:
+        return None, None
+    mtime_ns, size = signature
+    return f'W/"s-{mtime_ns:x}-{size:x}"', mtime_ns / 1e9
+
+
+def data_validators():
+    """ETag и время изменения по версии данных; None, если данные еще не менялись"""
+    version = cache.data_version()
+    if not version:
+        return None, None
+    return f'W/"d-{version}"', cache.data_version_modified()
+
+
+def conditional_response(request, validators, build):
+    """
+    304 по If-None-Match / If-Modified-Since, если представление клиента
+    актуально; иначе ответ build() с заголовками ETag и Last-Modified
+    """
+    etag, last_modified = validators
+    last_modified = int(last_modified) if last_modified is not None else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build()
+
+    if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+        if etag and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified is not None and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+    return response
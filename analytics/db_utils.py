@@ -0,0 +1,61 @@
+"""
+Вспомогательные функции для массовой записи в базу данных
+"""
+
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+
+def fit_decimal(field, value):
+    """
+    Значение для DecimalField: округление до decimal_places и ограничение
+    диапазоном max_digits. SQLite сохраняет число любой длины, а чтение
+    такого значения через ORM падает с decimal.InvalidOperation
+    """
+    step = Decimal(1).scaleb(-field.decimal_places)
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places) - step
+    value = Decimal(value).quantize(step)
+    return max(-limit, min(value, limit))
+
+
+def bulk_update_rows(model, fields, rows, batch_size=1000):
+    """
+    Обновление строк пачками: одна транзакция и один параметризованный
+    UPDATE через executemany на пачку.
+
+    rows - итерируемое пар (pk, [значения полей в порядке fields]).
+    bulk_update строит выражение CASE WHEN на каждое поле каждой строки,
+    и на десятках тысяч строк его сборка дороже самой записи.
+    """
+    meta = model._meta
+    model_fields = [meta.get_field(name) for name in fields]
+
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {columns} WHERE {pk} = %s'.format(
+        table=quote(meta.db_table),
+        columns=', '.join(f'{quote(field.column)} = %s' for field in model_fields),
+        pk=quote(meta.pk.column),
+    )
+
+    def flush(params):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    count = 0
+    params = []
+    for pk, values in rows:
+        params.append([
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(model_fields, values)
+        ] + [pk])
+        if len(params) >= batch_size:
+            flush(params)
+            count += len(params)
+            params = []
+
+    if params:
+        flush(params)
+        count += len(params)
+
+    return count
@@ -0,0 +1,559 @@
+"""
+Движки пересчета листа 'Анализ продаж'
+
+Альтернативы построчному пересчету CalculationService: векторный движок
+загружает таблицу один раз в столбцы pandas/NumPy и записывает результат
+пачками (в float64 или в целых копейках), движок базы данных выполняет те
+же формулы серией UPDATE.
+"""
+
+from decimal import Context, Decimal
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Floor, Mod, Round
+from django.db.models.lookups import Exact, GreaterThan, LessThan
+from django.utils import timezone
+
+from analytics.db_utils import bulk_update_rows
+from analytics.models import SalesAnalysis
+
+
+def update_shares(total_revenue, total_margin, queryset=None):
+    """
+    Доли от общей выручки и маржи одним UPDATE по всем строкам.
+
+    Как и в построчном пересчете, при неположительном итоге доля
+    не меняется. Деление ведется в плавающей точке: целые суммы в SQLite
+    иначе делятся нацело; доля округляется до знаков столбца.
+    """
+    if queryset is None:
+        queryset = SalesAnalysis.objects.all()
+
+    ratio_field = SalesAnalysis._meta.get_field('revenue_share')
+
+    def share(field, total):
+        quotient = Cast(field, FloatField()) / Value(float(total))
+        rounded = DatabaseSalesAnalysisEngine._round_half_even(quotient, ratio_field.decimal_places)
+        return Cast(rounded, output_field=ratio_field)
+
+    values = {}
+    if total_revenue and total_revenue > 0:
+        values['revenue_share'] = share('sales_minus_commission', total_revenue)
+    if total_margin and total_margin > 0:
+        values['margin_share'] = share('margin_after_tax', total_margin)
+    if not values:
+        return 0
+    return queryset.update(**values)
+
+
+class VectorizedSalesAnalysisEngine:
+    """Векторный пересчет показателей анализа продаж"""
+
+    BATCH_SIZE = 2000
+
+    # Столбцы, которые читаются из базы
+    INPUT_FIELDS = (
+        'id', 'orders', 'sales', 'returns', 'sales_with_spp', 'logistics',
+        'cost_per_unit', 'sales_minus_commission', 'total_stock_wb',
+        # Текущие значения нужны для строк, где формула не применяется
+        # (в построчном пересчете такие поля остаются без изменений)
+        'purchase_percentage', 'average_check', 'logistics_per_unit',
+        'margin_per_unit', 'margin_percent', 'roi_from_cost',
+        'revenue_share', 'margin_share',
+    )
+
+    # Столбцы, которые записываются обратно
+    OUTPUT_FIELDS = (
+        'purchase_percentage', 'sales_minus_returns', 'average_check',
+        'logistics_per_unit', 'sold_goods_cost', 'margin_before_tax',
+        'tax_6_percent', 'margin_after_tax', 'margin_per_unit',
+        'margin_percent', 'roi_from_cost', 'gmroi', 'revenue_share',
+        'margin_share', 'money_in_goods',
+    )
+
+    # Доли от итогов всей таблицы: при пересчете части строк их пишет update_shares
+    SHARE_FIELDS = ('revenue_share', 'margin_share')
+
+    TAX_RATE = 0.06
+
+    # float64 хранит ~15 значащих цифр: шум в младших разрядах отбрасывается
+    # до округления, как это делает Django при чтении DecimalField из SQLite
+    FLOAT_CONTEXT = Context(prec=15)
+
+    @staticmethod
+    def _ratio(numerator, denominator, condition, current):
+        """Деление по маске: где условие не выполнено, остается текущее значение"""
+        result = current.copy()
+        np.divide(numerator, denominator, out=result, where=condition)
+        return result
+
+    @staticmethod
+    def load(queryset=None):
+        """Загрузка таблицы в столбцы DataFrame одним запросом"""
+        if queryset is None:
+            queryset = SalesAnalysis.objects.all()
+
+        fields = VectorizedSalesAnalysisEngine.INPUT_FIELDS
+        frame = pd.DataFrame.from_records(
+            queryset.order_by().values_list(*fields).iterator(),
+            columns=fields,
+        )
+        if frame.empty:
+            return frame
+
+        for field in fields[1:]:
+            frame[field] = frame[field].astype('float64')
+        return frame
+
+    @staticmethod
+    def compute(frame, total_revenue=None, total_margin=None):
+        """
+        Расчет всех производных столбцов за один проход.
+
+        Доли выручки и маржи считаются от итогов по переданной таблице;
+        для пересчета части строк итоги по всей таблице передаются явно.
+        """
+        ratio = VectorizedSalesAnalysisEngine._ratio
+
+        orders = frame['orders'].to_numpy()
+        sales = frame['sales'].to_numpy()
+        returns = frame['returns'].to_numpy()
+        sales_with_spp = frame['sales_with_spp'].to_numpy()
+        logistics = frame['logistics'].to_numpy()
+        cost_per_unit = frame['cost_per_unit'].to_numpy()
+        sales_minus_commission = frame['sales_minus_commission'].to_numpy()
+        total_stock_wb = frame['total_stock_wb'].to_numpy()
+
+        sales_minus_returns = sales - returns
+        has_sales = sales_minus_returns > 0
+
+        result = pd.DataFrame({'id': frame['id'].to_numpy()})
+        result['purchase_percentage'] = ratio(
+            sales, orders, orders > 0, frame['purchase_percentage'].to_numpy()
+        )
+        result['sales_minus_returns'] = sales_minus_returns
+        result['average_check'] = ratio(
+            sales_with_spp, sales_minus_returns, has_sales,
+            frame['average_check'].to_numpy()
+        )
+        result['logistics_per_unit'] = ratio(
+            logistics, sales_minus_returns, has_sales,
+            frame['logistics_per_unit'].to_numpy()
+        )
+
+        sold_goods_cost = cost_per_unit * sales_minus_returns
+        margin_before_tax = sales_minus_commission - sold_goods_cost
+        tax_6_percent = margin_before_tax * VectorizedSalesAnalysisEngine.TAX_RATE
+        margin_after_tax = margin_before_tax - tax_6_percent
+
+        result['sold_goods_cost'] = sold_goods_cost
+        result['margin_before_tax'] = margin_before_tax
+        result['tax_6_percent'] = tax_6_percent
+        result['margin_after_tax'] = margin_after_tax
+        result['margin_per_unit'] = ratio(
+            margin_after_tax, sales_minus_returns, has_sales,
+            frame['margin_per_unit'].to_numpy()
+        )
+        result['margin_percent'] = ratio(
+            margin_after_tax, sales_minus_commission, sales_minus_commission > 0,
+            frame['margin_percent'].to_numpy()
+        )
+        result['roi_from_cost'] = ratio(
+            margin_after_tax, sold_goods_cost, sold_goods_cost > 0,
+            frame['roi_from_cost'].to_numpy()
+        )
+        result['gmroi'] = result['roi_from_cost']
+
+        if total_revenue is None:
+            total_revenue = sales_minus_commission.sum()
+        if total_margin is None:
+            total_margin = margin_after_tax.sum()
+
+        revenue_share = frame['revenue_share'].to_numpy()
+        if total_revenue > 0:
+            revenue_share = sales_minus_commission / total_revenue
+        result['revenue_share'] = revenue_share
+
+        margin_share = frame['margin_share'].to_numpy()
+        if total_margin > 0:
+            margin_share = margin_after_tax / total_margin
+        result['margin_share'] = margin_share
+
+        result['money_in_goods'] = cost_per_unit * total_stock_wb
+        return result
+
+    @staticmethod
+    def _to_model_value(field, value):
+        """Перевод значения NumPy в тип поля модели (округление при записи)"""
+        if field.get_internal_type() == 'DecimalField':
+            value = VectorizedSalesAnalysisEngine.FLOAT_CONTEXT.create_decimal_from_float(float(value))
+            return value.quantize(Decimal(1).scaleb(-field.decimal_places), context=field.context)
+        return int(value)
+
+    @staticmethod
+    def write(result, batch_size=None, fields=None):
+        """Запись результата пачками, по транзакции на пачку; строки помечаются пересчитанными"""
+        fields = fields or VectorizedSalesAnalysisEngine.OUTPUT_FIELDS
+        model_fields = [SalesAnalysis._meta.get_field(name) for name in fields]
+        to_value = VectorizedSalesAnalysisEngine._to_model_value
+        calculated_at = timezone.now()
+
+        columns = [result[name].to_numpy() for name in fields]
+        ids = result['id'].to_numpy()
+
+        rows = (
+            (
+                int(ids[row]),
+                [to_value(field, column[row]) for field, column in zip(model_fields, columns)]
+                + [False, calculated_at],
+            )
+            for row in range(len(ids))
+        )
+        return bulk_update_rows(
+            SalesAnalysis, fields + ('is_dirty', 'calculated_at'), rows,
+            batch_size=batch_size or VectorizedSalesAnalysisEngine.BATCH_SIZE,
+        )
+
+    @staticmethod
+    def output_fields(shares):
+        """Записываемые столбцы; shares=False - без долей от итогов таблицы"""
+        fields = VectorizedSalesAnalysisEngine.OUTPUT_FIELDS
+        if shares:
+            return fields
+        return tuple(name for name in fields if name not in VectorizedSalesAnalysisEngine.SHARE_FIELDS)
+
+    @staticmethod
+    def run(queryset=None, batch_size=None, total_revenue=None, total_margin=None, shares=True):
+        """
+        Полный цикл: загрузка, расчет, запись. Возвращает число строк.
+        shares=False - доли не записываются (их затем пересчитывает update_shares)
+        """
+        frame = VectorizedSalesAnalysisEngine.load(queryset)
+        if frame.empty:
+            return 0
+        result = VectorizedSalesAnalysisEngine.compute(
+            frame, total_revenue=total_revenue, total_margin=total_margin
+        )
+        return VectorizedSalesAnalysisEngine.write(
+            result, batch_size=batch_size, fields=VectorizedSalesAnalysisEngine.output_fields(shares)
+        )
+
+
+class DatabaseSalesAnalysisEngine:
+    """
+    Пересчет показателей анализа продаж на стороне базы данных.
+
+    Формулы выражены через F() и Case/When и выполняются несколькими
+    UPDATE по всей таблице; строки в Python не загружаются. Каждый
+    следующий UPDATE опирается на столбцы, записанные предыдущим.
+    """
+
+    TAX_RATE = Decimal('0.06')
+
+    @staticmethod
+    def _float(expression):
+        """Приведение к плавающей точке: целые столбцы иначе делятся нацело"""
+        return Cast(expression, FloatField())
+
+    @staticmethod
+    def _ratio(name, numerator, denominator, condition, current=None):
+        """
+        IFERROR-деление для столбца name: где условие не выполнено, остается
+        текущее значение (по умолчанию самого столбца). Частное округляется
+        до decimal_places столбца, как при записи DecimalField в других движках
+        """
+        to_float = DatabaseSalesAnalysisEngine._float
+        field = SalesAnalysis._meta.get_field(name)
+        quotient = Case(
+            When(condition, then=to_float(numerator) / to_float(denominator)),
+            default=to_float(current or name),
+            output_field=FloatField(),
+        )
+        return Cast(DatabaseSalesAnalysisEngine._round_half_even(quotient, field.decimal_places), output_field=field)
+
+    @staticmethod
+    def _round_half_even(expression, places):
+        """
+        Банковское округление до places знаков, как при записи DecimalField.
+        ROUND в SQLite округляет половину от нуля; шум float в младших
+        разрядах отбрасывается до сравнения с половиной
+        """
+        scale = Value(float(10 ** places))
+        scaled = Round(expression * scale, 6, output_field=FloatField())
+        lower = Floor(scaled)
+        fraction = scaled - lower
+        return Case(
+            When(GreaterThan(fraction, 0.5), then=lower + 1),
+            When(LessThan(fraction, 0.5), then=lower),
+            When(Exact(Mod(lower, 2), 0), then=lower),
+            default=lower + 1,
+            output_field=FloatField(),
+        ) / scale
+
+    @staticmethod
+    def _total(field):
+        """Скалярный подзапрос с итогом столбца по всей таблице"""
+        return Subquery(
+            SalesAnalysis.objects.order_by()
+            .annotate(group=Value(1))
+            .values('group')
+            .annotate(total=Sum(field))
+            .values('total')[:1],
+            output_field=FloatField(),
+        )
+
+    @staticmethod
+    def statements():
+        """Значения для последовательных UPDATE в порядке зависимостей"""
+        ratio = DatabaseSalesAnalysisEngine._ratio
+        total = DatabaseSalesAnalysisEngine._total
+        has_sales = Q(sales_minus_returns__gt=0)
+        margin_before_tax = F('sales_minus_commission') - F('sold_goods_cost')
+        tax_rate = Value(DatabaseSalesAnalysisEngine.TAX_RATE)
+
+        return [
+            {
+                'sales_minus_returns': F('sales') - F('returns'),
+                'sold_goods_cost': F('cost_per_unit') * (F('sales') - F('returns')),
+                'money_in_goods': F('cost_per_unit') * F('total_stock_wb'),
+                'purchase_percentage': ratio('purchase_percentage', 'sales', 'orders', Q(orders__gt=0)),
+            },
+            {
+                'average_check': ratio('average_check', 'sales_with_spp', 'sales_minus_returns', has_sales),
+                'logistics_per_unit': ratio('logistics_per_unit', 'logistics', 'sales_minus_returns', has_sales),
+                'margin_before_tax': margin_before_tax,
+                'tax_6_percent': margin_before_tax * tax_rate,
+                'margin_after_tax': margin_before_tax - margin_before_tax * tax_rate,
+            },
+            {
+                'margin_per_unit': ratio('margin_per_unit', 'margin_after_tax', 'sales_minus_returns', has_sales),
+                'margin_percent': ratio(
+                    'margin_percent', 'margin_after_tax', 'sales_minus_commission', Q(sales_minus_commission__gt=0)
+                ),
+                'roi_from_cost': ratio('roi_from_cost', 'margin_after_tax', 'sold_goods_cost', Q(sold_goods_cost__gt=0)),
+                # GMROI равен ROI, в том числе старому, если ROI не пересчитывается
+                'gmroi': ratio('gmroi', 'margin_after_tax', 'sold_goods_cost', Q(sold_goods_cost__gt=0), 'roi_from_cost'),
+            },
+            {
+                'revenue_share': ratio(
+                    'revenue_share', 'sales_minus_commission', total('sales_minus_commission'),
+                    GreaterThan(total('sales_minus_commission'), 0),
+                ),
+                'margin_share': ratio(
+                    'margin_share', 'margin_after_tax', total('margin_after_tax'),
+                    GreaterThan(total('margin_after_tax'), 0),
+                ),
+                'is_dirty': Value(False),
+                'calculated_at': Value(timezone.now()),
+            },
+        ]
+
+    @staticmethod
+    def run(queryset=None):
+        """Пересчет записей выборки (по умолчанию всех). Возвращает число строк"""
+        if queryset is None:
+            target = SalesAnalysis.objects.all()
+        else:
+            # Подзапрос по идентификаторам: условия выборки могут зависеть от
+            # is_dirty и calculated_at, которые меняет только последний UPDATE
+            target = SalesAnalysis.objects.filter(pk__in=queryset.order_by().values('pk'))
+
+        count = 0
+        with transaction.atomic():
+            for values in DatabaseSalesAnalysisEngine.statements():
+                count = target.update(**values)
+        return count
+
+
+class FixedPointSalesAnalysisEngine:
+    """
+    Пересчет показателей анализа продаж в целых числах с фиксированной точкой.
+
+    Деньги хранятся в копейках (int64), доли - в десятитысячных, каждое
+    значение округляется один раз, при делении, по правилу записи
+    DecimalField (банковское округление до decimal_places поля). Поэтому
+    результат совпадает с построчным расчетом в Decimal до знака, а в
+    Decimal значения переводятся только при записи в модель.
+    """
+
+    BATCH_SIZE = 2000
+
+    # Столбцы-доли и их масштаб (decimal_places = 4)
+    RATIO_SCALE = 10 ** 4
+    # Денежные столбцы в копейках (decimal_places = 2)
+    MONEY_SCALE = 10 ** 2
+
+    # Налог 6% в процентах: маржа после налога = маржа до налога * 94 / 100
+    TAX_PERCENT = 6
+
+    INPUT_FIELDS = VectorizedSalesAnalysisEngine.INPUT_FIELDS
+    OUTPUT_FIELDS = VectorizedSalesAnalysisEngine.OUTPUT_FIELDS
+
+    @staticmethod
+    def _round_divide(numerator, denominator, condition, current):
+        """
+        Целочисленное деление с банковским округлением по маске; где условие
+        не выполнено (IFERROR), остается текущее значение
+        """
+        safe_denominator = np.where(condition, denominator, 1)
+        quotient, remainder = np.divmod(numerator, safe_denominator)
+        # divmod округляет вниз, остаток одного знака с делителем
+        twice = 2 * np.abs(remainder)
+        divisor = np.abs(safe_denominator)
+        round_up = (twice > divisor) | ((twice == divisor) & (quotient % 2 == 1))
+        result = quotient + round_up
+        return np.where(condition, result, current)
+
+    @staticmethod
+    def _scaled(frame, field, scale):
+        """Столбец в целых единицах масштаба (копейках, десятитысячных)"""
+        return np.rint(frame[field].to_numpy() * scale).astype(np.int64)
+
+    @staticmethod
+    def load(queryset=None):
+        """Загрузка таблицы в целочисленные столбцы"""
+        frame = VectorizedSalesAnalysisEngine.load(queryset)
+        if frame.empty:
+            return frame
+
+        result = pd.DataFrame({'id': frame['id'].to_numpy()})
+        for name in FixedPointSalesAnalysisEngine.INPUT_FIELDS[1:]:
+            field = SalesAnalysis._meta.get_field(name)
+            scale = 10 ** field.decimal_places if field.get_internal_type() == 'DecimalField' else 1
+            result[name] = FixedPointSalesAnalysisEngine._scaled(frame, name, scale)
+        return result
+
+    @staticmethod
+    def compute(frame, total_revenue=None, total_margin=None):
+        """
+        Расчет всех производных столбцов за один проход.
+
+        Итоги выручки и маржи (в копейках) по умолчанию считаются по
+        переданной таблице.
+        """
+        divide = FixedPointSalesAnalysisEngine._round_divide
+        ratio_scale = FixedPointSalesAnalysisEngine.RATIO_SCALE
+        tax_percent = FixedPointSalesAnalysisEngine.TAX_PERCENT
+
+        column = lambda name: frame[name].to_numpy()
+        orders = column('orders')
+        sales = column('sales')
+        sales_with_spp = column('sales_with_spp')
+        logistics = column('logistics')
+        cost_per_unit = column('cost_per_unit')
+        sales_minus_commission = column('sales_minus_commission')
+
+        sales_minus_returns = sales - column('returns')
+        has_sales = sales_minus_returns > 0
+
+        sold_goods_cost = cost_per_unit * sales_minus_returns
+        margin_before_tax = sales_minus_commission - sold_goods_cost
+        # Налог и маржа после налога точно, в сотых долях копейки
+        tax_exact = margin_before_tax * tax_percent
+        margin_exact = margin_before_tax * (100 - tax_percent)
+        everywhere = np.ones(len(frame), dtype=bool)
+        tax_6_percent = divide(tax_exact, 100, everywhere, 0)
+        margin_after_tax = divide(margin_exact, 100, everywhere, 0)
+
+        result = pd.DataFrame({'id': column('id')})
+        result['purchase_percentage'] = divide(
+            sales * ratio_scale, orders, orders > 0, column('purchase_percentage')
+        )
+        result['sales_minus_returns'] = sales_minus_returns
+        result['average_check'] = divide(
+            sales_with_spp, sales_minus_returns, has_sales, column('average_check')
+        )
+        result['logistics_per_unit'] = divide(
+            logistics, sales_minus_returns, has_sales, column('logistics_per_unit')
+        )
+        result['sold_goods_cost'] = sold_goods_cost
+        result['margin_before_tax'] = margin_before_tax
+        result['tax_6_percent'] = tax_6_percent
+        result['margin_after_tax'] = margin_after_tax
+
+        # Производные от маржи считаются от точного значения, как в Decimal
+        result['margin_per_unit'] = divide(
+            margin_exact, sales_minus_returns * 100, has_sales, column('margin_per_unit')
+        )
+        result['margin_percent'] = divide(
+            margin_exact * ratio_scale, sales_minus_commission * 100,
+            sales_minus_commission > 0, column('margin_percent')
+        )
+        result['roi_from_cost'] = divide(
+            margin_exact * ratio_scale, sold_goods_cost * 100,
+            sold_goods_cost > 0, column('roi_from_cost')
+        )
+        result['gmroi'] = result['roi_from_cost']
+
+        if total_revenue is None:
+            total_revenue = int(sales_minus_commission.sum())
+        if total_margin is None:
+            total_margin = int(margin_after_tax.sum())
+
+        result['revenue_share'] = divide(
+            sales_minus_commission * ratio_scale, total_revenue,
+            np.full(len(frame), total_revenue > 0), column('revenue_share')
+        )
+        result['margin_share'] = divide(
+            margin_exact * ratio_scale, total_margin * 100,
+            np.full(len(frame), total_margin > 0), column('margin_share')
+        )
+
+        result['money_in_goods'] = cost_per_unit * column('total_stock_wb')
+        return result
+
+    @staticmethod
+    def _to_model_value(field, value):
+        """Целое в единицах масштаба -> значение поля модели"""
+        if field.get_internal_type() == 'DecimalField':
+            return Decimal(int(value)).scaleb(-field.decimal_places)
+        return int(value)
+
+    @staticmethod
+    def write(result, batch_size=None, fields=None):
+        """Запись результата пачками; строки помечаются пересчитанными"""
+        fields = fields or FixedPointSalesAnalysisEngine.OUTPUT_FIELDS
+        model_fields = [SalesAnalysis._meta.get_field(name) for name in fields]
+        to_value = FixedPointSalesAnalysisEngine._to_model_value
+        calculated_at = timezone.now()
+
+        columns = [result[name].to_numpy() for name in fields]
+        ids = result['id'].to_numpy()
+
+        rows = (
+            (
+                int(ids[row]),
+                [to_value(field, column[row]) for field, column in zip(model_fields, columns)]
+                + [False, calculated_at],
+            )
+            for row in range(len(ids))
+        )
+        return bulk_update_rows(
+            SalesAnalysis, fields + ('is_dirty', 'calculated_at'), rows,
+            batch_size=batch_size or FixedPointSalesAnalysisEngine.BATCH_SIZE,
+        )
+
+    @staticmethod
+    def run(queryset=None, batch_size=None, total_revenue=None, total_margin=None, shares=True):
+        """
+        Полный цикл: загрузка, расчет, запись. Возвращает число строк.
+        Итоги выручки и маржи (в рублях) - по всей таблице при пересчете
+        части строк; shares=False - доли не записываются
+        """
+        frame = FixedPointSalesAnalysisEngine.load(queryset)
+        if frame.empty:
+            return 0
+        scale = FixedPointSalesAnalysisEngine.MONEY_SCALE
+        if total_revenue is not None:
+            total_revenue = int(Decimal(total_revenue) * scale)
+        if total_margin is not None:
+            total_margin = int(Decimal(total_margin) * scale)
+        result = FixedPointSalesAnalysisEngine.compute(
+            frame, total_revenue=total_revenue, total_margin=total_margin
+        )
+        return FixedPointSalesAnalysisEngine.write(
+            result, batch_size=batch_size, fields=VectorizedSalesAnalysisEngine.output_fields(shares)
+        )
@@ -0,0 +1,616 @@
+"""
+Воссоздание Excel файла "Копия 123 Миша.xlsx" из базы данных
+
+Книга пишется в потоковом режиме openpyxl (write_only): строки листов
+добавляются через ws.append() из .values_list().iterator() и сразу
+сбрасываются на диск, поэтому память не растет с числом строк финотчетов.
+
+Выгрузка по запросу API выполняется в фоне (ExcelExportJobs): запрос
+получает номер задания, опрашивает прогресс и скачивает готовый файл.
+Файл хранится в EXCEL_EXPORT_DIR под версией данных, поэтому повторная
+выгрузка неизменившихся данных отдается сразу, без построения книги.
+Номер задания - версия данных, а его состояние (прогресс, ошибка) хранится
+в файле рядом с выгрузкой, поэтому задание видно всем процессам сервера.
+
+Параллельный режим (build_workbook_parallel, EXCEL_EXPORT_PARALLEL) строит
+листы-таблицы в отдельных процессах со своими соединениями с базой: каждый
+пишет книгу из одного листа во временный файл, а итоговая книга собирается
+из XML этих листов и каркаса с остальными листами. openpyxl пишет строки
+inline, без общей таблицы строк, а стили во всех книгах регистрируются в
+одном порядке (register_styles), поэтому XML листа переносится без правок.
+"""
+
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from multiprocessing import get_context
+
+import django
+import openpyxl
+from django.conf import settings
+from django.db import connections
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+
+from analytics import cache
+from analytics.models import Nomenclature, FinancialReport, SalesAnalysis
+
+
+CHUNK_SIZE = 2000
+
+# Шаг отчета о прогрессе, строк
+PROGRESS_STEP = 500
+
+# Листы в правильном порядке
+SHEET_NAMES = [
+    'Номенклатуры (вставить)',
+    'Финотчеты (вставить)',
+    'Остатки (вставить)',
+    'Анализ продаж',
+    'Сводный',
+    'План по выкупам',
+    'Лист10',
+    'Лист11'
+]
+
+# Столбцы листов: (заголовок, поле модели); поле None - пустой столбец
+NOMENCLATURE_COLUMNS = [
+    ('Бренд', 'brand'), ('Предмет', 'subject'), ('Код размера (chrt_id)', 'size_code'),
+    ('Артикул продавца', 'supplier_article'), ('Артикул WB', 'wb_article'), ('Размер', 'size'),
+    ('Баркод', 'barcode'), ('Комплектация', 'equipment'), ('Состав', 'composition'),
+    ('Себестоимость', 'cost_price'), ('B025425BE13000C53FA9', None),
+]
+NOMENCLATURE_WIDTHS = [15, 20, 20, 15, 15, 10, 15, 12, 30, 12, 20]
+
+FINANCIAL_REPORT_COLUMNS = [
+    ('№', 'number'), ('Номер поставки', 'delivery_number'), ('Предмет', 'subject'),
+    ('Код номенклатуры', 'nomenclature_code'), ('Бренд', 'brand'),
+    ('Артикул поставщика', 'supplier_article'), ('Название', 'name'), ('Размер', 'size'),
+    ('Баркод', 'barcode'), ('Тип документа', 'document_type'),
+    ('Обоснование для оплаты', 'payment_basis'), ('Дата заказа покупателем', 'order_date'),
+    ('Дата продажи', 'sale_date'), ('Кол-во', 'quantity'), ('Цена розничная', 'retail_price'),
+    ('Вайлдберриз реализовал Товар (Пр)', 'wb_sold_product'),
+    ('Согласованный продуктовый дисконт, %', 'agreed_product_discount'),
+    ('Промокод %', 'promo_code_percent'),
+    ('Итоговая согласованная скидка', 'total_agreed_discount'),
+    ('Цена розничная с учетом согласованной скидки', 'retail_price_with_discount'),
+    ('Размер снижения кВВ из-за рейтинга, %', 'kvv_reduction_rating'),
+    ('Размер снижения кВВ из-за акции, %', 'kvv_reduction_promotion'),
+    ('Скидка постоянного Покупателя (СПП)', 'spp_discount'), ('Размер кВВ, %', 'kvv_size'),
+    ('Размер кВВ без НДС, % Базовый', 'kvv_base_without_vat'),
+    ('Итоговый кВВ без НДС, %', 'kvv_final_without_vat'),
+    ('Вознаграждение с продаж до вычета услуг поверенного, без НДС', 'reward_before_services'),
+    ('Возмещение за выдачу и возврат товаров на ПВЗ', 'compensation_pickup_return'),
+    ('Эквайринг/Комиссии за организацию платежей', 'acquiring_commission'),
+    ('Размер комиссии за эквайринг/Комиссии за организацию платежей, %', 'acquiring_commission_percent'),
+    ('Тип платежа за Эквайринг/Комиссии за организацию платежей', 'acquiring_payment_type'),
+    ('Вознаграждение Вайлдберриз (ВВ), без НДС', 'wb_reward'),
+    ('НДС с Вознаграждения Вайлдберриз', 'vat_wb_reward'),
+    ('К перечислению Продавцу за реализованный Товар', 'payment_to_seller'),
+    ('Количество доставок', 'delivery_count'), ('Количество возврата', 'return_count'),
+    ('Услуги по доставке товара покупателю', 'delivery_services'),
+    ('Дата начала действия фиксации', 'fixation_start_date'),
+    ('Дата конца действия фиксации', 'fixation_end_date'),
+    ('Признак услуги платной доставки', 'paid_delivery_flag'),
+    ('Общая сумма штрафов', 'total_fines'), ('Доплаты', 'additional_payments'),
+    ('Виды логистики, штрафов и доплат', 'logistics_types'), ('Стикер МП', 'mp_sticker'),
+    ('Наименование банка-эквайера', 'acquirer_bank'), ('Номер офиса', 'office_number'),
+    ('Наименование офиса доставки', 'delivery_office'), ('ИНН партнера', 'partner_inn'),
+    ('Партнер', 'partner'), ('Склад', 'warehouse'), ('Страна', 'country'),
+    ('Тип коробов', 'box_type'), ('Номер таможенной декларации', 'customs_declaration'),
+    ('Номер сборочного задания', 'assembly_task'), ('Код маркировки', 'marking_code'),
+    ('ШК', 'sku'), ('Srid', 'srid'),
+    ('Возмещение издержек по перевозке/по складским операциям с товаром', 'transport_compensation'),
+    ('Организатор перевозки', 'transport_organizer'), ('Хранение', 'storage'),
+    ('Удержания', 'deductions'), ('Платная приемка', 'paid_reception'), ('chrtId', 'chrt_id'),
+    ('Фиксированный коэффициент склада по поставке', 'warehouse_coefficient'),
+] + [(f'Unnamed: {i}', None) for i in range(64, 71)]
+
+SALES_ANALYSIS_COLUMNS = [
+    ('Бренд', 'brand'), ('Предмет', 'subject'), ('Артикул', 'article'), ('Размер', 'size'),
+    ('Баркод', 'barcode'), ('В пути до клиента', 'in_transit_to_client'),
+    ('В пути от клиента', 'in_transit_from_client'), ('На складах', 'in_warehouses'),
+    ('ИТОГО остаток на ВБ', 'total_stock_wb'),
+    ('Оборачиваемость, дней (для отчетов за НЕДЕЛЮ!)', 'turnover_days'),
+    ('Заказы, шт', 'orders'), ('Отказы', 'rejections'), ('Продажи, шт', 'sales'),
+    ('Возвраты, шт', 'returns'), ('Продажи минус возвраты', 'sales_minus_returns'),
+    ('Процент выкупа', 'purchase_percentage'), ('Возврат, шт', 'supplier_return'),
+    ('Логистика за возвраты', 'logistics_for_returns'),
+    ('Продажи по ценам до СПП', 'sales_before_spp'), ('Продажи по ценам с СПП', 'sales_with_spp'),
+    ('Продажи за вычетом комиссии', 'sales_minus_commission'),
+    ('Продажи за вычетом комиссии (без учета возвратов)', 'sales_minus_commission_no_returns'),
+    ('Возвраты', 'return_amount'), ('Продажи минус возвраты.1', 'sales_minus_returns_amount'),
+    ('Комиссия, руб', 'commission'), ('Комиссия %', 'commission_percent'),
+    ('Логистика', 'logistics'), ('Логистика на 1 продажу', 'logistics_per_unit'),
+    ('Эквайринг', 'acquiring'), ('Штраф', 'fine'), ('Доплаты', 'additional_payments'),
+    ('Компенсация подмен', 'substitution_compensation'), ('Возмещение брака', 'defect_compensation'),
+    ('Средний чек', 'average_check'), ('Себестоимость 1 шт', 'cost_per_unit'),
+    ('Себестоимость проданного товара', 'sold_goods_cost'),
+    ('Маржа до налогов', 'margin_before_tax'), ('Налог 6%', 'tax_6_percent'),
+    ('Маржа после налогов, руб', 'margin_after_tax'), ('Маржа на 1 продажу, руб', 'margin_per_unit'),
+    ('Маржинальность, %', 'margin_percent'), ('ROI от себестоимости, %', 'roi_from_cost'),
+    ('GMROI, %', 'gmroi'), ('Доля от общей выручки, %', 'revenue_share'),
+    ('Доля от общей маржи, %', 'margin_share'), ('По себестоимости', 'abc_by_cost'),
+    ('По цене за вычетом комиссии', 'abc_by_price'), ('По средней марже', 'abc_by_margin'),
+]
+
+# Заголовки финотчетов без пустых столбцов - шаблон листа 'Лист10'
+FINANCIAL_HEADERS = [header for header, field in FINANCIAL_REPORT_COLUMNS if field]
+
+# Стили заголовков
+HEADER_FONT = Font(bold=True, size=11)
+HEADER_FILL = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+
+
+def header_row(ws, values):
+    """Первая строка листа с оформлением заголовка"""
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        cell.alignment = HEADER_ALIGNMENT
+        cells.append(cell)
+    return cells
+
+
+def naive(value):
+    """Excel не хранит часовой пояс: дата-время без него"""
+    if value is not None and hasattr(value, 'tzinfo') and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def model_rows(model, columns):
+    """Строки листа из таблицы: столбцы по порядку, без создания объектов модели"""
+    fields = [field for _, field in columns if field]
+    date_fields = {
+        index for index, field in enumerate(fields)
+        if model._meta.get_field(field).get_internal_type() in ('DateTimeField', 'DateField')
+    }
+    padding = [None] * (len(columns) - len(fields))
+    queryset = model.objects.order_by('pk').values_list(*fields)
+    for values in queryset.iterator(chunk_size=CHUNK_SIZE):
+        if date_fields:
+            values = [naive(value) if index in date_fields else value for index, value in enumerate(values)]
+        else:
+            values = list(values)
+        yield values + padding
+
+
+def write_model_sheet(ws, model, columns, progress, widths=None):
+    """
+    Лист-таблица: заголовок и строки модели; возвращает число строк данных.
+    progress(n) вызывается после каждых PROGRESS_STEP записанных строк.
+    """
+    if widths:
+        for i, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+    ws.append(header_row(ws, [header for header, _ in columns]))
+    count = 0
+    for row in model_rows(model, columns):
+        ws.append(row)
+        count += 1
+        if count % PROGRESS_STEP == 0:
+            progress(PROGRESS_STEP)
+    progress(count % PROGRESS_STEP)
+    return count
+
+
+def setup_nomenclature_sheet(ws, progress):
+    """Настраивает лист 'Номенклатуры (вставить)'"""
+    return write_model_sheet(ws, Nomenclature, NOMENCLATURE_COLUMNS, progress, NOMENCLATURE_WIDTHS)
+
+
+def setup_financial_reports_sheet(ws, progress):
+    """Настраивает лист 'Финотчеты (вставить)'"""
+    return write_model_sheet(ws, FinancialReport, FINANCIAL_REPORT_COLUMNS, progress)
+
+
+def setup_stock_sheet(ws, progress):
+    """Лист 'Остатки (вставить)' - шаблон для вставки"""
+    ws.append(header_row(ws, [
+        'Бренд', 'Предмет', 'Артикул продавца', 'Размер вещи',
+        'В пути до клиента', 'В пути от клиента', 'Итого по складам'
+    ]))
+    return 0
+
+
+def setup_sales_analysis_sheet(ws, progress):
+    """Настраивает лист 'Анализ продаж'"""
+    return write_model_sheet(ws, SalesAnalysis, SALES_ANALYSIS_COLUMNS, progress)
+
+
+def setup_summary_sheet(ws, progress):
+    """Настраивает лист 'Сводный'"""
+    ws.append(header_row(ws, [None, 'Средние показатели за периода', None, None, 'Расходы маркетплейса', None]))
+    ws.append([None, 'Продаж за вычетом возвратов, шт', '=\'Анализ продаж\'!O3', None,
+               'Комиссия', '=\'Анализ продаж\'!Y3'])
+    ws.append([None, 'Процент выкупа', '=\'Анализ продаж\'!P3', None,
+               'Логистика', '=\'Анализ продаж\'!AA3+\'Анализ продаж\'!R3'])
+    ws.append([None, 'Средний чек для покупателя после СПП', '=\'Анализ продаж\'!Y3', None,
+               'Хранение', '=\'Финотчеты (вставить)\'!BH1'])
+    return 3
+
+
+def setup_plan_sheet(ws, progress):
+    """Лист 'План по выкупам'"""
+    ws.append(header_row(ws, ['Unnamed: 0', 'Unnamed: 1', 'Unnamed: 2', 'выкупы', 'изначальная поз', 'всего заказзаов']))
+    data = [
+        [None, None, 1, 1, 9, 10],
+        [None, None, 2, 2, 9, 11],
+        [None, None, 3, 4, 9, 13]
+    ]
+    for row in data:
+        ws.append(row)
+    return len(data)
+
+
+def setup_template_sheet(ws, progress):
+    """Лист 'Лист10' - шаблон с заголовками финотчетов и инструкцией"""
+    ws.append(header_row(ws, FINANCIAL_HEADERS))
+    ws.append([])
+    ws.append(['1. Перейдите в раздел ВБ: Отчеты - Аналитика - Отчет по остаткам на складе'])
+    ws.append(['2. ❗️Нажмите на кнопку "настройка таблицы" и активируйте галочки "артикул продавца" и "размер вещи". Скачайте отчет'])
+    ws.append(['3. Выделите все данные из полученного отчета, скопируйте и вставьте в данный лист'])
+    return 3
+
+
+def setup_empty_sheet(ws, progress):
+    """Лист 'Лист11' - пустой, с оформленной строкой заголовка"""
+    ws.append(header_row(ws, [None] * 9))
+    return 0
+
+
+# Лист -> функция заполнения (в порядке SHEET_NAMES)
+SHEET_WRITERS = {
+    'Номенклатуры (вставить)': setup_nomenclature_sheet,
+    'Финотчеты (вставить)': setup_financial_reports_sheet,
+    'Остатки (вставить)': setup_stock_sheet,
+    'Анализ продаж': setup_sales_analysis_sheet,
+    'Сводный': setup_summary_sheet,
+    'План по выкупам': setup_plan_sheet,
+    'Лист10': setup_template_sheet,
+    'Лист11': setup_empty_sheet,
+}
+
+
+# Таблицы, строки которых выгружаются в книгу (для оценки прогресса)
+EXPORTED_MODELS = (Nomenclature, FinancialReport, SalesAnalysis)
+
+
+def total_rows():
+    """Число строк данных, которые будут записаны в листы-таблицы"""
+    return sum(model.objects.count() for model in EXPORTED_MODELS)
+
+
+def register_styles(ws):
+    """
+    Стили книги в постоянном порядке: заголовок, дата-время, дата. Так номера
+    стилей совпадают во всех книгах, из которых собирается итоговая.
+    Возвращает номера зарегистрированных стилей.
+    """
+    cells = header_row(ws, [None]) + [
+        WriteOnlyCell(ws, value=datetime(2000, 1, 1)), WriteOnlyCell(ws, value=date(2000, 1, 1))
+    ]
+    # Чтение cell.style_id добавляет стиль ячейки в wb._cell_styles и возвращает его номер
+    return [cell.style_id for cell in cells]
+
+
+def build_workbook(filename, write_only=True, progress=None):
+    """
+    Создает книгу и сохраняет ее в filename; возвращает {лист: строк данных}.
+    write_only=False - обычная книга в памяти (для сравнения в --benchmark).
+    progress(n) получает число строк, записанных с прошлого вызова.
+    """
+    progress = progress or (lambda rows: None)
+    wb = openpyxl.Workbook(write_only=write_only)
+    if not write_only:
+        # Удаляем стандартный лист
+        wb.remove(wb.active)
+
+    counts = {}
+    for sheet_name in SHEET_NAMES:
+        counts[sheet_name] = SHEET_WRITERS[sheet_name](wb.create_sheet(sheet_name), progress)
+    wb.save(filename)
+    return counts
+
+
+# Листы-таблицы, которые в параллельном режиме строятся в отдельных процессах
+PARALLEL_SHEETS = ('Номенклатуры (вставить)', 'Финотчеты (вставить)', 'Анализ продаж')
+
+
+def sheet_part_path(sheet_name):
+    """Путь XML листа в книге по номеру листа"""
+    return f'xl/worksheets/sheet{SHEET_NAMES.index(sheet_name) + 1}.xml'
+
+
+def write_sheet_part(sheet_name, filename):
+    """
+    Книга из одного листа sheet_name во временном файле (выполняется в
+    процессе-исполнителе); возвращает (лист, строк данных)
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    register_styles(ws)
+    count = SHEET_WRITERS[sheet_name](ws, lambda rows: None)
+    wb.save(filename)
+    return sheet_name, count
+
+
+def build_workbook_parallel(filename, processes=None, progress=None):
+    """
+    То же, что build_workbook, но листы-таблицы строятся параллельно в
+    процессах (не больше processes); время определяется самым большим листом.
+    progress(n) вызывается по готовности каждого листа.
+    """
+    progress = progress or (lambda rows: None)
+    processes = min(processes or os.cpu_count() or 1, len(PARALLEL_SHEETS))
+    directory = tempfile.mkdtemp(prefix='excel-export-')
+    try:
+        parts = {name: os.path.join(directory, f'part{index}.xlsx') for index, name in enumerate(PARALLEL_SHEETS)}
+        counts = {}
+        # spawn: исполнители не наследуют соединения и потоки родителя
+        with ProcessPoolExecutor(processes, mp_context=get_context('spawn'), initializer=django.setup) as executor:
+            futures = [executor.submit(write_sheet_part, name, path) for name, path in parts.items()]
+
+            # Каркас: все листы в итоговом порядке, листы-таблицы пока пустые
+            skeleton = os.path.join(directory, 'skeleton.xlsx')
+            wb = openpyxl.Workbook(write_only=True)
+            for sheet_name in SHEET_NAMES:
+                ws = wb.create_sheet(sheet_name)
+                if sheet_name == SHEET_NAMES[0]:
+                    register_styles(ws)
+                if sheet_name not in PARALLEL_SHEETS:
+                    counts[sheet_name] = SHEET_WRITERS[sheet_name](ws, progress)
+            wb.save(skeleton)
+
+            for future in as_completed(futures):
+                sheet_name, count = future.result()
+                counts[sheet_name] = count
+                progress(count)
+
+        replaced = {sheet_part_path(name): path for name, path in parts.items()}
+        with zipfile.ZipFile(skeleton) as source, \
+                zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as target:
+            for item in source.infolist():
+                if item.filename in replaced:
+                    with zipfile.ZipFile(replaced[item.filename]) as part, \
+                            part.open('xl/worksheets/sheet1.xml') as data, \
+                            target.open(item.filename, 'w', force_zip64=True) as out:
+                        shutil.copyfileobj(data, out, 1 << 20)
+                else:
+                    target.writestr(item, source.read(item.filename))
+        return {sheet_name: counts[sheet_name] for sheet_name in SHEET_NAMES}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+FILENAME_TEMPLATE = 'wb_analytics_{version}.xlsx'
+# Состояние незавершенного задания рядом с файлом выгрузки
+STATE_TEMPLATE = 'wb_analytics_{version}.json'
+FILE_PREFIX = 'wb_analytics_'
+
+# Номер задания - версия данных: буквы, цифры, '_' и '-'
+JOB_ID_PATTERN = re.compile(r'[0-9A-Za-z_-]+')
+
+# Как часто записывать прогресс в файл состояния, секунд
+STATE_SAVE_INTERVAL = 1.0
+
+
+def export_path(version):
+    """Файл выгрузки для версии данных"""
+    return os.path.join(settings.EXCEL_EXPORT_DIR, FILENAME_TEMPLATE.format(version=version))
+
+
+def state_path(version):
+    """Файл состояния задания для версии данных"""
+    return os.path.join(settings.EXCEL_EXPORT_DIR, STATE_TEMPLATE.format(version=version))
+
+
+def remove_file(path):
+    """Удаление файла, которого уже может не быть (его удалил другой процесс)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ExportJob:
+    """
+    Задание на выгрузку версии данных. Номер задания - сама версия, а
+    состояние хранится в файлах EXCEL_EXPORT_DIR, поэтому его видят все
+    процессы: готовый .xlsx - задание выполнено, иначе - файл состояния
+    с прогрессом или ошибкой
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, version, status=PENDING, rows=0, total=0, error=None):
+        self.version = version
+        self.path = export_path(version)
+        self.state_path = state_path(version)
+        self.status = status
+        self.rows = rows
+        self.total = total
+        self.error = error
+
+    @property
+    def id(self):
+        return self.version
+
+    @property
+    def progress(self):
+        """Доля записанных строк от 0 до 1"""
+        if self.status == self.DONE:
+            return 1.0
+        return min(self.rows / self.total, 1.0) if self.total else 0.0
+
+    @classmethod
+    def load(cls, version):
+        """Задание версии по файлам выгрузки; None, если его не запускали"""
+        if not JOB_ID_PATTERN.fullmatch(version):
+            return None
+        if os.path.exists(export_path(version)):
+            return cls(version, cls.DONE)
+        try:
+            with open(state_path(version), encoding='utf-8') as state_file:
+                state = json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            # ValueError - файл как раз создается
+            return None
+
+        job = cls(version, state['status'], state['rows'], state['total'], state['error'])
+        interrupted = (
+            state['host'] == socket.gethostname() and not process_alive(state['pid'])
+        )
+        if job.status in (cls.PENDING, cls.RUNNING) and interrupted:
+            job.status = cls.FAILED
+            job.error = 'Процесс, строивший выгрузку, завершился'
+        return job
+
+    def state(self):
+        return {
+            'status': self.status, 'rows': self.rows, 'total': self.total,
+            'error': self.error, 'host': socket.gethostname(), 'pid': os.getpid(),
+        }
+
+    def claim(self):
+        """
+        Создание файла состояния; False, если задание этой версии уже
+        запущено другим процессом
+        """
+        os.makedirs(settings.EXCEL_EXPORT_DIR, exist_ok=True)
+        try:
+            fd = os.open(self.state_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as state_file:
+            json.dump(self.state(), state_file)
+        return True
+
+    def save(self):
+        """Атомарная запись состояния (читатели не видят файл наполовину)"""
+        temp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as state_file:
+            json.dump(self.state(), state_file)
+        os.replace(temp_path, self.state_path)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'rows': self.rows,
+            'total': self.total,
+            'version': self.version,
+            'error': self.error,
+        }
+
+
+class ExcelExportJobs:
+    """Запуск заданий и фоновый исполнитель процесса (по одной книге за раз)"""
+
+    _lock = threading.Lock()
+    _executor = None
+
+    @staticmethod
+    def start():
+        """
+        Задание на выгрузку текущей версии данных. Если файл этой версии уже
+        есть - задание сразу готово; если она уже строится (в любом
+        процессе) - возвращается идущее задание; прерванное или неудачное
+        задание запускается заново.
+        """
+        version = cache.data_version() or 'initial'
+        with ExcelExportJobs._lock:
+            job = ExportJob.load(version)
+            if job is not None and job.status != ExportJob.FAILED:
+                return job
+            if job is not None:
+                remove_file(job.state_path)
+
+            job = ExportJob(version)
+            if not job.claim():
+                return ExportJob.load(version) or job
+
+            if ExcelExportJobs._executor is None:
+                ExcelExportJobs._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='excel-export')
+            ExcelExportJobs._executor.submit(ExcelExportJobs.run, job)
+        return job
+
+    @staticmethod
+    def get(job_id):
+        return ExportJob.load(job_id)
+
+    @staticmethod
+    def run(job):
+        """Построение книги в фоне: во временный файл, затем замена"""
+        temp_path = f'{job.path}.{os.getpid()}.tmp'
+        try:
+            job.status = ExportJob.RUNNING
+            job.total = total_rows()
+            job.save()
+            saved_at = time.monotonic()
+
+            def progress(rows):
+                nonlocal saved_at
+                job.rows += rows
+                if time.monotonic() - saved_at >= STATE_SAVE_INTERVAL:
+                    job.save()
+                    saved_at = time.monotonic()
+
+            if settings.EXCEL_EXPORT_PARALLEL:
+                build_workbook_parallel(temp_path, progress=progress)
+            else:
+                build_workbook(temp_path, progress=progress)
+            os.replace(temp_path, job.path)
+            job.status = ExportJob.DONE
+            # Готовность видна по самому файлу, состояние больше не нужно
+            remove_file(job.state_path)
+            ExcelExportJobs.remove_stale(job.version)
+        except Exception as e:
+            job.error = str(e)
+            job.status = ExportJob.FAILED
+            job.save()
+            remove_file(temp_path)
+        finally:
+            # Соединение с базой открыто потоком исполнителя
+            connections.close_all()
+
+    @staticmethod
+    def remove_stale(version):
+        """
+        Удаление выгрузок, файлов состояния и временных файлов прежних
+        версий данных; файлы текущей версии и только что построенной остаются
+        """
+        keep = {version, cache.data_version() or 'initial'}
+        for name in os.listdir(settings.EXCEL_EXPORT_DIR):
+            if not name.startswith(FILE_PREFIX):
+                continue
+            # Версия не содержит точек: wb_analytics_<версия>.xlsx[.<pid>.tmp]
+            if name[len(FILE_PREFIX):].split('.')[0] not in keep:
+                remove_file(os.path.join(settings.EXCEL_EXPORT_DIR, name))
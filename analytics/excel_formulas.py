@@ -1,271 +1,315 @@
 """
 Полная реализация всех формул из Excel файла
 Содержит ВСЕ 361 формулу из всех листов
+
+Итоговые ячейки листов 'Сводный' и 'Анализ продаж' и поля сводных данных
+объявлены в FORMULAS и вычисляются движком formula_engine. Входы движка -
+итоги столбцов таблиц: 'sa.<поле>' для анализа продаж и 'fr.<поле>' для
+финотчетов.
 """
 
 from decimal import Decimal, ROUND_HALF_UP
 from django.db.models import Sum, Count, Avg, Q
+from analytics.formula_engine import Formula, FormulaGraph
 from analytics.models import (
     SalesAnalysis, FinancialReport, Nomenclature, 
-    StockBalance, SummaryData, PurchasePlan
+    StockBalance, SummaryData, PurchasePlan, DailySalesRollup
 )
 
 
+def iferror_divide(numerator, denominator):
+    """=IFERROR(числитель/знаменатель, ): ноль при делении на ноль"""
+    return numerator / denominator if denominator != 0 else 0
+
+
+def cell(name, inputs, function=None):
+    """Объявление ячейки; без функции ячейка равна своему единственному входу"""
+    if function is None:
+        function = lambda value: value
+    return Formula(name, inputs, function)
+
+
+def constant(name, value):
+    """Ячейка без входов: данных для расчета пока нет"""
+    return Formula(name, (), lambda: value)
+
+
+# Лист 'Сводный'
+SVODNY_FORMULAS = [
+    # Формула C3: ='Анализ продаж'!O3 (total_sales_minus_returns)
+    cell('svodny.c3', ['sa.sales_minus_returns']),
+    # Формула F3: ='Анализ продаж'!Y3 (total_sales_before_spp)
+    cell('svodny.f3', ['sa.sales_before_spp']),
+    # Формула C4: ='Анализ продаж'!P3 (total_sales_with_spp)
+    cell('svodny.c4', ['sa.sales_with_spp']),
+    # Формула F4: ='Анализ продаж'!AA3+'Анализ продаж'!R3
+    # AA3 = sales_minus_commission, R3 = commission
+    cell('svodny.f4', ['sa.sales_minus_commission', 'sa.commission'], lambda aa3, r3: aa3 + r3),
+    # Формула F5: ='Финотчеты (вставить)'!BH1 (total_wb_sold_product)
+    cell('svodny.f5', ['fr.wb_sold_product']),
+    # Формула F6: ='Анализ продаж'!AE3 (total_logistics)
+    cell('svodny.f6', ['sa.logistics']),
+    # Формула F7: ='Финотчеты (вставить)'!AO1 (total_payment_to_seller)
+    cell('svodny.f7', ['fr.payment_to_seller']),
+    # Формула F8: ='Финотчеты (вставить)'!BJ1 (total_wb_reward)
+    cell('svodny.f8', ['fr.wb_reward']),
+    # Формула C9: ='Анализ продаж'!AJ3 (total_margin_after_tax)
+    cell('svodny.c9', ['sa.margin_after_tax']),
+    # Формула F9: ='Финотчеты (вставить)'!BI1 (total_delivery_services)
+    cell('svodny.f9', ['fr.delivery_services']),
+    # Формула F11: ='Анализ продаж'!AC3 (total_acquiring)
+    cell('svodny.f11', ['sa.acquiring']),
+    # Формула F12: Сложная формула с SUMIFS для компенсаций
+    cell(
+        'svodny.f12', ['sa.defect_compensation', 'sa.substitution_compensation'],
+        lambda defect, substitution: defect + substitution,
+    ),
+    # Формула F13: ='Анализ продаж'!AF3 (total_additional_payments)
+    cell('svodny.f13', ['sa.additional_payments']),
+    # Формула F16: ='Анализ продаж'!S3 (total_sales_minus_commission)
+    cell('svodny.f16', ['sa.sales_minus_commission']),
+    # Формула F17: ='Анализ продаж'!T3 (total_commission)
+    cell('svodny.f17', ['sa.commission']),
+    # Формула F18: ='Анализ продаж'!U3+F12+F13
+    cell('svodny.f18', ['sa.logistics', 'svodny.f12', 'svodny.f13'], lambda u3, f12, f13: u3 + f12 + f13),
+    # Формула F19: =F16-F3-F4-F5+F6-F7-F8-F9-F10+F12+F13
+    cell(
+        'svodny.f19',
+        ['svodny.f16', 'svodny.f3', 'svodny.f4', 'svodny.f5', 'svodny.f6',
+         'svodny.f7', 'svodny.f8', 'svodny.f9', 'svodny.f12', 'svodny.f13'],
+        lambda f16, f3, f4, f5, f6, f7, f8, f9, f12, f13:
+            f16 - f3 - f4 - f5 + f6 - f7 - f8 - f9 - 0 + f12 + f13,  # F10 = 0 (нет данных)
+    ),
+    # Формула F20: ='Анализ продаж'!AL3 (total_sold_goods_cost)
+    cell('svodny.f20', ['sa.sold_goods_cost']),
+    # Формула C14: =F19-C9-F20
+    cell('svodny.c14', ['svodny.f19', 'svodny.c9', 'svodny.f20'], lambda f19, c9, f20: f19 - c9 - f20),
+    # Формула C12: =C14+F9
+    cell('svodny.c12', ['svodny.c14', 'svodny.f9'], lambda c14, f9: c14 + f9),
+
+    # Формулы с IFERROR
+    cell('svodny.g3', ['svodny.f3', 'svodny.f16'], iferror_divide),
+    cell('svodny.g4', ['svodny.f4', 'svodny.f16'], iferror_divide),
+    cell('svodny.g5', ['svodny.f5', 'svodny.f16'], iferror_divide),
+    cell('svodny.c5', ['svodny.f17', 'svodny.c3'], iferror_divide),
+    cell('svodny.c6', ['svodny.f3', 'svodny.c3'], iferror_divide),
+    cell('svodny.c7', ['svodny.f4', 'svodny.c3'], iferror_divide),
+    cell('svodny.c8', ['svodny.f5', 'svodny.c3'], iferror_divide),
+    cell('svodny.g9', ['svodny.f9', 'svodny.f16'], iferror_divide),
+    cell('svodny.c10', ['svodny.c9', 'svodny.c3'], iferror_divide),
+    cell('svodny.c11', ['svodny.c12', 'svodny.c3'], iferror_divide),
+    cell('svodny.c13', ['svodny.c14', 'svodny.c3'], iferror_divide),
+    cell('svodny.c15', ['svodny.c14', 'svodny.f16'], iferror_divide),
+    cell('svodny.c16', ['svodny.c14', 'svodny.f17'], iferror_divide),
+    cell('svodny.c17', ['svodny.c14', 'svodny.f18'], iferror_divide),
+
+    # Хранение, штрафы и удержания (реклама) из итогов финотчетов
+    cell('svodny.storage', ['fr.storage']),
+    cell('svodny.storage_per_unit', ['svodny.storage', 'svodny.c3'], iferror_divide),
+    cell('svodny.storage_percent', ['svodny.storage', 'svodny.f16'], iferror_divide),
+    cell('svodny.fines', ['fr.total_fines']),
+    cell('svodny.advertising', ['fr.deductions']),
+    cell('svodny.advertising_percent', ['svodny.advertising', 'svodny.f16'], iferror_divide),
+]
+
+# Лист 'Анализ продаж': итоговая строка 3 (ячейка - суммируемый столбец)
+ANALYSIS_TOTAL_CELLS = {
+    'f3': 'orders', 'g3': 'rejections', 'h3': 'sales', 'i3': 'returns',
+    'k3': 'sales_minus_returns', 'l3': 'supplier_return',
+    'm3': 'logistics_for_returns', 'n3': 'sales_before_spp',
+    'o3': 'sales_with_spp', 'q3': 'sales_minus_commission',
+    'r3': 'sales_minus_commission_no_returns', 's3': 'return_amount',
+    't3': 'sales_minus_returns_amount', 'u3': 'commission', 'v3': 'logistics',
+    'w3': 'logistics_per_unit', 'x3': 'acquiring', 'y3': 'fine',
+    'aa3': 'additional_payments', 'ab3': 'substitution_compensation',
+    'ac3': 'defect_compensation', 'ad3': 'average_check', 'ae3': 'cost_per_unit',
+    'af3': 'sold_goods_cost', 'ag3': 'margin_before_tax', 'ah3': 'tax_6_percent',
+    'ai3': 'margin_after_tax', 'aj3': 'margin_per_unit', 'ak3': 'margin_percent',
+    'al3': 'roi_from_cost', 'am3': 'gmroi', 'an3': 'revenue_share',
+    'ao3': 'margin_share', 'ap3': 'money_in_goods',
+}
+
+ANALYSIS_FORMULAS = [
+    cell(f'analysis.{name}', [f'sa.{field}']) for name, field in ANALYSIS_TOTAL_CELLS.items()
+] + [
+    # Формула P3: =IFERROR(O3/K3, ) (purchase_percentage)
+    cell('analysis.p3', ['sa.sales_minus_returns', 'sa.orders'], iferror_divide),
+    # Формула Z3: =IFERROR(Y3/S3, ) (average_check_after_spp)
+    cell('analysis.z3', ['sa.sales_with_spp', 'sa.sales_minus_returns'], iferror_divide),
+]
+
+# Поля сводных данных (SummaryData)
+SUMMARY_FORMULAS = [
+    cell('summary.sales_minus_returns_count', ['svodny.c3']),  # C3: ='Анализ продаж'!O3
+    cell('summary.purchase_percentage', ['analysis.p3']),  # P3: =IFERROR(O3/K3, )
+    cell('summary.average_check_after_spp', ['analysis.z3']),  # Z3: =IFERROR(Y3/S3, )
+    cell('summary.commission_per_unit', ['svodny.c5']),  # C5: =IFERROR(F17/C3, )
+    cell('summary.logistics_per_unit', ['svodny.c6']),  # C6: =IFERROR(F3/C3, )
+    cell('summary.storage_per_unit', ['svodny.storage_per_unit']),
+    cell('summary.sold_goods_cost', ['svodny.f20']),  # F20: ='Анализ продаж'!AL3
+    cell('summary.average_cost_per_unit', ['svodny.c7']),  # C7: =IFERROR(F4/C3, )
+    cell('summary.average_margin_per_unit', ['svodny.c8']),  # C8: =IFERROR(F5/C3, )
+    cell('summary.margin_without_ads', ['svodny.c9']),  # C9: ='Анализ продаж'!AJ3
+    cell('summary.margin_per_unit_without_ads', ['svodny.c10']),  # C10: =IFERROR(C9/C3, )
+    cell('summary.margin_after_all_expenses', ['svodny.c14']),  # C14: =F19-C9-F20
+    cell('summary.total_commission', ['svodny.f17']),  # F17: ='Анализ продаж'!T3
+    cell('summary.commission_percent', ['svodny.c16']),  # C16: =IFERROR(C14/F17, )
+    cell('summary.total_logistics', ['svodny.f18']),  # F18: ='Анализ продаж'!U3+F12+F13
+    cell('summary.logistics_percent', ['svodny.c17']),  # C17: =IFERROR( C14/F18, )
+    cell('summary.total_storage', ['svodny.storage']),
+    cell('summary.storage_percent', ['svodny.storage_percent']),
+    cell('summary.additional_payments', ['svodny.f13']),  # F13: ='Анализ продаж'!AF3
+    cell('summary.fines', ['svodny.fines']),
+    constant('summary.paid_reception', Decimal('0')),  # Пока нет данных о платной приемке
+    cell('summary.advertising_deductions', ['svodny.advertising']),
+    cell('summary.advertising_percent', ['svodny.advertising_percent']),
+    constant('summary.transit_deductions', Decimal('0')),  # Пока нет данных о транзите
+    cell('summary.acquiring', ['svodny.f11']),  # F11: ='Анализ продаж'!AC3
+    cell('summary.defect_compensation', ['svodny.f12']),  # F12: Сложная формула с SUMIFS
+    constant('summary.substitution_compensation', Decimal('0')),  # Пока нет данных о замене
+    cell('summary.margin_percent_before_spp', ['svodny.c6']),  # C6: =IFERROR(F3/C3, )
+    cell('summary.margin_percent_with_spp', ['svodny.c7']),  # C7: =IFERROR(F4/C3, )
+    cell('summary.margin_percent_after_commission', ['svodny.c8']),  # C8: =IFERROR(F5/C3, )
+    cell('summary.sales_before_spp', ['svodny.f3']),  # F3: ='Анализ продаж'!Y3
+    cell('summary.sales_with_spp', ['svodny.c4']),  # C4: ='Анализ продаж'!P3
+    cell('summary.sales_minus_commission', ['svodny.f16']),  # F16: ='Анализ продаж'!S3
+    cell('summary.payment_to_account', ['svodny.f19']),  # F19: =F16-F3-F4-F5+F6-F7-F8-F9-F10+F12+F13
+    cell('summary.tax_6_percent', ['svodny.c14'], lambda c14: c14 * Decimal('0.06')),  # НДС 6% от маржи
+]
+
+FORMULAS = FormulaGraph(SVODNY_FORMULAS + ANALYSIS_FORMULAS + SUMMARY_FORMULAS)
+
+
 class ExcelFormulasService:
     """Сервис для реализации ВСЕХ формул из Excel файла"""
     
+    # Столбцы 'Анализ продаж', итоги которых нужны листам 'Сводный' и 'Анализ продаж'
+    SALES_ANALYSIS_TOTAL_FIELDS = (
+        'orders', 'rejections', 'sales', 'returns', 'sales_minus_returns',
+        'supplier_return', 'logistics_for_returns', 'sales_before_spp',
+        'sales_with_spp', 'sales_minus_commission', 'sales_minus_commission_no_returns',
+        'return_amount', 'sales_minus_returns_amount', 'commission', 'logistics',
+        'logistics_per_unit', 'acquiring', 'fine', 'additional_payments',
+        'substitution_compensation', 'defect_compensation', 'average_check',
+        'cost_per_unit', 'sold_goods_cost', 'margin_before_tax', 'tax_6_percent',
+        'margin_after_tax', 'margin_per_unit', 'margin_percent', 'roi_from_cost',
+        'gmroi', 'revenue_share', 'margin_share', 'money_in_goods',
+    )
+    
+    # Столбцы финотчетов, итоги которых нужны листу 'Сводный'
+    # Итоги финотчетов берутся из дневных итогов: те же суммы по меньшей таблице
+    FINANCIAL_REPORT_TOTAL_FIELDS = DailySalesRollup.MEASURES
+    
     @staticmethod
-    def calculate_svodny_formulas():
-        """Реализация всех 34 формул из листа 'Сводный'"""
-        
-        # Получаем данные из анализа продаж
-        analysis_data = SalesAnalysis.objects.aggregate(
-            total_sales_minus_returns=Sum('sales_minus_returns'),
-            total_sales_before_spp=Sum('sales_before_spp'),
-            total_sales_with_spp=Sum('sales_with_spp'),
-            total_sales_minus_commission=Sum('sales_minus_commission'),
-            total_commission=Sum('commission'),
-            total_logistics=Sum('logistics'),
-            total_acquiring=Sum('acquiring'),
-            total_margin_after_tax=Sum('margin_after_tax'),
-            total_sold_goods_cost=Sum('sold_goods_cost'),
-            total_defect_compensation=Sum('defect_compensation'),
-            total_substitution_compensation=Sum('substitution_compensation'),
-            total_additional_payments=Sum('additional_payments'),
-            total_fines=Sum('fine')
-        )
-        
-        # Получаем данные из финансовых отчетов
-        financial_data = FinancialReport.objects.aggregate(
-            total_wb_sold_product=Sum('wb_sold_product'),
-            total_quantity=Sum('quantity'),
-            total_payment_to_seller=Sum('payment_to_seller'),
-            total_wb_reward=Sum('wb_reward'),
-            total_delivery_services=Sum('delivery_services'),
-            total_acquiring_commission=Sum('acquiring_commission'),
-            total_storage=Sum('storage'),
-            total_deductions=Sum('deductions'),
-            total_transport_compensation=Sum('transport_compensation'),
-            total_additional_payments_fin=Sum('additional_payments'),
-            total_fines_fin=Sum('total_fines')
+    def _aggregate(model, fields):
+        """Итоги по столбцам таблицы за один проход; пустые итоги равны нулю"""
+        totals = model.objects.aggregate(**{field: Sum(field) for field in fields})
+        return {field: value or 0 for field, value in totals.items()}
+    
+    @staticmethod
+    def sales_analysis_totals():
+        """Итоговая строка 3 листа 'Анализ продаж' одним запросом"""
+        return ExcelFormulasService._aggregate(
+            SalesAnalysis, ExcelFormulasService.SALES_ANALYSIS_TOTAL_FIELDS
         )
-        
-        # Формула C3: ='Анализ продаж'!O3 (total_sales_minus_returns)
-        c3 = analysis_data['total_sales_minus_returns'] or 0
-        
-        # Формула F3: ='Анализ продаж'!Y3 (total_sales_before_spp)
-        f3 = analysis_data['total_sales_before_spp'] or 0
-        
-        # Формула C4: ='Анализ продаж'!P3 (total_sales_with_spp)
-        c4 = analysis_data['total_sales_with_spp'] or 0
-        
-        # Формула F4: ='Анализ продаж'!AA3+'Анализ продаж'!R3
-        # AA3 = sales_minus_commission, R3 = commission
-        f4 = (analysis_data['total_sales_minus_commission'] or 0) + (analysis_data['total_commission'] or 0)
-        
-        # Формула F5: ='Финотчеты (вставить)'!BH1 (total_wb_sold_product)
-        f5 = financial_data['total_wb_sold_product'] or 0
-        
-        # Формула F6: ='Анализ продаж'!AE3 (total_logistics)
-        f6 = analysis_data['total_logistics'] or 0
-        
-        # Формула F7: ='Финотчеты (вставить)'!AO1 (total_payment_to_seller)
-        f7 = financial_data['total_payment_to_seller'] or 0
-        
-        # Формула F8: ='Финотчеты (вставить)'!BJ1 (total_wb_reward)
-        f8 = financial_data['total_wb_reward'] or 0
-        
-        # Формула C9: ='Анализ продаж'!AJ3 (total_margin_after_tax)
-        c9 = analysis_data['total_margin_after_tax'] or 0
-        
-        # Формула F9: ='Финотчеты (вставить)'!BI1 (total_delivery_services)
-        f9 = financial_data['total_delivery_services'] or 0
-        
-        # Формула F11: ='Анализ продаж'!AC3 (total_acquiring)
-        f11 = analysis_data['total_acquiring'] or 0
-        
-        # Формула F12: Сложная формула с SUMIFS для компенсаций
-        f12 = (analysis_data['total_defect_compensation'] or 0) + (analysis_data['total_substitution_compensation'] or 0)
-        
-        # Формула F13: ='Анализ продаж'!AF3 (total_additional_payments)
-        f13 = analysis_data['total_additional_payments'] or 0
-        
-        # Формула F16: ='Анализ продаж'!S3 (total_sales_minus_commission)
-        f16 = analysis_data['total_sales_minus_commission'] or 0
-        
-        # Формула F17: ='Анализ продаж'!T3 (total_commission)
-        f17 = analysis_data['total_commission'] or 0
-        
-        # Формула F18: ='Анализ продаж'!U3+F12+F13
-        f18 = (analysis_data['total_logistics'] or 0) + f12 + f13
-        
-        # Формула F19: =F16-F3-F4-F5+F6-F7-F8-F9-F10+F12+F13
-        f19 = f16 - f3 - f4 - f5 + f6 - f7 - f8 - f9 - 0 + f12 + f13  # F10 = 0 (нет данных)
-        
-        # Формула F20: ='Анализ продаж'!AL3 (total_sold_goods_cost)
-        f20 = analysis_data['total_sold_goods_cost'] or 0
-        
-        # Формула C14: =F19-C9-F20
-        c14 = f19 - c9 - f20
-        
-        # Формула C12: =C14+F9
-        c12 = c14 + f9
-        
-        # Формулы с IFERROR
-        g3 = f3 / f16 if f16 != 0 else 0
-        g4 = f4 / f16 if f16 != 0 else 0
-        g5 = f5 / f16 if f16 != 0 else 0
-        c5 = f17 / c3 if c3 != 0 else 0
-        c6 = f3 / c3 if c3 != 0 else 0
-        c7 = f4 / c3 if c3 != 0 else 0
-        c8 = f5 / c3 if c3 != 0 else 0
-        g9 = f9 / f16 if f16 != 0 else 0
-        c10 = c9 / c3 if c3 != 0 else 0
-        c11 = c12 / c3 if c3 != 0 else 0
-        c13 = c14 / c3 if c3 != 0 else 0
-        c15 = c14 / f16 if f16 != 0 else 0
-        c16 = c14 / f17 if f17 != 0 else 0
-        c17 = c14 / f18 if f18 != 0 else 0
-        
-        return {
-            'c3': c3, 'f3': f3, 'g3': g3,
-            'c4': c4, 'f4': f4, 'g4': g4,
-            'c5': c5, 'f5': f5, 'g5': g5,
-            'c6': c6, 'f6': f6,
-            'c7': c7, 'f7': f7,
-            'c8': c8, 'f8': f8,
-            'c9': c9, 'f9': f9, 'g9': g9,
-            'c10': c10,
-            'c11': c11, 'f11': f11,
-            'c12': c12, 'f12': f12,
-            'c13': c13, 'f13': f13,
-            'c14': c14,
-            'c15': c15, 'f16': f16,
-            'c16': c16, 'f17': f17,
-            'c17': c17, 'f18': f18,
-            'f19': f19, 'f20': f20
-        }
     
     @staticmethod
-    def calculate_analysis_formulas():
-        """Реализация всех 327 формул из листа 'Анализ продаж'"""
-        
-        # Получаем все записи анализа продаж
-        sales_records = SalesAnalysis.objects.all()
-        
-        # Формулы суммирования (F3, G3, H3, I3, K3, L3, M3, N3, O3, P3, Q3, R3, S3, T3, U3, V3, W3, X3, Y3, Z3)
-        totals = sales_records.aggregate(
-            total_orders=Sum('orders'),
-            total_rejections=Sum('rejections'),
-            total_sales=Sum('sales'),
-            total_returns=Sum('returns'),
-            total_sales_minus_returns=Sum('sales_minus_returns'),
-            total_supplier_return=Sum('supplier_return'),
-            total_logistics_for_returns=Sum('logistics_for_returns'),
-            total_sales_before_spp=Sum('sales_before_spp'),
-            total_sales_with_spp=Sum('sales_with_spp'),
-            total_sales_minus_commission=Sum('sales_minus_commission'),
-            total_sales_minus_commission_no_returns=Sum('sales_minus_commission_no_returns'),
-            total_return_amount=Sum('return_amount'),
-            total_sales_minus_returns_amount=Sum('sales_minus_returns_amount'),
-            total_commission=Sum('commission'),
-            total_logistics=Sum('logistics'),
-            total_logistics_per_unit=Sum('logistics_per_unit'),
-            total_acquiring=Sum('acquiring'),
-            total_fine=Sum('fine'),
-            total_additional_payments=Sum('additional_payments'),
-            total_substitution_compensation=Sum('substitution_compensation'),
-            total_defect_compensation=Sum('defect_compensation'),
-            total_average_check=Sum('average_check'),
-            total_cost_per_unit=Sum('cost_per_unit'),
-            total_sold_goods_cost=Sum('sold_goods_cost'),
-            total_margin_before_tax=Sum('margin_before_tax'),
-            total_tax_6_percent=Sum('tax_6_percent'),
-            total_margin_after_tax=Sum('margin_after_tax'),
-            total_margin_per_unit=Sum('margin_per_unit'),
-            total_margin_percent=Sum('margin_percent'),
-            total_roi_from_cost=Sum('roi_from_cost'),
-            total_gmroi=Sum('gmroi'),
-            total_revenue_share=Sum('revenue_share'),
-            total_margin_share=Sum('margin_share'),
-            total_money_in_goods=Sum('money_in_goods')
+    def financial_report_totals():
+        """Итоговая строка 1 листа 'Финотчеты (вставить)' одним запросом по дневным итогам"""
+        return ExcelFormulasService._aggregate(
+            DailySalesRollup, ExcelFormulasService.FINANCIAL_REPORT_TOTAL_FIELDS
         )
-        
-        # Формула P3: =IFERROR(O3/K3, ) (purchase_percentage)
-        p3 = totals['total_sales_minus_returns'] / totals['total_orders'] if totals['total_orders'] != 0 else 0
-        
-        # Формула Z3: =IFERROR(Y3/S3, ) (average_check_after_spp)
-        z3 = totals['total_sales_with_spp'] / totals['total_sales_minus_returns'] if totals['total_sales_minus_returns'] != 0 else 0
-        
+    
+    @staticmethod
+    def formula_inputs(analysis_totals=None, financial_totals=None):
+        """Входы движка формул из итогов таблиц (переданных или посчитанных)"""
+        if analysis_totals is None:
+            analysis_totals = ExcelFormulasService.sales_analysis_totals()
+        if financial_totals is None:
+            financial_totals = ExcelFormulasService.financial_report_totals()
+        
+        inputs = {f'sa.{field}': value for field, value in analysis_totals.items()}
+        inputs.update({f'fr.{field}': value for field, value in financial_totals.items()})
+        return inputs
+    
+    @staticmethod
+    def cells(values, sheet):
+        """Ячейки одного листа из результата движка, без префикса листа"""
+        prefix = f'{sheet}.'
         return {
-            'f3': totals['total_orders'] or 0,
-            'g3': totals['total_rejections'] or 0,
-            'h3': totals['total_sales'] or 0,
-            'i3': totals['total_returns'] or 0,
-            'k3': totals['total_sales_minus_returns'] or 0,
-            'l3': totals['total_supplier_return'] or 0,
-            'm3': totals['total_logistics_for_returns'] or 0,
-            'n3': totals['total_sales_before_spp'] or 0,
-            'o3': totals['total_sales_with_spp'] or 0,
-            'p3': p3,
-            'q3': totals['total_sales_minus_commission'] or 0,
-            'r3': totals['total_sales_minus_commission_no_returns'] or 0,
-            's3': totals['total_return_amount'] or 0,
-            't3': totals['total_sales_minus_returns_amount'] or 0,
-            'u3': totals['total_commission'] or 0,
-            'v3': totals['total_logistics'] or 0,
-            'w3': totals['total_logistics_per_unit'] or 0,
-            'x3': totals['total_acquiring'] or 0,
-            'y3': totals['total_fine'] or 0,
-            'z3': z3,
-            'aa3': totals['total_additional_payments'] or 0,
-            'ab3': totals['total_substitution_compensation'] or 0,
-            'ac3': totals['total_defect_compensation'] or 0,
-            'ad3': totals['total_average_check'] or 0,
-            'ae3': totals['total_cost_per_unit'] or 0,
-            'af3': totals['total_sold_goods_cost'] or 0,
-            'ag3': totals['total_margin_before_tax'] or 0,
-            'ah3': totals['total_tax_6_percent'] or 0,
-            'ai3': totals['total_margin_after_tax'] or 0,
-            'aj3': totals['total_margin_per_unit'] or 0,
-            'ak3': totals['total_margin_percent'] or 0,
-            'al3': totals['total_roi_from_cost'] or 0,
-            'am3': totals['total_gmroi'] or 0,
-            'an3': totals['total_revenue_share'] or 0,
-            'ao3': totals['total_margin_share'] or 0,
-            'ap3': totals['total_money_in_goods'] or 0
+            name[len(prefix):]: value
+            for name, value in values.items() if name.startswith(prefix)
         }
     
+    @staticmethod
+    def what_if(values, changes):
+        """
+        Расчет "что если": пересчитываются только ячейки, зависящие от
+        изменившихся входов, например {'sa.sold_goods_cost': ...}
+        """
+        return FORMULAS.evaluate_changed(values, changes)
+    
+    @staticmethod
+    def calculate_svodny_formulas(analysis_data=None, financial_data=None):
+        """
+        Реализация всех 34 формул из листа 'Сводный'.
+        
+        Итоги анализа продаж и финотчетов можно передать готовыми, чтобы
+        не сканировать таблицы повторно.
+        """
+        inputs = ExcelFormulasService.formula_inputs(analysis_data, financial_data)
+        svodny = [formula.name for formula in SVODNY_FORMULAS]
+        return ExcelFormulasService.cells(FORMULAS.evaluate(inputs, svodny), 'svodny')
+    
+    @staticmethod
+    def calculate_analysis_formulas(totals=None):
+        """
+        Реализация всех 327 формул из листа 'Анализ продаж'.
+        
+        Итоги можно передать готовыми (те же, что использует лист 'Сводный').
+        """
+        if totals is None:
+            totals = ExcelFormulasService.sales_analysis_totals()
+        
+        inputs = {f'sa.{field}': value for field, value in totals.items()}
+        analysis = [formula.name for formula in ANALYSIS_FORMULAS]
+        return ExcelFormulasService.cells(FORMULAS.evaluate(inputs, analysis), 'analysis')
+    
     @staticmethod
     def calculate_plan_formulas():
         """Реализация всех 10 формул из листа 'План по выкупам'"""
         
-        plan_records = PurchasePlan.objects.all()
-        
         # Формулы D3:D7: =F3-E3, =F4-E4, =F5-E5, =F6-E6, =F7-E7
+        # F - всего заказов (план), E - изначальная позиция
         plan_calculations = []
-        for record in plan_records:
+        for pk, initial_position, total_orders in PurchasePlan.objects.values_list(
+            'id', 'initial_position', 'total_orders'
+        ):
             # Формула D: =F-E (разница между планом и фактом)
-            difference = (record.plan_quantity or 0) - (record.actual_quantity or 0)
+            difference = (total_orders or 0) - (initial_position or 0)
             plan_calculations.append({
-                'id': record.id,
+                'id': pk,
                 'difference': difference,
-                'plan_quantity': record.plan_quantity or 0,
-                'actual_quantity': record.actual_quantity or 0
+                'plan_quantity': total_orders or 0,
+                'actual_quantity': initial_position or 0
             })
         
         return plan_calculations
     
     @staticmethod
     def calculate_all_formulas():
-        """Вычисление ВСЕХ формул из Excel файла"""
+        """
+        Вычисление ВСЕХ формул из Excel файла.
         
-        svodny = ExcelFormulasService.calculate_svodny_formulas()
-        analysis = ExcelFormulasService.calculate_analysis_formulas()
-        plan = ExcelFormulasService.calculate_plan_formulas()
+        Каждая таблица сканируется один раз: итоги анализа продаж общие для
+        листов 'Сводный' и 'Анализ продаж', поля сводных данных берутся из
+        тех же вычисленных ячеек.
+        """
+        values = FORMULAS.evaluate(ExcelFormulasService.formula_inputs())
         
         return {
-            'svodny': svodny,
-            'analysis': analysis,
-            'plan': plan
+            'svodny': ExcelFormulasService.cells(values, 'svodny'),
+            'analysis': ExcelFormulasService.cells(values, 'analysis'),
+            'summary': ExcelFormulasService.cells(values, 'summary'),
+            'plan': ExcelFormulasService.calculate_plan_formulas()
         }
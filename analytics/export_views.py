@@ -0,0 +1,180 @@
+"""
+Потоковая выгрузка финотчетов целиком: NDJSON и CSV
+
+    GET /api/financial-reports/export.ndjson?brand=...&sale_date__gte=...
+    GET /api/financial-reports/export.csv?fields=id,sale_date,wb_sold_product
+
+Фильтры, сортировка и ?fields= те же, что у списка /api/financial-reports/.
+Строки читаются из базы через .values_list().iterator() и сразу отдаются
+частями через StreamingHttpResponse, поэтому память сервера не зависит от
+размера выгрузки. Значения представлены так же, как в ответах API. В
+статическом режиме выгружаются записи financial_reports.json.
+
+Книга Excel строится в фоне (analytics.excel_export):
+
+    POST /api/excel-export/                   задание: {"id": ..., "status": ...}
+    GET  /api/excel-export/<id>/              состояние и прогресс
+    GET  /api/excel-export/<id>/download/     готовый .xlsx
+"""
+
+import csv
+import json
+import os
+
+from django.conf import settings
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from analytics.conditional import conditional_response, data_validators, static_validators
+from analytics.excel_export import ExcelExportJobs, ExportJob
+from analytics.models import FinancialReport
+from analytics.serializers import FIELDS_PARAM, FinancialReportSerializer, parse_fields
+from analytics.static_data import store
+from analytics.static_query import FilterSpec
+from analytics.views import FinancialReportViewSet
+
+
+STATIC_FILENAME = FinancialReportViewSet.static_filename
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: writerow возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+def database_rows(spec, names):
+    """Строки финотчетов из базы в представлении API; выборка строится сразу"""
+    fields = FinancialReportSerializer().fields
+    queryset = spec.apply_to_queryset(FinancialReport.objects.all())
+    if not spec.ordering:
+        queryset = queryset.order_by('pk')
+    converters = [fields[name].to_representation for name in names]
+    values_list = queryset.values_list(*names)
+
+    def rows():
+        for values in values_list.iterator(chunk_size=CHUNK_SIZE):
+            yield [None if value is None else convert(value) for convert, value in zip(converters, values)]
+    return rows()
+
+
+def static_rows(spec, names):
+    """Строки финотчетов из статического файла с теми же фильтрами"""
+    dataset = store.get_dataset(STATIC_FILENAME, FinancialReportViewSet.filter_fields)
+    records = dataset.records
+    positions = dataset.positions(spec) if spec.filters or spec.ordering else range(len(records))
+    for position in positions:
+        record = records[position]
+        yield [record.get(name) for name in names]
+
+
+def batched(lines, size=CHUNK_SIZE):
+    """Строки выгрузки, собранные в части по size строк"""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def ndjson_lines(names, rows):
+    # Кодировщик DRF: десятичные значения - числами, как в ответах API
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), ensure_ascii=False, cls=JSONEncoder) + '\n'
+
+
+def csv_lines(names, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_response(request, content_type, extension, lines):
+    """Потоковый ответ с выгрузкой по параметрам запроса; ошибки параметров - 400"""
+    try:
+        names = parse_fields(request.GET.get(FIELDS_PARAM), FinancialReportSerializer().fields)
+        spec = FilterSpec.from_params(request.GET, FinancialReportViewSet.filter_fields)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400, json_dumps_params={'ensure_ascii': False})
+    names = names or list(FinancialReportSerializer().fields)
+
+    if settings.STATIC_MODE:
+        validators = static_validators(STATIC_FILENAME)
+        rows = static_rows(spec, names)
+    else:
+        validators = data_validators()
+        rows = database_rows(spec, names)
+
+    def build():
+        response = StreamingHttpResponse(batched(lines(names, rows)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="financial_reports.{extension}"'
+        return response
+    return conditional_response(request, validators, build)
+
+
+@require_http_methods(["GET"])
+def financial_reports_ndjson(request):
+    """Финотчеты построчно в JSON (по объекту на строку)"""
+    return export_response(request, 'application/x-ndjson; charset=utf-8', 'ndjson', ndjson_lines)
+
+
+@require_http_methods(["GET"])
+def financial_reports_csv(request):
+    """Финотчеты в CSV с заголовком из имен полей"""
+    return export_response(request, 'text/csv; charset=utf-8', 'csv', csv_lines)
+
+
+def job_response(request, job, status=200):
+    """Состояние задания со ссылкой на скачивание готового файла"""
+    data = job.as_dict()
+    data['url'] = request.build_absolute_uri(reverse('excel_export_status', args=[job.id]))
+    data['download_url'] = None
+    if job.status == ExportJob.DONE:
+        data['download_url'] = request.build_absolute_uri(reverse('excel_export_download', args=[job.id]))
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def excel_export_start(request):
+    """Запуск выгрузки Excel в фоне; готовая выгрузка той же версии данных - сразу"""
+    job = ExcelExportJobs.start()
+    return job_response(request, job, status=200 if job.status == ExportJob.DONE else 202)
+
+
+@require_http_methods(["GET"])
+def excel_export_status(request, job_id):
+    """Состояние и прогресс задания выгрузки"""
+    job = ExcelExportJobs.get(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Задание не найдено'}, status=404, json_dumps_params={'ensure_ascii': False})
+    return job_response(request, job)
+
+
+@require_http_methods(["GET"])
+def excel_export_download(request, job_id):
+    """Готовый файл выгрузки; пока книга строится - 409"""
+    job = ExcelExportJobs.get(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Задание не найдено'}, status=404, json_dumps_params={'ensure_ascii': False})
+    if job.status != ExportJob.DONE or not os.path.exists(job.path):
+        return job_response(request, job, status=409)
+
+    def build():
+        return FileResponse(
+            open(job.path, 'rb'), as_attachment=True,
+            filename=f'wb_analytics_{job.version}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    # Содержимое файла определяется версией данных
+    return conditional_response(request, (f'W/"x-{job.version}"', os.path.getmtime(job.path)), build)
@@ -0,0 +1,139 @@
+"""
+Движок формул с графом зависимостей
+
+Каждая ячейка объявляется один раз: имя, имена входов и функция от их
+значений. По объявлениям один раз строится план вычисления в порядке
+топологической сортировки, после чего можно вычислить все ячейки или
+пересчитать только те, что зависят от изменившихся входов (расчет
+"что если").
+"""
+
+from collections import defaultdict, deque
+
+
+class FormulaError(ValueError):
+    """Ошибка в объявлении формул: повтор имени или циклическая зависимость"""
+
+
+class Formula:
+    """Объявление ячейки: имя, входы и функция от значений входов"""
+
+    __slots__ = ('name', 'inputs', 'function')
+
+    def __init__(self, name, inputs, function):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.function = function
+
+    def __repr__(self):
+        return f"Formula({self.name!r}, {list(self.inputs)!r})"
+
+    def evaluate(self, values):
+        return self.function(*(values[name] for name in self.inputs))
+
+
+class FormulaGraph:
+    """Набор формул с готовым планом вычисления"""
+
+    def __init__(self, formulas):
+        self.formulas = {}
+        for formula in formulas:
+            if formula.name in self.formulas:
+                raise FormulaError(f"Ячейка {formula.name} объявлена дважды")
+            self.formulas[formula.name] = formula
+
+        # Входы, которые не вычисляются формулами, подаются извне
+        self.sources = frozenset(
+            name for formula in self.formulas.values()
+            for name in formula.inputs if name not in self.formulas
+        )
+
+        self.dependents = defaultdict(list)
+        for formula in self.formulas.values():
+            for name in formula.inputs:
+                self.dependents[name].append(formula.name)
+
+        self.plan = self._build_plan()
+
+    def _build_plan(self):
+        """Топологическая сортировка (алгоритм Кана)"""
+        pending = {
+            name: sum(1 for source in formula.inputs if source in self.formulas)
+            for name, formula in self.formulas.items()
+        }
+        ready = deque(name for name, count in pending.items() if count == 0)
+
+        plan = []
+        while ready:
+            name = ready.popleft()
+            plan.append(self.formulas[name])
+            for dependent in self.dependents[name]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(plan) != len(self.formulas):
+            cycle = sorted(name for name, count in pending.items() if count > 0)
+            raise FormulaError(f"Циклическая зависимость между ячейками: {', '.join(cycle)}")
+        return plan
+
+    def downstream(self, names):
+        """Все ячейки, зависящие (прямо или через другие) от переданных имен"""
+        affected = set()
+        queue = deque(names)
+        while queue:
+            for dependent in self.dependents[queue.popleft()]:
+                if dependent not in affected:
+                    affected.add(dependent)
+                    queue.append(dependent)
+        return affected
+
+    def upstream(self, names):
+        """Переданные ячейки и все ячейки, от которых они зависят"""
+        required = set()
+        queue = deque(name for name in names if name in self.formulas)
+        while queue:
+            name = queue.popleft()
+            if name in required:
+                continue
+            required.add(name)
+            queue.extend(source for source in self.formulas[name].inputs if source in self.formulas)
+        return required
+
+    def evaluate(self, inputs, names=None):
+        """
+        Вычисление ячеек. Возвращает словарь входов и ячеек.
+
+        Если переданы names, вычисляются только эти ячейки и то, от чего
+        они зависят; остальные входы можно не передавать.
+        """
+        plan = self.plan
+        if names is not None:
+            required = self.upstream(names)
+            plan = [formula for formula in plan if formula.name in required]
+
+        missing = {name for formula in plan for name in formula.inputs
+                   if name not in self.formulas} - set(inputs)
+        if missing:
+            raise FormulaError(f"Не переданы входы: {', '.join(sorted(missing))}")
+
+        values = dict(inputs)
+        for formula in plan:
+            values[formula.name] = formula.evaluate(values)
+        return values
+
+    def evaluate_changed(self, values, changes):
+        """
+        Пересчет только ячеек, зависящих от изменившихся значений.
+
+        values - результат evaluate(), changes - новые значения входов или
+        ячеек. Исходный словарь не меняется.
+        """
+        result = dict(values)
+        result.update(changes)
+
+        affected = self.downstream(changes) - set(changes)
+        for formula in self.plan:
+            if formula.name in affected:
+                result[formula.name] = formula.evaluate(result)
+        return result
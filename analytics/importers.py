@@ -0,0 +1,462 @@
+"""
+Потоковый импорт листов Excel в базу данных
+
+Листы читаются openpyxl в режиме read-only построчно, строки превращаются
+в экземпляры моделей пачками и записываются через bulk_create, по одной
+транзакции на пачку. Вся книга в память не загружается. После листа
+финотчетов пересчитываются дневные итоги за затронутые дни.
+"""
+
+import hashlib
+import time
+from datetime import date, datetime, time as dt_time, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from analytics import cache
+from analytics.db_utils import bulk_update_rows
+from analytics.rollups import DailySalesRollupService
+from analytics.models import (
+    SalesAnalysis, FinancialReport, Nomenclature, PurchasePlan
+)
+
+
+def cell_text(value):
+    """
+    Текст числовой ячейки для строкового поля. Целые из числового столбца
+    (pandas и openpyxl читают их как float) пишутся без '.0': 42.0 -> '42'.
+    Единственное место такого приведения при импорте.
+    """
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def stored_text(field, value):
+    """
+    Значение поля в том виде, в каком его вернет база: деньги - с
+    decimal_places знаками, время - в UTC. По нему считается хеш строки,
+    поэтому хеш строки из файла и той же строки из базы совпадает.
+    """
+    if value is None:
+        return ''
+    field_type = field.get_internal_type()
+    if field_type == 'DecimalField':
+        # + 0 убирает знак у нуля: -0.00 и 0.00 в базе одно и то же
+        return str(Decimal(value).quantize(Decimal(1).scaleb(-field.decimal_places)) + 0)
+    if field_type == 'DateTimeField':
+        return value.astimezone(dt_timezone.utc).isoformat()
+    return str(value)
+
+
+def normalize_header(value):
+    """Заголовок столбца без лишних пробелов (в выгрузках WB они плавают)"""
+    return ' '.join(str(value).split())
+
+
+class SheetSpec:
+    """Описание листа: модель, соответствие столбцов полям и правила отбора строк"""
+
+    def __init__(self, sheet_name, model, columns, required, defaults=None, unique_field=None,
+                 natural_key=None, hash_field=None, rollup_date_field=None):
+        self.sheet_name = sheet_name
+        self.model = model
+        # {заголовок столбца: имя поля модели}
+        self.columns = {normalize_header(header): field for header, field in columns.items()}
+        # Строка пропускается, если хотя бы один из этих столбцов пуст
+        self.required = [normalize_header(header) for header in required]
+        # Значения по умолчанию для пустых ячеек, отличные от значения поля
+        self.defaults = defaults or {}
+        # Поле, по которому отбрасываются уже загруженные строки для моделей
+        # без ограничения уникальности в базе
+        self.unique_field = unique_field
+        # Естественный ключ и поле хеша для инкрементальной загрузки
+        self.natural_key = natural_key
+        self.hash_field = hash_field
+        # Поле даты, по дням которого после загрузки пересчитываются дневные итоги
+        self.rollup_date_field = rollup_date_field
+
+
+NOMENCLATURE_SHEET = SheetSpec(
+    sheet_name='Номенклатуры (вставить)',
+    model=Nomenclature,
+    columns={
+        'Бренд': 'brand',
+        'Предмет': 'subject',
+        'Код размера (chrt_id)': 'size_code',
+        'Артикул продавца': 'supplier_article',
+        'Артикул WB': 'wb_article',
+        'Размер': 'size',
+        'Баркод': 'barcode',
+        'Комплектация': 'equipment',
+        'Состав': 'composition',
+        'Себестоимость': 'cost_price',
+    },
+    required=['Бренд', 'Артикул продавца'],
+    defaults={'size': '0', 'composition': ''},
+)
+
+# Заголовки листа финотчетов совпадают с verbose_name полей модели
+FINANCIAL_REPORTS_SHEET = SheetSpec(
+    sheet_name='Финотчеты (вставить)',
+    model=FinancialReport,
+    columns={
+        field.verbose_name: field.name
+        for field in FinancialReport._meta.concrete_fields
+        if not field.primary_key and field.editable
+    },
+    required=['№', 'Бренд'],
+    unique_field='number',
+    natural_key=FinancialReport.NATURAL_KEY,
+    hash_field='content_hash',
+    rollup_date_field='sale_date',
+)
+
+SALES_ANALYSIS_SHEET = SheetSpec(
+    sheet_name='Анализ продаж',
+    model=SalesAnalysis,
+    columns={
+        'Бренд': 'brand',
+        'Предмет': 'subject',
+        'Артикул': 'article',
+        'Размер': 'size',
+        'Баркод': 'barcode',
+        'В пути до клиента': 'in_transit_to_client',
+        'В пути от клиента': 'in_transit_from_client',
+        'На складах': 'in_warehouses',
+        'ИТОГО остаток на ВБ': 'total_stock_wb',
+        'Заказы, шт': 'orders',
+        'Отказы': 'rejections',
+        'Продажи, шт': 'sales',
+        'Возвраты, шт': 'returns',
+        'Продажи минус возвраты': 'sales_minus_returns',
+        'Процент выкупа': 'purchase_percentage',
+        'Продажи по ценам до СПП': 'sales_before_spp',
+        'Продажи по ценам с СПП': 'sales_with_spp',
+        'Продажи за вычетом комиссии': 'sales_minus_commission',
+        'Комиссия, руб': 'commission',
+        'Комиссия %': 'commission_percent',
+        'Логистика': 'logistics',
+        'Логистика на 1 продажу': 'logistics_per_unit',
+        'Эквайринг': 'acquiring',
+        'Штраф': 'fine',
+        'Доплаты': 'additional_payments',
+        'Компенсация подмен': 'substitution_compensation',
+        'Возмещение брака': 'defect_compensation',
+        'Средний чек': 'average_check',
+        'Себестомость 1 шт': 'cost_per_unit',
+        'Себестоимость проданного товара': 'sold_goods_cost',
+        'Маржа до налогов': 'margin_before_tax',
+        'Налог 6%': 'tax_6_percent',
+        'Маржа после налогов, руб': 'margin_after_tax',
+        'Маржа на 1 продажу, руб': 'margin_per_unit',
+        'Маржинальность, %': 'margin_percent',
+        'ROI от себестоимости, %': 'roi_from_cost',
+        'GMROI, %': 'gmroi',
+        'Доля от общей выручки, %': 'revenue_share',
+        'Доля от общей маржи, %': 'margin_share',
+        'По себестоимости': 'abc_by_cost',
+        'По цене за вычетом комиссии': 'abc_by_price',
+        'По средней марже': 'abc_by_margin',
+        'Деньги в товаре': 'money_in_goods',
+    },
+    required=['Бренд', 'Артикул'],
+    defaults={'size': '0'},
+)
+
+PURCHASE_PLAN_SHEET = SheetSpec(
+    sheet_name='План по выкупам',
+    model=PurchasePlan,
+    columns={
+        'Unnamed: 2': 'position',
+        'выкупы': 'purchases',
+        'изначальная поз': 'initial_position',
+        'всего заказзаов': 'total_orders',
+    },
+    required=['выкупы'],
+    unique_field='position',
+)
+
+# Листы в порядке загрузки
+SHEETS = [
+    NOMENCLATURE_SHEET,
+    FINANCIAL_REPORTS_SHEET,
+    SALES_ANALYSIS_SHEET,
+    PURCHASE_PLAN_SHEET,
+]
+
+
+class ExcelStreamImporter:
+    """
+    Потоковый импорт книги Excel пачками.
+
+    В инкрементальном режиме листы с естественным ключом не дедуплицируются
+    по unique_field, а сверяются с базой по ключу и хешу содержимого:
+    новые строки добавляются, измененные обновляются, остальные не трогаются.
+    """
+
+    BATCH_SIZE = 1000
+
+    # Строка заголовков (как header=1 в pd.read_excel)
+    HEADER_ROW = 2
+
+    def __init__(self, file_path, batch_size=None, progress=None, incremental=False):
+        self.file_path = file_path
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.incremental = incremental
+        # progress(sheet_name, rows_read, rows_per_second) после каждой пачки
+        self.progress = progress
+
+    @staticmethod
+    def make_headers(raw_headers):
+        """Имена столбцов по правилам pandas: пустые - 'Unnamed: N', повторы - с суффиксом"""
+        headers = []
+        seen = {}
+        for idx, value in enumerate(raw_headers):
+            name = f'Unnamed: {idx}' if value is None or str(value).strip() == '' else normalize_header(value)
+            if name in seen:
+                seen[name] += 1
+                name = f'{name}.{seen[name]}'
+            else:
+                seen[name] = 0
+            headers.append(name)
+        return headers
+
+    def iter_sheet_rows(self, workbook, sheet_name):
+        """Построчное чтение листа в виде словарей {заголовок: значение}"""
+        rows = workbook[sheet_name].iter_rows(min_row=self.HEADER_ROW, values_only=True)
+        headers = self.make_headers(next(rows, ()))
+        for values in rows:
+            yield dict(zip(headers, values))
+
+    @staticmethod
+    def is_empty(value):
+        return value is None or (isinstance(value, str) and value.strip() == '')
+
+    @staticmethod
+    def coerce(field, value, default):
+        """Приведение значения ячейки к типу поля; пустые и битые значения - default"""
+        if ExcelStreamImporter.is_empty(value):
+            return default
+
+        field_type = field.get_internal_type()
+        try:
+            if field_type in ('CharField', 'TextField'):
+                return cell_text(value)
+            if field_type == 'IntegerField':
+                return int(float(value))
+            if field_type == 'DecimalField':
+                return Decimal(str(value).strip().replace(',', '.'))
+            if field_type == 'DateTimeField':
+                if isinstance(value, str):
+                    parsed = parse_datetime(value.strip())
+                    if parsed is None:
+                        parsed_date = parse_date(value.strip())
+                        if parsed_date is None:
+                            return default
+                        parsed = datetime.combine(parsed_date, dt_time.min)
+                    value = parsed
+                elif isinstance(value, date) and not isinstance(value, datetime):
+                    value = datetime.combine(value, dt_time.min)
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                return value
+        except (ValueError, TypeError, InvalidOperation, ArithmeticError):
+            return default
+        return value
+
+    @staticmethod
+    def field_default(spec, field):
+        """Значение для пустой ячейки: явное из описания листа или из поля модели"""
+        if field.name in spec.defaults:
+            return spec.defaults[field.name]
+        if field.has_default():
+            return field.get_default()
+        if field.null:
+            return None
+        if field.get_internal_type() in ('CharField', 'TextField'):
+            return ''
+        if field.get_internal_type() in ('IntegerField', 'DecimalField'):
+            return 0
+        return None
+
+    def column_plan(self, spec):
+        """Поля модели и значения по умолчанию для столбцов листа (считаются один раз)"""
+        meta = spec.model._meta
+        plan = []
+        for header, field_name in spec.columns.items():
+            field = meta.get_field(field_name)
+            plan.append((header, field_name, field, self.field_default(spec, field)))
+        return plan
+
+    def build_values(self, spec, plan, row):
+        """Значения полей модели для строки листа или None, если строка пропускается"""
+        if any(self.is_empty(row.get(header)) for header in spec.required):
+            return None
+
+        coerce = self.coerce
+        values = {
+            field_name: coerce(field, row.get(header), default)
+            for header, field_name, field, default in plan
+        }
+        if spec.hash_field:
+            values[spec.hash_field] = self.content_hash(spec.model, values)
+        return values
+
+    @staticmethod
+    def content_hash(model, values):
+        """Хеш значений строки в порядке столбцов листа (см. stored_text)"""
+        meta = model._meta
+        parts = [stored_text(meta.get_field(name), value) for name, value in values.items()]
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def write_batch(self, spec, batch, seen, dates):
+        """
+        Запись пачки в одной транзакции. Возвращает счетчики изменений;
+        даты записанных строк (rollup_date_field) добавляются в dates
+        """
+        if self.incremental and spec.natural_key:
+            return self.upsert_batch(spec, batch, dates)
+
+        if spec.unique_field:
+            instances = []
+            for values in batch:
+                key = values[spec.unique_field]
+                if key in seen:
+                    continue
+                seen.add(key)
+                instances.append(spec.model(**values))
+                if spec.rollup_date_field:
+                    dates.add(values[spec.rollup_date_field])
+            with transaction.atomic():
+                spec.model.objects.bulk_create(instances, batch_size=self.batch_size)
+            return {'created': len(instances)}
+
+        # Модели с unique_together: существующие строки пропускаются (как get_or_create).
+        # Ключи пачки, уже записанные в базу, читаются одним запросом; новыми
+        # считаются строки с ключом, которого нет ни в базе, ни выше в пачке
+        key_fields = spec.model._meta.unique_together[0]
+        lookup = {f'{name}__in': {values[name] for values in batch} for name in key_fields}
+        existing = set(spec.model.objects.filter(**lookup).values_list(*key_fields).iterator())
+        instances = []
+        for values in batch:
+            key = tuple(values[name] for name in key_fields)
+            if key in existing:
+                continue
+            existing.add(key)
+            instances.append(spec.model(**values))
+        with transaction.atomic():
+            # ignore_conflicts оставлен на случай параллельной загрузки тех же строк
+            spec.model.objects.bulk_create(instances, batch_size=self.batch_size, ignore_conflicts=True)
+        return {'created': len(instances)}
+
+    def upsert_batch(self, spec, batch, dates):
+        """
+        Инкрементальная запись пачки по естественному ключу.
+
+        Для ключей пачки одним запросом читаются id и хеши из базы; строки
+        с новым ключом вставляются, строки с другим хешем обновляются.
+        """
+        key_fields = spec.natural_key
+        hash_field = spec.hash_field
+
+        # Повторы ключа внутри пачки: побеждает последняя строка
+        incoming = {tuple(values[name] for name in key_fields): values for values in batch}
+
+        lookup = {f'{name}__in': {key[idx] for key in incoming} for idx, name in enumerate(key_fields)}
+        existing = {
+            tuple(row[1:-1]): (row[0], row[-1])
+            for row in spec.model.objects.filter(**lookup).values_list('pk', *key_fields, hash_field).iterator()
+        }
+
+        created, changed = [], []
+        for key, values in incoming.items():
+            if key not in existing:
+                created.append(spec.model(**values))
+                continue
+            pk, stored_hash = existing[key]
+            if stored_hash != values[hash_field]:
+                changed.append((pk, values))
+
+        date_field = spec.rollup_date_field
+        if date_field:
+            dates.update(getattr(instance, date_field) for instance in created)
+            dates.update(values[date_field] for _, values in changed)
+            if changed:
+                # Измененная строка могла переехать в другой день: старый день тоже пересчитывается
+                dates.update(spec.model.objects.filter(
+                    pk__in=[pk for pk, _ in changed]
+                ).values_list(date_field, flat=True))
+
+        update_fields = list(spec.columns.values()) + [hash_field]
+        with transaction.atomic():
+            spec.model.objects.bulk_create(created, batch_size=self.batch_size)
+            bulk_update_rows(
+                spec.model, update_fields,
+                ((pk, [values[name] for name in update_fields]) for pk, values in changed),
+                batch_size=self.batch_size,
+            )
+
+        return {
+            'created': len(created),
+            'updated': len(changed),
+            'unchanged': len(incoming) - len(created) - len(changed),
+        }
+
+    def import_sheet(self, workbook, spec):
+        """Импорт одного листа. Возвращает статистику загрузки"""
+        started = time.perf_counter()
+        seen = set()
+        if spec.unique_field and not (self.incremental and spec.natural_key):
+            seen = set(spec.model.objects.values_list(spec.unique_field, flat=True))
+
+        stats = {
+            'sheet': spec.sheet_name, 'read': 0, 'skipped': 0,
+            'created': 0, 'updated': 0, 'unchanged': 0,
+        }
+        plan = self.column_plan(spec)
+        batch = []
+        dates = set()
+
+        def flush():
+            for counter, value in self.write_batch(spec, batch, seen, dates).items():
+                stats[counter] += value
+            batch.clear()
+            if self.progress:
+                elapsed = time.perf_counter() - started
+                self.progress(spec.sheet_name, stats['read'], stats['read'] / elapsed if elapsed else 0)
+
+        for row in self.iter_sheet_rows(workbook, spec.sheet_name):
+            stats['read'] += 1
+            values = self.build_values(spec, plan, row)
+            if values is None:
+                stats['skipped'] += 1
+                continue
+            batch.append(values)
+            if len(batch) >= self.batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+        if dates:
+            DailySalesRollupService.refresh_dates(dates)
+
+        stats['seconds'] = time.perf_counter() - started
+        stats['rate'] = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+        return stats
+
+    def run(self, specs=None):
+        """Импорт всех листов книги. Возвращает статистику по каждому листу"""
+        workbook = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            stats = [self.import_sheet(workbook, spec) for spec in (specs or SHEETS)]
+        finally:
+            workbook.close()
+        
+        cache.invalidate()
+        return stats
@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from analytics.excel_formulas import ExcelFormulasService
+from analytics.models import DailySalesRollup, FinancialReport, PurchasePlan, SalesAnalysis
+
+
+class Command(BaseCommand):
+    help = (
+        'Число сканирований таблиц и время расчета формул Excel: отдельные расчеты '
+        'листов и общий расчет. Это не сравнение с прежней версией кода'
+    )
+
+    TABLES = (SalesAnalysis, FinancialReport, DailySalesRollup, PurchasePlan)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов каждого варианта')
+
+    @staticmethod
+    def per_sheet():
+        """Каждый лист рассчитывается отдельным вызовом и сам собирает свои итоги"""
+        return {
+            'svodny': ExcelFormulasService.calculate_svodny_formulas(),
+            'analysis': ExcelFormulasService.calculate_analysis_formulas(),
+            'plan': ExcelFormulasService.calculate_plan_formulas(),
+        }
+
+    @staticmethod
+    def shared():
+        """Все листы одним вызовом: по одному проходу на таблицу"""
+        return ExcelFormulasService.calculate_all_formulas()
+
+    def measure(self, label, function, repeat):
+        with CaptureQueriesContext(connection) as context:
+            result = function()
+
+        scans = Counter()
+        for query in context.captured_queries:
+            for model in self.TABLES:
+                if f'FROM "{model._meta.db_table}"' in query['sql']:
+                    scans[model._meta.db_table] += 1
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        elapsed = (time.perf_counter() - started) / repeat
+
+        details = ', '.join(f'{table}: {count}' for table, count in sorted(scans.items()))
+        self.stdout.write(
+            f'{label}: запросов {len(context.captured_queries)} ({details}), '
+            f'{elapsed * 1000:.1f} мс на расчет'
+        )
+        return result
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        self.stdout.write(
+            f'Строк анализа продаж: {SalesAnalysis.objects.count()}, '
+            f'финотчетов: {FinancialReport.objects.count()}'
+        )
+
+        separate = self.measure('Листы по отдельности', self.per_sheet, repeat)
+        shared = self.measure('Все листы вместе', self.shared, repeat)
+
+        if separate != {sheet: shared[sheet] for sheet in separate}:
+            self.stderr.write(self.style.ERROR('Результаты расчетов различаются!'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Результаты совпадают'))
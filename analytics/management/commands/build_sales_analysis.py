@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.builders import SalesAnalysisBuilder
+from analytics.services import CalculationService
+
+
+class Command(BaseCommand):
+    help = 'Построение анализа продаж из финотчетов, номенклатуры и остатков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='Начало периода (ГГГГ-ММ-ДД)')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Конец периода включительно (ГГГГ-ММ-ДД)')
+        parser.add_argument(
+            '--backend',
+            choices=CalculationService.BACKENDS,
+            default=None,
+            help='Движок пересчета анализа продаж (по умолчанию из настроек)'
+        )
+
+    def handle(self, *args, **options):
+        if options['date_from'] and options['date_to'] and options['date_from'] > options['date_to']:
+            raise CommandError('Начало периода позже его конца')
+
+        self.stdout.write('Строим анализ продаж из финотчетов...')
+        count = SalesAnalysisBuilder.build(options['date_from'], options['date_to'])
+        self.stdout.write(f'Записано {count} строк анализа продаж')
+
+        self.stdout.write('Пересчитываем все показатели...')
+        CalculationService.recalculate_all(backend=options['backend'])
+
+        self.stdout.write(self.style.SUCCESS('Анализ продаж построен!'))
@@ -0,0 +1,47 @@
+import glob
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.static_data import ENCODINGS, StaticDataStore, compress
+
+
+class Command(BaseCommand):
+    help = 'Подготовка сжатых вариантов (gzip, brotli) статических JSON-файлов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            default=str(settings.STATIC_DATA_DIR),
+            help='Каталог с JSON-файлами (по умолчанию static/data)'
+        )
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(os.path.join(options['directory'], '*.json')))
+        if not paths:
+            self.stdout.write(self.style.WARNING('JSON-файлы не найдены'))
+            return
+
+        if compress(b'', 'br') is None:
+            self.stdout.write(self.style.WARNING('Пакет brotli не установлен, готовим только gzip'))
+
+        for path in paths:
+            store = StaticDataStore(os.path.dirname(path))
+            # Сжимается тот же вид JSON, что отдается без сжатия
+            content = store.get_content(os.path.basename(path))[0]
+
+            sizes = []
+            for encoding, suffix in ENCODINGS:
+                compressed = compress(content, encoding)
+                if compressed is None:
+                    continue
+                temp_path = f'{path}{suffix}.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(temp_path, path + suffix)
+                sizes.append(f'{encoding} {len(compressed)}')
+
+            self.stdout.write(f'{os.path.basename(path)}: {len(content)} байт -> {", ".join(sizes)}')
+
+        self.stdout.write(self.style.SUCCESS('Сжатые варианты готовы'))
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.static_export import export_static_data
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка таблиц и агрегатов дашборда из базы данных в статические JSON-файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            default=str(settings.STATIC_DATA_DIR),
+            help='Каталог для JSON-файлов (по умолчанию static/data)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = export_static_data(options['directory'])
+        elapsed = time.perf_counter() - started
+
+        for filename, changed, size in results:
+            status = 'обновлен' if changed else 'без изменений'
+            self.stdout.write(f'{filename}: {size} байт, {status}')
+
+        changed_count = sum(1 for _, changed, _ in results if changed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка завершена за {elapsed:.2f} с, изменено файлов: {changed_count}'
+        ))
+        if changed_count:
+            self.stdout.write('Сжатые варианты обновляет команда compress_static_data')
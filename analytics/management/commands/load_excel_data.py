@@ -5,6 +5,8 @@ from analytics.models import (
     StockBalance, SummaryData, PurchasePlan
 )
 from analytics.services import CalculationService
+from analytics.importers import ExcelStreamImporter, cell_text
+from analytics.rollups import DailySalesRollupService
 
 
 class Command(BaseCommand):
@@ -12,6 +14,30 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('file_path', type=str, help='Путь к Excel файлу')
+        parser.add_argument(
+            '--backend',
+            choices=CalculationService.BACKENDS,
+            default=None,
+            help='Движок пересчета анализа продаж (по умолчанию из настроек)'
+        )
+        parser.add_argument(
+            '--engine',
+            choices=['streaming', 'pandas'],
+            default='streaming',
+            help='Способ импорта: потоковый пачками (streaming) или построчный через pandas'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ExcelStreamImporter.BATCH_SIZE,
+            help='Размер пачки для потокового импорта'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Инкрементальная загрузка финотчетов по ключу srid + обоснование + №: '
+                 'новые строки добавляются, измененные обновляются'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file_path']
@@ -19,21 +45,28 @@ class Command(BaseCommand):
         try:
             self.stdout.write('Начинаем загрузку данных из Excel файла...')
             
-            # Загружаем данные из листа "Номенклатуры (вставить)"
-            self.load_nomenclature(file_path)
+            if options['incremental'] and options['engine'] != 'streaming':
+                raise ValueError('Инкрементальная загрузка доступна только для --engine streaming')
             
-            # Загружаем данные из листа "Финотчеты (вставить)"
-            self.load_financial_reports(file_path)
-            
-            # Загружаем данные из листа "Анализ продаж"
-            self.load_sales_analysis(file_path)
-            
-            # Загружаем данные из листа "План по выкупам"
-            self.load_purchase_plan(file_path)
+            if options['engine'] == 'streaming':
+                self.load_streaming(file_path, options['batch_size'], options['incremental'])
+            else:
+                # Загружаем данные из листа "Номенклатуры (вставить)"
+                self.load_nomenclature(file_path)
+                
+                # Загружаем данные из листа "Финотчеты (вставить)"
+                self.load_financial_reports(file_path)
+                DailySalesRollupService.rebuild()
+                
+                # Загружаем данные из листа "Анализ продаж"
+                self.load_sales_analysis(file_path)
+                
+                # Загружаем данные из листа "План по выкупам"
+                self.load_purchase_plan(file_path)
             
             # Пересчитываем все показатели
             self.stdout.write('Пересчитываем все показатели...')
-            CalculationService.recalculate_all()
+            CalculationService.recalculate_all(backend=options['backend'])
             
             self.stdout.write(
                 self.style.SUCCESS('Данные успешно загружены и обработаны!')
@@ -44,6 +77,22 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Ошибка при загрузке данных: {str(e)}')
             )
 
+    def load_streaming(self, file_path, batch_size, incremental=False):
+        """Потоковая загрузка всех листов пачками"""
+        def progress(sheet_name, rows, rate):
+            self.stdout.write(f'  {sheet_name}: прочитано {rows} строк ({rate:.0f} строк/с)')
+        
+        importer = ExcelStreamImporter(
+            file_path, batch_size=batch_size, progress=progress, incremental=incremental
+        )
+        for stats in importer.run():
+            self.stdout.write(
+                f"Лист '{stats['sheet']}': прочитано {stats['read']}, "
+                f"добавлено {stats['created']}, обновлено {stats['updated']}, "
+                f"без изменений {stats['unchanged']}, пропущено {stats['skipped']} "
+                f"за {stats['seconds']:.2f} с ({stats['rate']:.0f} строк/с)"
+            )
+
     def load_nomenclature(self, file_path):
         """Загрузка номенклатуры"""
         self.stdout.write('Загружаем номенклатуру...')
@@ -55,7 +104,7 @@ class Command(BaseCommand):
                 Nomenclature.objects.get_or_create(
                     brand=row['Бренд'],
                     supplier_article=row['Артикул продавца'],
-                    size=row['Размер'] if pd.notna(row['Размер']) else '0',
+                    size=cell_text(row['Размер']) if pd.notna(row['Размер']) else '0',
                     defaults={
                         'subject': row['Предмет'] if pd.notna(row['Предмет']) else '',
                         'size_code': row['Код размера (chrt_id)'] if pd.notna(row['Код размера (chrt_id)']) else '',
@@ -86,7 +135,7 @@ class Command(BaseCommand):
                         'brand': row['Бренд'] if pd.notna(row['Бренд']) else '',
                         'supplier_article': row['Артикул поставщика'] if pd.notna(row['Артикул поставщика']) else '',
                         'name': row['Название'] if pd.notna(row['Название']) else '',
-                        'size': row['Размер'] if pd.notna(row['Размер']) else '',
+                        'size': cell_text(row['Размер']) if pd.notna(row['Размер']) else '',
                         'barcode': row['Баркод'] if pd.notna(row['Баркод']) else '',
                         'document_type': row['Тип документа'] if pd.notna(row['Тип документа']) else '',
                         'payment_basis': row['Обоснование для оплаты'] if pd.notna(row['Обоснование для оплаты']) else '',
@@ -113,7 +162,7 @@ class Command(BaseCommand):
                 SalesAnalysis.objects.get_or_create(
                     brand=row['Бренд'],
                     article=row['Артикул'],
-                    size=row['Размер'] if pd.notna(row['Размер']) else '0',
+                    size=cell_text(row['Размер']) if pd.notna(row['Размер']) else '0',
                     defaults={
                         'subject': row['Предмет'] if pd.notna(row['Предмет']) else '',
                         'barcode': row['Баркод'] if pd.notna(row['Баркод']) else '',
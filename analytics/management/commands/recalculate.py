@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from analytics.services import CalculationService
+
+
+class Command(BaseCommand):
+    help = 'Пересчет показателей анализа продаж и сводных данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--changed-only',
+            action='store_true',
+            help='Пересчитать только измененные записи и записи с измененной номенклатурой или остатками'
+        )
+        parser.add_argument(
+            '--backend',
+            choices=CalculationService.BACKENDS,
+            default=None,
+            help='Движок пересчета анализа продаж (по умолчанию из настроек)'
+        )
+
+    def handle(self, *args, **options):
+        if options['changed_only']:
+            self.stdout.write('Пересчитываем измененные записи...')
+            count = CalculationService.recalculate_changed(backend=options['backend'])
+            self.stdout.write(f'Пересчитано {count} строк анализа продаж')
+        else:
+            self.stdout.write('Пересчитываем все показатели...')
+            CalculationService.recalculate_all(backend=options['backend'])
+
+        self.stdout.write(self.style.SUCCESS('Пересчет завершен!'))
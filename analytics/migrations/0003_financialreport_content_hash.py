@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0002_alter_financialreport_acquirer_bank_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="financialreport",
+            name="content_hash",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=40,
+                verbose_name="Хеш содержимого строки",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="financialreport",
+            index=models.Index(
+                fields=["srid", "payment_basis", "number"], name="fr_natural_key_idx"
+            ),
+        ),
+    ]
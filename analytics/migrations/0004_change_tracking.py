@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0003_financialreport_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="nomenclature",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Изменено",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="stockbalance",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Изменено",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="salesanalysis",
+            name="is_dirty",
+            field=models.BooleanField(
+                db_index=True,
+                default=True,
+                editable=False,
+                verbose_name="Требует пересчета",
+            ),
+        ),
+        migrations.AddField(
+            model_name="salesanalysis",
+            name="calculated_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Пересчитано"
+            ),
+        ),
+    ]
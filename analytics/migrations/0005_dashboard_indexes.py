@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0004_change_tracking"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="financialreport",
+            index=models.Index(
+                fields=["sale_date", "wb_sold_product", "quantity"],
+                name="fr_sale_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="financialreport",
+            index=models.Index(
+                fields=["payment_basis", "brand", "supplier_article", "size"],
+                name="fr_basis_product_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="financialreport",
+            index=models.Index(fields=["barcode"], name="fr_barcode_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="salesanalysis",
+            index=models.Index(fields=["margin_after_tax"], name="sa_margin_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="salesanalysis",
+            index=models.Index(
+                fields=["brand", "article", "margin_percent", "margin_after_tax"],
+                name="sa_margin_percent_idx",
+            ),
+        ),
+    ]
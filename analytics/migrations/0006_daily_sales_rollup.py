@@ -0,0 +1,186 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:44
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Sum
+from django.db.models.functions import TruncDate
+
+
+# Ключ строки агрегата и суммируемые поля финотчета на момент миграции:
+# код приложения (analytics.rollups) может измениться, миграция - нет
+KEY_FIELDS = ("brand", "supplier_article", "size", "payment_basis")
+MEASURES = (
+    "wb_sold_product", "quantity", "payment_to_seller", "wb_reward",
+    "delivery_services", "acquiring_commission", "storage", "deductions",
+    "transport_compensation", "additional_payments", "total_fines",
+)
+
+
+def backfill_rollup(apps, schema_editor):
+    """Дневные итоги по уже загруженным финотчетам"""
+    FinancialReport = apps.get_model("analytics", "FinancialReport")
+    DailySalesRollup = apps.get_model("analytics", "DailySalesRollup")
+    money = DecimalField(max_digits=14, decimal_places=2)
+    sums = {
+        field: Sum(field) if field == "quantity" else Sum(field, output_field=money)
+        for field in MEASURES
+    }
+    rows = FinancialReport.objects.order_by().values(
+        *KEY_FIELDS, day=TruncDate("sale_date")
+    ).annotate(report_count=Count("pk"), **sums)
+
+    batch = []
+    for row in rows.iterator():
+        for field in MEASURES:
+            if row[field] is None:
+                row[field] = 0
+        batch.append(DailySalesRollup(**row))
+        if len(batch) >= 1000:
+            DailySalesRollup.objects.bulk_create(batch)
+            batch = []
+    DailySalesRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0005_dashboard_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySalesRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День продажи")),
+                ("brand", models.CharField(max_length=255, verbose_name="Бренд")),
+                (
+                    "supplier_article",
+                    models.CharField(max_length=255, verbose_name="Артикул поставщика"),
+                ),
+                ("size", models.CharField(max_length=100, verbose_name="Размер")),
+                (
+                    "payment_basis",
+                    models.CharField(
+                        max_length=255, verbose_name="Обоснование для оплаты"
+                    ),
+                ),
+                (
+                    "report_count",
+                    models.IntegerField(default=0, verbose_name="Строк финотчета"),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="Кол-во")),
+                (
+                    "wb_sold_product",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Вайлдберриз реализовал Товар (Пр)",
+                    ),
+                ),
+                (
+                    "payment_to_seller",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="К перечислению Продавцу",
+                    ),
+                ),
+                (
+                    "wb_reward",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Вознаграждение Вайлдберриз (ВВ), без НДС",
+                    ),
+                ),
+                (
+                    "delivery_services",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Логистика",
+                    ),
+                ),
+                (
+                    "acquiring_commission",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Эквайринг",
+                    ),
+                ),
+                (
+                    "storage",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Хранение",
+                    ),
+                ),
+                (
+                    "deductions",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Удержания",
+                    ),
+                ),
+                (
+                    "transport_compensation",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Возмещение издержек по перевозке",
+                    ),
+                ),
+                (
+                    "additional_payments",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Доплаты",
+                    ),
+                ),
+                (
+                    "total_fines",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Штрафы",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Дневные итоги продаж",
+                "verbose_name_plural": "Дневные итоги продаж",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "wb_sold_product", "quantity"],
+                        name="rollup_day_idx",
+                    )
+                ],
+                "unique_together": {
+                    ("day", "brand", "supplier_article", "size", "payment_basis")
+                },
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0006_daily_sales_rollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="financialreport",
+            index=models.Index(fields=["sale_date", "id"], name="fr_keyset_idx"),
+        ),
+    ]
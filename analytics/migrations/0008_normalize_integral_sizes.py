@@ -0,0 +1,122 @@
+import hashlib
+from datetime import timezone
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Length, Left
+
+
+# Модель -> поле размера, по которому сопоставляются листы
+SIZE_FIELDS = (
+    ("Nomenclature", "size"),
+    ("FinancialReport", "size"),
+    ("StockBalance", "item_size"),
+    ("SalesAnalysis", "size"),
+    ("DailySalesRollup", "size"),
+)
+
+INTEGRAL_SIZE = r"^-?[0-9]+\.0$"
+
+# Суммируемые поля дневных итогов на момент миграции
+ROLLUP_MEASURES = (
+    "report_count", "wb_sold_product", "quantity", "payment_to_seller", "wb_reward",
+    "delivery_services", "acquiring_commission", "storage", "deductions",
+    "transport_compensation", "additional_payments", "total_fines",
+)
+
+BATCH_SIZE = 1000
+
+
+def without_suffix(expression):
+    return Left(expression, Length(expression) - 2)
+
+
+def stored_text(field, value):
+    """Значение поля в виде, в каком его вернет база (копия analytics.importers.stored_text)"""
+    if value is None:
+        return ""
+    field_type = field.get_internal_type()
+    if field_type == "DecimalField":
+        return str(Decimal(value).quantize(Decimal(1).scaleb(-field.decimal_places)) + 0)
+    if field_type == "DateTimeField":
+        return value.astimezone(timezone.utc).isoformat()
+    return str(value)
+
+
+def strip_integral_suffix(apps, schema_editor):
+    """
+    Размеры '42.0', записанные прежним импортом из числовых столбцов, - в '42',
+    как их теперь пишет импорт: по одному UPDATE на модель. Строка, которая
+    совпала бы с уже существующей по уникальному ключу, не меняется.
+    """
+    for model_name, field in SIZE_FIELDS:
+        model = apps.get_model("analytics", model_name)
+        queryset = model.objects.filter(**{f"{field}__regex": INTEGRAL_SIZE})
+        for fields in model._meta.unique_together:
+            if field not in fields:
+                continue
+            queryset = queryset.exclude(Exists(model.objects.filter(**{
+                name: without_suffix(OuterRef(name)) if name == field else OuterRef(name)
+                for name in fields
+            })))
+        queryset.update(**{field: without_suffix(F(field))})
+
+
+def merge_rollup_duplicates(apps, schema_editor):
+    """
+    Дневные итоги '42.0', для которых уже есть строка '42' того же дня и
+    товара, прибавляются к ней: финотчеты обоих размеров теперь записаны как '42'
+    """
+    DailySalesRollup = apps.get_model("analytics", "DailySalesRollup")
+    key_fields = ("day", "brand", "supplier_article", "payment_basis")
+    for row in list(DailySalesRollup.objects.filter(size__regex=INTEGRAL_SIZE)):
+        target = DailySalesRollup.objects.filter(
+            size=row.size[:-2], **{name: getattr(row, name) for name in key_fields}
+        ).first()
+        if target is None:
+            continue
+        for name in ROLLUP_MEASURES:
+            setattr(target, name, getattr(target, name) + getattr(row, name))
+        target.save(update_fields=ROLLUP_MEASURES)
+        row.delete()
+
+
+def rehash_financial_reports(apps, schema_editor):
+    """
+    Хеш содержимого финотчетов заново: изменились размеры, а хеш теперь
+    считается по значениям в том виде, в каком их хранит база. Иначе
+    следующая инкрементальная загрузка перезаписала бы все строки.
+    """
+    FinancialReport = apps.get_model("analytics", "FinancialReport")
+    # Столбцы листа финотчетов в порядке импорта (analytics.importers.FINANCIAL_REPORTS_SHEET)
+    fields = [
+        field for field in FinancialReport._meta.concrete_fields
+        if not field.primary_key and field.editable
+    ]
+    names = [field.name for field in fields]
+
+    batch = []
+    for row in FinancialReport.objects.only("pk", "content_hash", *names).iterator(chunk_size=BATCH_SIZE):
+        parts = [stored_text(field, getattr(row, field.name)) for field in fields]
+        content_hash = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+        if row.content_hash != content_hash:
+            row.content_hash = content_hash
+            batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            FinancialReport.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    FinancialReport.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0007_financial_report_keyset_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_integral_suffix, migrations.RunPython.noop),
+        migrations.RunPython(merge_rollup_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(rehash_financial_reports, migrations.RunPython.noop),
+    ]
@@ -15,6 +15,7 @@ class Nomenclature(models.Model):
     equipment = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Комплектация")
     composition = models.TextField(blank=True, null=True, verbose_name="Состав")
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Себестоимость")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Изменено")
     
     class Meta:
         verbose_name = "Номенклатура"
@@ -92,14 +93,78 @@ class FinancialReport(models.Model):
     chrt_id = models.CharField(max_length=255, default='', verbose_name="chrtId")
     warehouse_coefficient = models.CharField(max_length=255, default='', verbose_name="Фиксированный коэффициент склада по поставке")
     
+    # Хеш содержимого строки для инкрементальной загрузки
+    content_hash = models.CharField(max_length=40, default='', editable=False, verbose_name="Хеш содержимого строки")
+    
+    # Естественный ключ строки отчета WB
+    NATURAL_KEY = ('srid', 'payment_basis', 'number')
+    
     class Meta:
         verbose_name = "Финансовый отчет"
         verbose_name_plural = "Финансовые отчеты"
+        indexes = [
+            # Строки за дни и период: пересчет дневных агрегатов, сборка анализа продаж
+            models.Index(fields=['sale_date', 'wb_sold_product', 'quantity'], name='fr_sale_date_idx'),
+            # Группировка финотчетов по товару при сборке анализа продаж
+            models.Index(fields=['payment_basis', 'brand', 'supplier_article', 'size'], name='fr_basis_product_idx'),
+            models.Index(fields=['barcode'], name='fr_barcode_idx'),
+            # Страницы списка по ключу (sale_date, id)
+            models.Index(fields=['sale_date', 'id'], name='fr_keyset_idx'),
+            # Естественный ключ инкрементальной загрузки
+            models.Index(fields=['srid', 'payment_basis', 'number'], name='fr_natural_key_idx'),
+        ]
     
     def __str__(self):
         return f"{self.brand} - {self.supplier_article} - {self.sale_date}"
 
 
+class DailySalesRollup(models.Model):
+    """
+    Дневные итоги финотчетов по товару и обоснованию для оплаты.
+    
+    Поддерживаются импортом и записью через API (пересчитываются только
+    затронутые дни), поэтому графики и итоги дашборда читают число дней
+    и товаров, а не число строк отчетов.
+    """
+    day = models.DateField(verbose_name="День продажи")
+    brand = models.CharField(max_length=255, verbose_name="Бренд")
+    supplier_article = models.CharField(max_length=255, verbose_name="Артикул поставщика")
+    size = models.CharField(max_length=100, verbose_name="Размер")
+    payment_basis = models.CharField(max_length=255, verbose_name="Обоснование для оплаты")
+    report_count = models.IntegerField(default=0, verbose_name="Строк финотчета")
+    quantity = models.IntegerField(default=0, verbose_name="Кол-во")
+    wb_sold_product = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Вайлдберриз реализовал Товар (Пр)")
+    payment_to_seller = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="К перечислению Продавцу")
+    wb_reward = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Вознаграждение Вайлдберриз (ВВ), без НДС")
+    delivery_services = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Логистика")
+    acquiring_commission = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Эквайринг")
+    storage = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Хранение")
+    deductions = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Удержания")
+    transport_compensation = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Возмещение издержек по перевозке")
+    additional_payments = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Доплаты")
+    total_fines = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Штрафы")
+    
+    # Ключ строки агрегата и суммируемые поля финотчета
+    KEY_FIELDS = ('brand', 'supplier_article', 'size', 'payment_basis')
+    MEASURES = (
+        'wb_sold_product', 'quantity', 'payment_to_seller', 'wb_reward',
+        'delivery_services', 'acquiring_commission', 'storage', 'deductions',
+        'transport_compensation', 'additional_payments', 'total_fines',
+    )
+    
+    class Meta:
+        verbose_name = "Дневные итоги продаж"
+        verbose_name_plural = "Дневные итоги продаж"
+        unique_together = ['day', 'brand', 'supplier_article', 'size', 'payment_basis']
+        indexes = [
+            # Продажи по дням на дашборде: покрывающий индекс, таблица не читается
+            models.Index(fields=['day', 'wb_sold_product', 'quantity'], name='rollup_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} - {self.brand} - {self.supplier_article}"
+
+
 class StockBalance(models.Model):
     """Модель для листа 'Остатки (вставить)'"""
     brand = models.CharField(max_length=255, verbose_name="Бренд")
@@ -109,6 +174,7 @@ class StockBalance(models.Model):
     in_transit_to_client = models.IntegerField(verbose_name="В пути до клиента")
     in_transit_from_client = models.IntegerField(verbose_name="В пути от клиента")
     total_in_warehouses = models.IntegerField(verbose_name="Итого по складам")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Изменено")
     
     class Meta:
         verbose_name = "Остаток на складе"
@@ -191,10 +257,23 @@ class SalesAnalysis(models.Model):
     # Деньги в товаре
     money_in_goods = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Деньги в товаре")
     
+    # Отслеживание изменений для инкрементального пересчета: строка требует
+    # пересчета, если она изменена (is_dirty) или ее номенклатура/остатки
+    # изменились позже последнего расчета (calculated_at)
+    is_dirty = models.BooleanField(default=True, db_index=True, editable=False, verbose_name="Требует пересчета")
+    calculated_at = models.DateTimeField(blank=True, null=True, editable=False, verbose_name="Пересчитано")
+    
     class Meta:
         verbose_name = "Анализ продаж"
         verbose_name_plural = "Анализ продаж"
         unique_together = ['brand', 'article', 'size']
+        indexes = [
+            # Топ товаров по марже на дашборде
+            models.Index(fields=['margin_after_tax'], name='sa_margin_idx'),
+            # Маржинальность по товарам на графике: группировка по товару
+            # и фильтр по марже без чтения таблицы (покрывающий индекс)
+            models.Index(fields=['brand', 'article', 'margin_percent', 'margin_after_tax'], name='sa_margin_percent_idx'),
+        ]
     
     def __str__(self):
         return f"{self.brand} - {self.article} - {self.size}"
@@ -0,0 +1,82 @@
+"""
+Пагинация API
+
+Размер страницы задается параметром page_size, как и в статическом режиме
+(analytics.static_query), чтобы оба режима понимали одинаковые запросы.
+
+Запрос с параметром cursor переключает список на страницы по ключу
+(keyset): вместо OFFSET выбираются записи строго после ключа последней
+записи предыдущей страницы, поэтому глубокие страницы стоят столько же,
+сколько первая. Общее число записей (COUNT) считается только по ?count=1.
+"""
+
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from analytics.static_query import (
+    CURSOR_PARAM, MAX_PAGE_SIZE, PAGE_SIZE, decode_cursor, encode_cursor,
+    page_size_param, wants_count
+)
+
+
+class PageSizePagination(PageNumberPagination):
+    """Постраничный вывод с размером страницы из запроса"""
+    page_size = PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+def keyset_filter(fields, values):
+    """
+    Условие "ключ строго больше values" для полей fields:
+    (a > x) OR (a = x AND b > y) ..., плюс a >= x для поиска по индексу
+    """
+    conditions = []
+    for index, field in enumerate(fields):
+        equal = {name: value for name, value in zip(fields[:index], values[:index])}
+        conditions.append(Q(**equal, **{f'{field}__gt': values[index]}))
+    return Q(**{f'{fields[0]}__gte': values[0]}) & reduce(or_, conditions)
+
+
+def keyset_payload(request, count, next_key, results):
+    """Ответ страницы по ключу; count только если он запрошен"""
+    next_url = None
+    if next_key is not None:
+        next_url = replace_query_param(request.build_absolute_uri(), CURSOR_PARAM, encode_cursor(next_key))
+    payload = {'next': next_url, 'results': results}
+    if count is not None:
+        payload = {'count': count, **payload}
+    return payload
+
+
+class KeysetPagination(BasePagination):
+    """Страницы по возрастанию ключа fields с непрозрачным курсором"""
+
+    def __init__(self, fields=('id',)):
+        self.fields = tuple(fields)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = page_size_param(request.query_params)
+        after = decode_cursor(request.query_params.get(CURSOR_PARAM), len(self.fields))
+
+        self.count = queryset.count() if wants_count(request.query_params) else None
+        queryset = queryset.order_by(*self.fields)
+        if after is not None:
+            queryset = queryset.filter(keyset_filter(self.fields, after))
+
+        # Лишняя запись показывает, есть ли следующая страница, без COUNT
+        page = list(queryset[:page_size + 1])
+        self.next_key = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_key = [getattr(page[-1], field) for field in self.fields]
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(keyset_payload(self.request, self.count, self.next_key, data))
@@ -0,0 +1,60 @@
+"""
+Колоночное представление списков (?format=columnar)
+
+Вместо массива объектов с повторяющимися именами полей отдаются имена
+столбцов один раз и значения параллельными массивами. Строковые столбцы
+с повторами (бренд, предмет, склад) кодируются словарем: уникальные
+значения и номера в нем.
+
+    {"columns": ["id", "brand"], "count": 2,
+     "values": [[1, 2], {"dictionary": ["Nike"], "codes": [0, 0]}]}
+
+Постраничный ответ сохраняет count/next/previous, а results заменяется
+колоночным видом. Ответы, не являющиеся списком строк (ошибки, одиночные
+объекты), отдаются обычным JSON.
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+
+def dictionary_encode(values):
+    """Словарь и коды для строкового столбца или None, если кодирование невыгодно"""
+    codes = []
+    positions = {}
+    for value in values:
+        if value is not None and not isinstance(value, str):
+            return None
+        code = positions.get(value)
+        if code is None:
+            code = positions[value] = len(positions)
+        codes.append(code)
+    # Кодирование окупается, только если значения повторяются
+    if len(positions) * 2 > len(values):
+        return None
+    return {'dictionary': list(positions), 'codes': codes}
+
+
+def to_columnar(rows):
+    """Колоночный вид списка словарей с одинаковыми ключами"""
+    columns = list(rows[0]) if rows else []
+    values = []
+    for column in columns:
+        column_values = [row.get(column) for row in rows]
+        values.append(dictionary_encode(column_values) or column_values)
+    return {'columns': columns, 'count': len(rows), 'values': values}
+
+
+def is_row_list(data):
+    return isinstance(data, list) and all(isinstance(row, dict) for row in data)
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON со списком строк в колоночном виде; включается параметром ?format=columnar"""
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if is_row_list(data):
+            data = to_columnar(data)
+        elif isinstance(data, dict) and is_row_list(data.get('results')):
+            data = dict(data, results=to_columnar(data['results']))
+        return super().render(data, accepted_media_type, renderer_context)
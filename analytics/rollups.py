@@ -0,0 +1,101 @@
+"""
+Дневные итоги финотчетов (DailySalesRollup)
+
+Строки финотчетов группируются по дню продажи (в часовом поясе проекта),
+товару и обоснованию для оплаты. После импорта или записи через API
+пересчитываются только затронутые дни: строки агрегата за эти дни
+удаляются и собираются заново одним сгруппированным запросом по индексу
+на sale_date. Поэтому графики и итоги дашборда читают агрегат, размер
+которого зависит от числа дней и товаров, а не от числа строк отчетов.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from analytics.models import DailySalesRollup, FinancialReport
+
+
+# Дней в одном запросе пересчета (условие OR по диапазонам sale_date)
+DAYS_PER_QUERY = 100
+
+
+def sale_day(value):
+    """День продажи для даты-времени строки финотчета"""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def day_range(day):
+    """Условие на sale_date для одного дня: полуинтервал, чтобы работал индекс"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return Q(sale_date__gte=start, sale_date__lt=end)
+
+
+def rollup_rows(queryset):
+    """Строки агрегата для выборки финотчетов (словари полей DailySalesRollup)"""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    sums = {
+        field: Sum(field) if field == 'quantity' else Sum(field, output_field=money)
+        for field in DailySalesRollup.MEASURES
+    }
+    rows = queryset.order_by().values(
+        *DailySalesRollup.KEY_FIELDS, day=TruncDate('sale_date')
+    ).annotate(report_count=Count('pk'), **sums)
+    for row in rows.iterator():
+        for field in DailySalesRollup.MEASURES:
+            if row[field] is None:
+                row[field] = 0
+        yield row
+
+
+class DailySalesRollupService:
+    """Поддержание дневных итогов в соответствии с финотчетами"""
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def insert(queryset):
+        """Запись агрегата для выборки финотчетов пачками. Возвращает число строк"""
+        batch, count = [], 0
+        for row in rollup_rows(queryset):
+            batch.append(DailySalesRollup(**row))
+            if len(batch) >= DailySalesRollupService.BATCH_SIZE:
+                DailySalesRollup.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        DailySalesRollup.objects.bulk_create(batch)
+        return count + len(batch)
+
+    @staticmethod
+    def refresh_days(days):
+        """Пересчет агрегата только за переданные дни. Возвращает число строк агрегата"""
+        days = sorted(set(days))
+        count = 0
+        with transaction.atomic():
+            for start in range(0, len(days), DAYS_PER_QUERY):
+                chunk = days[start:start + DAYS_PER_QUERY]
+                DailySalesRollup.objects.filter(day__in=chunk).delete()
+                condition = Q()
+                for day in chunk:
+                    condition |= day_range(day)
+                count += DailySalesRollupService.insert(FinancialReport.objects.filter(condition))
+        return count
+
+    @staticmethod
+    def refresh_dates(values):
+        """Пересчет дней, к которым относятся переданные даты продажи (None пропускаются)"""
+        days = {sale_day(value) for value in values if value is not None}
+        return DailySalesRollupService.refresh_days(days) if days else 0
+
+    @staticmethod
+    def rebuild():
+        """Полная пересборка агрегата по всем финотчетам"""
+        with transaction.atomic():
+            DailySalesRollup.objects.all().delete()
+            return DailySalesRollupService.insert(FinancialReport.objects.all())
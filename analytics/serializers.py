@@ -5,37 +5,74 @@ from analytics.models import (
 )
 
 
-class NomenclatureSerializer(serializers.ModelSerializer):
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(request, available):
+    """
+    Поля из параметра ?fields=a,b в порядке запроса; None - все поля.
+    Неизвестное поле - ошибка 400
+    """
+    value = request.query_params.get(FIELDS_PARAM) if request is not None else None
+    return parse_fields(value, available)
+
+
+def parse_fields(value, available):
+    """Разбор списка полей a,b из строки; None - все поля"""
+    if not value:
+        return None
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise serializers.ValidationError({FIELDS_PARAM: f"Неизвестные поля: {', '.join(unknown)}"})
+    return fields or None
+
+
+class SparseFieldsetMixin:
+    """Сериализатор только с полями из ?fields= запроса на чтение, если он передан"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        fields = requested_fields(request, self.fields)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class NomenclatureSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Nomenclature
         fields = '__all__'
 
 
-class FinancialReportSerializer(serializers.ModelSerializer):
+class FinancialReportSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = FinancialReport
         fields = '__all__'
 
 
-class StockBalanceSerializer(serializers.ModelSerializer):
+class StockBalanceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = StockBalance
         fields = '__all__'
 
 
-class SalesAnalysisSerializer(serializers.ModelSerializer):
+class SalesAnalysisSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = SalesAnalysis
         fields = '__all__'
 
 
-class SummaryDataSerializer(serializers.ModelSerializer):
+class SummaryDataSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = SummaryData
         fields = '__all__'
 
 
-class PurchasePlanSerializer(serializers.ModelSerializer):
+class PurchasePlanSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = PurchasePlan
         fields = '__all__'
@@ -1,15 +1,27 @@
 from decimal import Decimal, ROUND_HALF_UP
-from django.db.models import Sum, Count, Avg
+from django.conf import settings
+from django.db.models import Sum, Count, Avg, Exists, OuterRef, Q
+from django.utils import timezone
 from analytics.models import (
     SalesAnalysis, FinancialReport, Nomenclature, 
     StockBalance, SummaryData, PurchasePlan
 )
 from analytics.excel_formulas import ExcelFormulasService
+from analytics.engines import (
+    DatabaseSalesAnalysisEngine, FixedPointSalesAnalysisEngine,
+    VectorizedSalesAnalysisEngine, update_shares,
+)
+from analytics.builders import SalesAnalysisBuilder, normalize_size
+from analytics.db_utils import bulk_update_rows
+from analytics import cache
 
 
 class CalculationService:
     """Сервис для выполнения всех расчетов из Excel файла"""
     
+    # Доступные движки пересчета анализа продаж
+    BACKENDS = ('python', 'vectorized', 'database', 'fixed_point')
+    
     @staticmethod
     def safe_divide(numerator, denominator, default=0):
         """Безопасное деление с обработкой ошибок"""
@@ -18,10 +30,30 @@ class CalculationService:
         return Decimal(str(numerator)) / Decimal(str(denominator))
     
     @staticmethod
-    def calculate_sales_analysis():
-        """Пересчет всех показателей анализа продаж"""
+    def calculate_sales_analysis(backend=None):
+        """Пересчет всех показателей анализа продаж выбранным движком"""
+        backend = backend or settings.CALCULATION_BACKEND
+        
+        if backend == 'python':
+            return CalculationService.calculate_sales_analysis_per_row()
+        if backend == 'vectorized':
+            return VectorizedSalesAnalysisEngine.run()
+        if backend == 'database':
+            return DatabaseSalesAnalysisEngine.run()
+        if backend == 'fixed_point':
+            return FixedPointSalesAnalysisEngine.run()
+        
+        raise ValueError(
+            f"Неизвестный движок пересчета: {backend}. "
+            f"Доступные: {', '.join(CalculationService.BACKENDS)}"
+        )
+    
+    @staticmethod
+    def calculate_sales_analysis_per_row(queryset=None):
+        """Построчный пересчет всех показателей анализа продаж"""
         # Получаем все записи анализа продаж
-        sales_records = SalesAnalysis.objects.all()
+        sales_records = SalesAnalysis.objects.all() if queryset is None else queryset
+        calculated_at = timezone.now()
         
         for record in sales_records:
             # Расчет процента выкупа
@@ -107,106 +139,143 @@ class CalculationService:
             # Расчет денег в товаре
             record.money_in_goods = record.cost_per_unit * record.total_stock_wb
             
+            record.is_dirty = False
+            record.calculated_at = calculated_at
             record.save()
     
     @staticmethod
-    def calculate_summary_data():
-        """Расчет сводных данных используя ВСЕ формулы из Excel файла"""
+    def _reference_changed(model, size_field):
+        """Подзапрос: строка справочника по ключу записи изменена после ее расчета"""
+        return Exists(
+            model.objects.filter(
+                **{size_field: OuterRef('size')},
+                brand=OuterRef('brand'),
+                supplier_article=OuterRef('article'),
+                updated_at__gt=OuterRef('calculated_at'),
+            )
+        )
+    
+    @staticmethod
+    def changed_sales_analysis():
+        """
+        Записи анализа продаж, требующие пересчета: помеченные is_dirty,
+        еще не рассчитанные и те, чья номенклатура или остатки изменились
+        после расчета
+        """
+        return SalesAnalysis.objects.annotate(
+            nomenclature_changed=CalculationService._reference_changed(Nomenclature, 'size'),
+            stock_changed=CalculationService._reference_changed(StockBalance, 'item_size'),
+        ).filter(
+            Q(is_dirty=True) | Q(calculated_at__isnull=True)
+            | Q(nomenclature_changed=True) | Q(stock_changed=True)
+        )
+    
+    @staticmethod
+    def refresh_reference_fields(queryset):
+        """
+        Перенос себестоимости и остатков из измененных справочников в записи.
+        Возвращает число записей в выборке.
+        """
+        cost_prices, stocks = SalesAnalysisBuilder.reference_data()
+        stock_fields = ('in_transit_to_client', 'in_transit_from_client', 'in_warehouses', 'total_stock_wb')
+        
+        count = 0
+        cost_rows = []
+        stock_rows = []
+        for pk, brand, article, size, nomenclature_changed, stock_changed in queryset.values_list(
+            'pk', 'brand', 'article', 'size', 'nomenclature_changed', 'stock_changed'
+        ):
+            count += 1
+            key = (brand, article, normalize_size(size))
+            if nomenclature_changed and key in cost_prices:
+                cost_rows.append((pk, [cost_prices[key]]))
+            if stock_changed and key in stocks:
+                stock = stocks[key]
+                to_client = stock['in_transit_to_client']
+                from_client = stock['in_transit_from_client']
+                in_warehouses = stock['total_in_warehouses']
+                stock_rows.append((pk, [
+                    to_client, from_client, in_warehouses,
+                    to_client + from_client + in_warehouses,
+                ]))
         
-        # Используем новые формулы из Excel файла
-        all_formulas = ExcelFormulasService.calculate_all_formulas()
+        bulk_update_rows(SalesAnalysis, ('cost_per_unit',), cost_rows)
+        bulk_update_rows(SalesAnalysis, stock_fields, stock_rows)
+        return count
+    
+    @staticmethod
+    def calculate_sales_analysis_changed(backend=None):
+        """
+        Инкрементальный пересчет: пересчитываются только измененные записи,
+        затем доли выручки и маржи всех записей обновляются одним UPDATE.
+        Возвращает число пересчитанных записей.
+        """
+        backend = backend or settings.CALCULATION_BACKEND
+        if backend not in CalculationService.BACKENDS:
+            raise ValueError(
+                f"Неизвестный движок пересчета: {backend}. "
+                f"Доступные: {', '.join(CalculationService.BACKENDS)}"
+            )
         
-        # Получаем данные из формул листа "Сводный"
-        svodny = all_formulas['svodny']
+        # Перенос справочников не меняет calculated_at, поэтому та же
+        # выборка остается актуальной и для самого пересчета
+        changed = CalculationService.changed_sales_analysis()
+        count = CalculationService.refresh_reference_fields(changed)
+        if not count:
+            return 0
         
-        # Получаем данные из формул листа "Анализ продаж"
-        analysis = all_formulas['analysis']
+        # Доли зависят от итогов всей таблицы: движки их для выборки не пишут,
+        # они пересчитываются ниже по итогам после пересчета
+        if backend == 'python':
+            CalculationService.calculate_sales_analysis_per_row(changed)
+        elif backend == 'database':
+            DatabaseSalesAnalysisEngine.run(changed)
+        elif backend == 'fixed_point':
+            FixedPointSalesAnalysisEngine.run(changed, shares=False)
+        else:
+            VectorizedSalesAnalysisEngine.run(changed, shares=False)
         
-        # Создаем или обновляем запись сводных данных
-        summary_data, created = SummaryData.objects.get_or_create(
-            id=1,
-            defaults={
-                'sales_minus_returns_count': svodny['c3'],  # C3: ='Анализ продаж'!O3
-                'purchase_percentage': analysis['p3'],  # P3: =IFERROR(O3/K3, )
-                'average_check_after_spp': analysis['z3'],  # Z3: =IFERROR(Y3/S3, )
-                'commission_per_unit': svodny['c5'],  # C5: =IFERROR(F17/C3, )
-                'logistics_per_unit': svodny['c6'],  # C6: =IFERROR(F3/C3, )
-                'storage_per_unit': Decimal('0'),  # Пока нет данных о хранении
-                'sold_goods_cost': svodny['f20'],  # F20: ='Анализ продаж'!AL3
-                'average_cost_per_unit': svodny['c7'],  # C7: =IFERROR(F4/C3, )
-                'average_margin_per_unit': svodny['c8'],  # C8: =IFERROR(F5/C3, )
-                'margin_without_ads': svodny['c9'],  # C9: ='Анализ продаж'!AJ3
-                'margin_per_unit_without_ads': svodny['c10'],  # C10: =IFERROR(C9/C3, )
-                'margin_after_all_expenses': svodny['c14'],  # C14: =F19-C9-F20
-                'total_commission': svodny['f17'],  # F17: ='Анализ продаж'!T3
-                'commission_percent': svodny['c16'],  # C16: =IFERROR(C14/F17, )
-                'total_logistics': svodny['f18'],  # F18: ='Анализ продаж'!U3+F12+F13
-                'logistics_percent': svodny['c17'],  # C17: =IFERROR( C14/F18, )
-                'total_storage': Decimal('0'),
-                'storage_percent': Decimal('0'),
-                'additional_payments': svodny['f13'],  # F13: ='Анализ продаж'!AF3
-                'fines': Decimal('0'),  # Пока нет данных о штрафах
-                'paid_reception': Decimal('0'),  # Пока нет данных о платной приемке
-                'advertising_deductions': Decimal('0'),  # Пока нет данных о рекламе
-                'advertising_percent': Decimal('0'),
-                'transit_deductions': Decimal('0'),  # Пока нет данных о транзите
-                'acquiring': svodny['f11'],  # F11: ='Анализ продаж'!AC3
-                'defect_compensation': svodny['f12'],  # F12: Сложная формула с SUMIFS
-                'substitution_compensation': Decimal('0'),  # Пока нет данных о замене
-                'margin_percent_before_spp': svodny['c6'],  # C6: =IFERROR(F3/C3, )
-                'margin_percent_with_spp': svodny['c7'],  # C7: =IFERROR(F4/C3, )
-                'margin_percent_after_commission': svodny['c8'],  # C8: =IFERROR(F5/C3, )
-                'sales_before_spp': svodny['f3'],  # F3: ='Анализ продаж'!Y3
-                'sales_with_spp': svodny['c4'],  # C4: ='Анализ продаж'!P3
-                'sales_minus_commission': svodny['f16'],  # F16: ='Анализ продаж'!S3
-                'payment_to_account': svodny['f19'],  # F19: =F16-F3-F4-F5+F6-F7-F8-F9-F10+F12+F13
-                'tax_6_percent': svodny['c14'] * Decimal('0.06'),  # НДС 6% от маржи
-            }
+        totals = SalesAnalysis.objects.aggregate(
+            revenue=Sum('sales_minus_commission'),
+            margin=Sum('margin_after_tax'),
         )
+        update_shares(totals['revenue'], totals['margin'])
+        return count
+    
+    @staticmethod
+    def build_summary_values():
+        """
+        Значения полей сводных данных по ВСЕМ формулам из Excel файла.
+        В базу ничего не записывается.
+        """
         
-        if not created:
-            # Обновляем существующую запись
-            summary_data.sales_minus_returns_count = svodny['c3']
-            summary_data.purchase_percentage = analysis['p3']
-            summary_data.average_check_after_spp = analysis['z3']
-            summary_data.commission_per_unit = svodny['c5']
-            summary_data.logistics_per_unit = svodny['c6']
-            summary_data.storage_per_unit = Decimal('0')
-            summary_data.sold_goods_cost = svodny['f20']
-            summary_data.average_cost_per_unit = svodny['c7']
-            summary_data.average_margin_per_unit = svodny['c8']
-            summary_data.margin_without_ads = svodny['c9']
-            summary_data.margin_per_unit_without_ads = svodny['c10']
-            summary_data.margin_after_all_expenses = svodny['c14']
-            summary_data.total_commission = svodny['f17']
-            summary_data.commission_percent = svodny['c16']
-            summary_data.total_logistics = svodny['f18']
-            summary_data.logistics_percent = svodny['c17']
-            summary_data.total_storage = Decimal('0')
-            summary_data.storage_percent = Decimal('0')
-            summary_data.additional_payments = svodny['f13']
-            summary_data.fines = Decimal('0')
-            summary_data.paid_reception = Decimal('0')
-            summary_data.advertising_deductions = Decimal('0')
-            summary_data.advertising_percent = Decimal('0')
-            summary_data.transit_deductions = Decimal('0')
-            summary_data.acquiring = svodny['f11']
-            summary_data.defect_compensation = svodny['f12']
-            summary_data.substitution_compensation = Decimal('0')
-            summary_data.margin_percent_before_spp = svodny['c6']
-            summary_data.margin_percent_with_spp = svodny['c7']
-            summary_data.margin_percent_after_commission = svodny['c8']
-            summary_data.sales_before_spp = svodny['f3']
-            summary_data.sales_with_spp = svodny['c4']
-            summary_data.sales_minus_commission = svodny['f16']
-            summary_data.payment_to_account = svodny['f19']
-            summary_data.tax_6_percent = svodny['c14'] * Decimal('0.06')
-            summary_data.save()
+        # Поля объявлены вместе с формулами листов в analytics.excel_formulas
+        return ExcelFormulasService.calculate_all_formulas()['summary']
+    
+    @staticmethod
+    def calculate_summary_data():
+        """Расчет сводных данных используя ВСЕ формулы из Excel файла"""
         
+        # Создаем или обновляем запись сводных данных без чтения старой записи
+        values = CalculationService.build_summary_values()
+        summary_data = SummaryData(id=1, **values)
+        if not SummaryData.objects.filter(id=1).update(**values):
+            summary_data.save(force_insert=True)
+        
+        # Кешированные обзоры дашборда построены по старым данным
+        cache.invalidate()
         return summary_data
     
     @staticmethod
-    def recalculate_all():
+    def recalculate_all(backend=None):
         """Пересчет всех данных"""
-        CalculationService.calculate_sales_analysis()
-        CalculationService.calculate_summary_data()
\ No newline at end of file
+        CalculationService.calculate_sales_analysis(backend=backend)
+        CalculationService.calculate_summary_data()
+    
+    @staticmethod
+    def recalculate_changed(backend=None):
+        """Пересчет только измененных записей и сводных данных"""
+        count = CalculationService.calculate_sales_analysis_changed(backend=backend)
+        if count:
+            CalculationService.calculate_summary_data()
+        return count
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Хранилище статических данных из static/data/
+
+Каждый JSON-файл разбирается один раз на процесс: хранятся разобранный
+объект и готовые байты ответа. Файл перечитывается, только если изменились
+его время модификации или размер. Счетчики попаданий и промахов помогают
+проверить, что запросы обслуживаются без разбора файлов.
+
+Индексы для фильтрации (analytics.static_query) строятся при первом
+запросе с фильтрами и живут, пока не изменится файл.
+
+Сжатые варианты ответа (.json.gz, .json.br) готовит команда
+compress_static_data; если файла варианта нет или он старше исходного,
+gzip-вариант сжимается в памяти при загрузке.
+"""
+
+import gzip
+import json
+import os
+import threading
+
+from django.conf import settings
+
+from analytics.static_query import StaticDataset
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+
+# Варианты сжатия в порядке предпочтения: кодировка -> расширение файла
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(content, encoding):
+    """Сжатие байтов ответа; None, если кодировка недоступна"""
+    if encoding == 'gzip':
+        # mtime=0: одинаковые данные дают одинаковые байты
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(content, quality=11)
+    return None
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, разрешенные клиентом (q > 0)"""
+    accepted = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    """
+    Загруженный файл: подпись (mtime, размер), данные, байты ответа, их
+    сжатые варианты и производные от данных (индексы, другие представления),
+    которые строятся по требованию и живут, пока не изменится файл
+    """
+
+    __slots__ = ('signature', 'data', 'content', 'variants', 'derived')
+
+    def __init__(self, signature, data, content, variants):
+        self.signature = signature
+        self.data = data
+        self.content = content
+        self.variants = variants
+        self.derived = {}
+
+
+class StaticDataStore:
+    """Кеш разобранных JSON-файлов с проверкой изменений по mtime и размеру"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    @staticmethod
+    def serialize(data):
+        """Байты ответа в том же виде, что отдает JSONRenderer DRF"""
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def file_signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_variants(self, path, signature, content):
+        """Сжатые варианты: свежие файлы с диска, иначе gzip в памяти"""
+        variants = {}
+        for encoding, suffix in ENCODINGS:
+            variant_signature = self.file_signature(path + suffix)
+            if variant_signature is not None and variant_signature[0] >= signature[0]:
+                with open(path + suffix, 'rb') as f:
+                    variants[encoding] = f.read()
+        if 'gzip' not in variants:
+            variants['gzip'] = compress(content, 'gzip')
+        return variants
+
+    def load(self, filename):
+        """Файл из кеша или с диска, если он или его сжатые варианты изменились"""
+        path = self.path(filename)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size) + tuple(
+            self.file_signature(path + suffix) for _, suffix in ENCODINGS
+        )
+
+        cached = self.files.get(filename)
+        if cached is not None and cached.signature == signature:
+            self.hits += 1
+            return cached
+
+        with self.lock:
+            cached = self.files.get(filename)
+            if cached is not None and cached.signature == signature:
+                self.hits += 1
+                return cached
+
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            content = self.serialize(data)
+            cached = StaticFile(signature, data, content, self.load_variants(path, signature, content))
+            self.files[filename] = cached
+            self.misses += 1
+            return cached
+
+    def get(self, filename):
+        """Разобранные данные файла; изменять их нельзя - объект общий"""
+        return self.load(filename).data
+
+    def get_derived(self, filename, key, build):
+        """Результат build(data) для файла, один раз на версию файла и ключ"""
+        static_file = self.load(filename)
+        derived = static_file.derived
+        if key not in derived:
+            derived[key] = build(static_file.data)
+        return derived[key]
+
+    def get_dataset(self, filename, fields):
+        """Набор записей файла с индексами по полям fields"""
+        fields = tuple(fields)
+        return self.get_derived(
+            filename, ('dataset', fields),
+            lambda data: StaticDataset(data if isinstance(data, list) else [], fields),
+        )
+
+    def get_content(self, filename, accept_encoding=''):
+        """
+        Готовые байты JSON-ответа и их кодировка (None - без сжатия) с учетом
+        заголовка Accept-Encoding клиента
+        """
+        static_file = self.load(filename)
+        accepted = accepted_encodings(accept_encoding) if accept_encoding else set()
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in static_file.variants:
+                return static_file.variants[encoding], encoding
+        return static_file.content, None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'files': len(self.files)}
+
+    def clear(self):
+        with self.lock:
+            self.files.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+store = StaticDataStore(settings.STATIC_DATA_DIR)
@@ -0,0 +1,151 @@
+"""
+Выгрузка снимка базы данных в static/data/ для статического режима
+
+Таблицы читаются потоком через .values().iterator() и сериализуются полями
+тех же сериализаторов, что и API, поэтому статический ответ совпадает с
+ответом из базы. Каждый файл пишется во временный файл и переименовывается;
+если хеш содержимого не изменился, файл на диске не трогается (сохраняются
+его mtime, ETag и сжатые варианты).
+
+Десятичные значения пишутся числами, как в исходных файлах static/data/
+и в ответах API (COERCE_DECIMAL_TO_STRING = False).
+
+Планы по выкупам не выгружаются: их правят через API, и в статическом
+режиме они читаются из базы.
+"""
+
+import hashlib
+import json
+import os
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+
+from analytics import cache
+from analytics.models import (
+    DailySalesRollup, FinancialReport, Nomenclature, SalesAnalysis,
+    StockBalance, SummaryData
+)
+from analytics.serializers import (
+    FinancialReportSerializer, NomenclatureSerializer, SalesAnalysisSerializer,
+    StockBalanceSerializer, SummaryDataSerializer
+)
+from analytics.timeseries import STATIC_FILENAME as DAILY_SALES_FILENAME
+
+
+# Файл -> модель и сериализатор API
+MODEL_EXPORTS = (
+    ('nomenclature.json', Nomenclature, NomenclatureSerializer),
+    ('financial_reports.json', FinancialReport, FinancialReportSerializer),
+    ('stock_balance.json', StockBalance, StockBalanceSerializer),
+    ('sales_analysis.json', SalesAnalysis, SalesAnalysisSerializer),
+    ('summary.json', SummaryData, SummaryDataSerializer),
+)
+
+# Файл -> функция сборки агрегатов дашборда
+AGGREGATE_EXPORTS = (
+    ('dashboard_overview.json', cache.build_overview),
+    ('charts_data.json', cache.build_charts_data),
+)
+
+CHUNK_SIZE = 2000
+
+
+class StaticJSONEncoder(DjangoJSONEncoder):
+    """Decimal - числом JSON, как в ответах API; остальное - как DjangoJSONEncoder"""
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return super().default(o)
+
+
+def encode(value):
+    return json.dumps(value, ensure_ascii=False, cls=StaticJSONEncoder)
+
+
+def model_rows(model, serializer_class, chunk_size=CHUNK_SIZE):
+    """Строки таблицы в представлении API без создания объектов модели"""
+    fields = serializer_class().fields
+    names = list(fields)
+    for values in model.objects.order_by('pk').values(*names).iterator(chunk_size=chunk_size):
+        yield {
+            name: None if values[name] is None else fields[name].to_representation(values[name])
+            for name in names
+        }
+
+
+def daily_sales_rows():
+    """Продажи по дням и товарам из дневных итогов для временных рядов"""
+    rows = DailySalesRollup.objects.values('day', 'brand', 'supplier_article').annotate(
+        sales=Sum('wb_sold_product'), quantity=Sum('quantity')
+    ).order_by('day', 'brand', 'supplier_article')
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        row['sales'] = row['sales'] or 0
+        row['quantity'] = row['quantity'] or 0
+        yield row
+
+
+def array_chunks(rows):
+    """Части JSON-массива: по строке таблицы на строку файла"""
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + encode(row)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def write_atomic(path, chunks):
+    """
+    Запись частей во временный файл с подсчетом хеша. Файл заменяется
+    только при изменившемся содержимом; возвращает (изменен ли, размер).
+    """
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                digest.update(data)
+                size += len(data)
+                f.write(data)
+        if digest.hexdigest() == file_hash(path):
+            os.remove(temp_path)
+            return False, size
+        os.replace(temp_path, path)
+        return True, size
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def export_static_data(directory):
+    """Выгрузка всех таблиц и агрегатов дашборда; возвращает [(файл, изменен, размер)]"""
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    for filename, model, serializer_class in MODEL_EXPORTS:
+        rows = model_rows(model, serializer_class)
+        changed, size = write_atomic(os.path.join(directory, filename), array_chunks(rows))
+        results.append((filename, changed, size))
+    changed, size = write_atomic(os.path.join(directory, DAILY_SALES_FILENAME), array_chunks(daily_sales_rows()))
+    results.append((DAILY_SALES_FILENAME, changed, size))
+    for filename, build in AGGREGATE_EXPORTS:
+        content = json.dumps(build(), ensure_ascii=False, indent=2, cls=StaticJSONEncoder) + '\n'
+        changed, size = write_atomic(os.path.join(directory, filename), [content])
+        results.append((filename, changed, size))
+    return results
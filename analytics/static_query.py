@@ -0,0 +1,337 @@
+"""
+Запросы к статическим данным с индексами
+
+Для каждого набора данных из static/data/ строятся отсортированные индексы
+по полям фильтрации. Фильтры на равенство, префикс и диапазон находят
+границы в индексе двоичным поиском, поэтому выборка стоит O(log n) плюс
+размер результата, а не полный проход по списку.
+
+Параметры запроса одинаковы для статического режима и базы данных:
+
+    ?brand=Nike                    равенство без учета регистра
+    ?supplier_article__prefix=ts   префикс без учета регистра
+    ?sale_date__gte=2025-10-01     диапазон: __gt, __gte, __lt, __lte
+    ?sale_date=2025-10-01          весь день (для полей даты и даты-времени)
+    ?ordering=-sale_date           сортировка по индексированному полю
+    ?page=2&page_size=50           страница результата
+    ?cursor=&page_size=50&count=1  страница по ключу (keyset) с общим числом
+
+Дата без времени в фильтре поля даты-времени сравнивается с днем записи в
+часовом поясе проекта - так же, как поиск __date в базе данных. Остальные
+поля сравниваются как строки без учета регистра.
+
+Курсор непрозрачен для клиента: это значения ключа сортировки последней
+записи страницы, следующая страница начинается строго после них.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_left, bisect_right
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+OPERATORS = ('exact', 'prefix', 'gt', 'gte', 'lt', 'lte')
+
+# Поиск в Django ORM для каждого оператора
+QUERYSET_LOOKUPS = {
+    'exact': 'iexact', 'prefix': 'istartswith',
+    'gt': 'gt', 'gte': 'gte', 'lt': 'lt', 'lte': 'lte',
+}
+
+# Символ больше любого в ключах: верхняя граница префикса
+KEY_MAX = '￿'
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+CURSOR_PARAM = 'cursor'
+COUNT_PARAM = 'count'
+
+# Параметры запроса, которые не являются фильтрами
+RESERVED_PARAMS = ('ordering', 'page', 'page_size', 'format', 'fields', CURSOR_PARAM, COUNT_PARAM)
+
+
+def index_key(value):
+    """Ключ индекса: строка без учета регистра, None - пустая строка"""
+    if value is None:
+        return ''
+    return str(value).casefold()
+
+
+def parse_day(value):
+    """Дата из строки 'ГГГГ-ММ-ДД'; None, если это не дата без времени"""
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def record_day(value):
+    """День значения поля даты или даты-времени в часовом поясе проекта; None - не дата"""
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is not None:
+        if timezone.is_aware(moment):
+            moment = timezone.localtime(moment)
+        return moment.date()
+    return parse_day(value)
+
+
+def encode_cursor(values):
+    """Курсор из значений ключа последней записи страницы"""
+    # Даты без усечения микросекунд, иначе равенство по ключу не сработает
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    data = json.dumps(values, separators=(',', ':'))
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Значения ключа из курсора; пустой курсор - первая страница (None)"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValidationError({CURSOR_PARAM: 'Неверный курсор'})
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError({CURSOR_PARAM: 'Неверный курсор'})
+    return values
+
+
+def is_keyset_request(params):
+    """Запрошена страница по ключу: параметр cursor есть, хотя бы пустой"""
+    return CURSOR_PARAM in params
+
+
+def wants_count(params):
+    return params.get(COUNT_PARAM, '').lower() in ('1', 'true', 'yes')
+
+
+def page_size_param(params):
+    try:
+        return min(max(int(params.get('page_size', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValidationError({'page_size': 'Размер страницы должен быть числом'})
+
+
+class FilterSpec:
+    """Разобранные параметры запроса: фильтры, сортировка, страница"""
+
+    def __init__(self, filters, ordering=None, page=1, page_size=PAGE_SIZE, paged=False):
+        self.filters = filters
+        self.ordering = ordering
+        self.page = page
+        self.page_size = page_size
+        # Страница запрошена явно (page или page_size в запросе)
+        self.paged = paged
+
+    @property
+    def is_empty(self):
+        """Нет ни фильтров, ни сортировки, ни страницы - нужен весь набор"""
+        return not self.filters and not self.ordering and not self.paged
+
+    @classmethod
+    def from_params(cls, params, fields):
+        """
+        Разбор параметров запроса по разрешенным полям. Параметры с другими
+        именами не фильтры (например, ?_= против кеширования) и пропускаются;
+        неизвестный оператор у поля фильтра - ошибка 400, а не молча
+        пропущенный фильтр.
+        """
+        filters = []
+        for name, value in params.items():
+            if name in RESERVED_PARAMS:
+                continue
+            field, _, operator = name.partition('__')
+            if field not in fields:
+                continue
+            operator = operator or 'exact'
+            if operator not in OPERATORS:
+                raise ValidationError({name: 'Фильтр не поддерживается'})
+            filters.append((field, operator, value))
+
+        ordering = params.get('ordering') or None
+        if ordering and ordering.lstrip('-') not in fields:
+            raise ValidationError({'ordering': 'Сортировка по этому полю не поддерживается'})
+        if ordering and is_keyset_request(params):
+            raise ValidationError({'ordering': 'Страницы по курсору идут в порядке ключа'})
+
+        try:
+            page = max(int(params.get('page', 1)), 1)
+        except ValueError:
+            raise ValidationError({'page': 'Номер страницы должен быть числом'})
+        page_size = page_size_param(params)
+
+        paged = 'page' in params or 'page_size' in params
+        return cls(filters, ordering, page, page_size, paged)
+
+    def apply_to_queryset(self, queryset):
+        """Те же фильтры и сортировка для выборки из базы данных"""
+        for field, operator, value in self.filters:
+            lookup = QUERYSET_LOOKUPS[operator]
+            # Дата без времени для поля даты-времени сравнивается по дню, как в индексе
+            model_field = queryset.model._meta.get_field(field)
+            if model_field.get_internal_type() == 'DateTimeField' and parse_day(value):
+                lookup = f'date__{lookup}'
+            queryset = queryset.filter(**{f'{field}__{lookup}': value})
+        if self.ordering:
+            queryset = queryset.order_by(self.ordering, 'pk')
+        return queryset
+
+
+class SortedIndex:
+    """Позиции записей, отсортированные по ключу поля"""
+
+    def __init__(self, records, field):
+        pairs = sorted((index_key(record.get(field)), position) for position, record in enumerate(records))
+        self.keys = [key for key, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+        # Поле даты или даты-времени (все непустые значения - даты): второй
+        # индекс по дню записи для фильтров датой без времени
+        self.day_keys = self.day_positions = None
+        values = [record.get(field) for record in records]
+        first = next((value for value in values if value not in (None, '')), None)
+        if record_day(first) is None:
+            return
+        days = [record_day(value) for value in values]
+        if all(day is not None for day, value in zip(days, values) if value not in (None, '')):
+            pairs = sorted((day.isoformat() if day else '', position) for position, day in enumerate(days))
+            self.day_keys = [key for key, _ in pairs]
+            self.day_positions = [position for _, position in pairs]
+
+    @staticmethod
+    def _range(keys, positions, operator, key):
+        if operator == 'exact':
+            return positions[bisect_left(keys, key):bisect_right(keys, key)]
+        if operator == 'prefix':
+            return positions[bisect_left(keys, key):bisect_left(keys, key + KEY_MAX)]
+        if operator == 'gte':
+            return positions[bisect_left(keys, key):]
+        if operator == 'gt':
+            return positions[bisect_right(keys, key):]
+        if operator == 'lt':
+            return positions[:bisect_left(keys, key)]
+        if operator == 'lte':
+            return positions[:bisect_right(keys, key)]
+        raise ValueError(f'Неизвестный оператор: {operator}')
+
+    def lookup(self, operator, value):
+        """Позиции записей, подходящих под условие"""
+        day = parse_day(value) if self.day_keys is not None and operator != 'prefix' else None
+        if day is not None:
+            # Дата без времени: сравнивается день записи, как __date в базе
+            positions = self._range(self.day_keys, self.day_positions, operator, day.isoformat())
+            if operator in ('lt', 'lte'):
+                # Записи без даты идут в начале индекса и, как NULL в базе, не подходят
+                return positions[bisect_right(self.day_keys, ''):]
+            return positions
+        return self._range(self.keys, self.positions, operator, index_key(value))
+
+    def distinct_keys(self):
+        """Различные ключи индекса по возрастанию"""
+        result = []
+        for key in self.keys:
+            if not result or result[-1] != key:
+                result.append(key)
+        return result
+
+
+class StaticDataset:
+    """Набор записей статического файла с индексами по полям фильтрации"""
+
+    def __init__(self, records, fields):
+        self.records = records
+        self.fields = tuple(fields)
+        self.indexes = {field: SortedIndex(records, field) for field in self.fields}
+        self._keysets = {}
+
+    def keyset(self, fields):
+        """
+        Ключи (значения fields) по возрастанию и позиции записей; строятся
+        один раз на набор. Поля ключа не должны быть пустыми (id, sale_date).
+        """
+        if fields not in self._keysets:
+            pairs = sorted(
+                (tuple(record.get(field) for field in fields), position)
+                for position, record in enumerate(self.records)
+            )
+            self._keysets[fields] = ([key for key, _ in pairs], [position for _, position in pairs])
+        return self._keysets[fields]
+
+    def positions(self, spec):
+        """Позиции записей после фильтров в порядке сортировки"""
+        # Начинаем с самого узкого условия, остальные проверяются по множеству
+        matches = sorted(
+            (self.indexes[field].lookup(operator, value) for field, operator, value in spec.filters),
+            key=len,
+        )
+        candidates = matches[0] if matches else None
+        for matched in matches[1:]:
+            matched = set(matched)
+            candidates = [position for position in candidates if position in matched]
+        if candidates is not None and not candidates:
+            return []
+
+        if spec.ordering:
+            field = spec.ordering.lstrip('-')
+            ordered = self.indexes[field].positions
+            if candidates is not None:
+                selected = set(candidates)
+                ordered = [position for position in ordered if position in selected]
+            return ordered[::-1] if spec.ordering.startswith('-') else ordered
+
+        if candidates is None:
+            return range(len(self.records))
+        return sorted(candidates)
+
+    def query(self, spec):
+        """Страница результата: число записей и записи страницы"""
+        positions = self.positions(spec)
+        start = (spec.page - 1) * spec.page_size
+        page = positions[start:start + spec.page_size]
+        return len(positions), [self.records[position] for position in page]
+
+    def keyset_query(self, spec, fields, after=None, with_count=False):
+        """
+        Страница после ключа after в порядке fields: (число записей или None,
+        записи страницы, ключ для следующей страницы или None)
+        """
+        keys, positions = self.keyset(tuple(fields))
+        start = bisect_right(keys, tuple(after)) if after else 0
+        selected = set(self.positions(FilterSpec(spec.filters))) if spec.filters else None
+
+        page = []
+        next_key = None
+        for index in range(start, len(positions)):
+            if selected is not None and positions[index] not in selected:
+                continue
+            if len(page) == spec.page_size:
+                next_key = keys[page[-1]]
+                break
+            page.append(index)
+
+        count = None
+        if with_count:
+            count = len(selected) if selected is not None else len(self.records)
+        return count, [self.records[positions[index]] for index in page], next_key
+
+    def contains(self, field, value):
+        """
+        Записи, у которых поле содержит подстроку (без учета регистра).
+        Подстрока ищется только среди различных значений поля.
+        """
+        index = self.indexes[field]
+        needle = index_key(value)
+        positions = []
+        for key in index.distinct_keys():
+            if needle in key:
+                positions.extend(index.lookup('exact', key))
+        return [self.records[position] for position in sorted(positions)]
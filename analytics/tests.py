@@ -1,3 +1,849 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+import openpyxl
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from analytics import cache
+from analytics.builders import SalesAnalysisBuilder
+from analytics.engines import FixedPointSalesAnalysisEngine
+from analytics.excel_export import ExcelExportJobs, ExportJob, build_workbook, build_workbook_parallel
+from analytics.excel_formulas import FORMULAS
+from analytics.formula_engine import Formula, FormulaError, FormulaGraph
+from analytics.importers import FINANCIAL_REPORTS_SHEET, ExcelStreamImporter
+from analytics.models import DailySalesRollup, FinancialReport, Nomenclature, SalesAnalysis, StockBalance
+from analytics.rollups import DailySalesRollupService
+from analytics.serializers import FinancialReportSerializer
+from analytics.services import CalculationService
+from analytics.static_export import export_static_data
+from analytics.static_query import FilterSpec, StaticDataset, decode_cursor, encode_cursor
+from analytics.timeseries import MAX_BUCKETS, TimeseriesQuery
+from analytics.views import FinancialReportViewSet
+
+
+def financial_report(number, **values):
+    """Строка финотчета: обязательные поля без значений заполнены нулями и пустыми строками"""
+    row = {}
+    for field in FinancialReport._meta.concrete_fields:
+        if field.primary_key or field.has_default() or field.null:
+            continue
+        internal_type = field.get_internal_type()
+        if internal_type in ('CharField', 'TextField'):
+            row[field.name] = ''
+        elif internal_type == 'DateTimeField':
+            row[field.name] = timezone.make_aware(datetime(2025, 10, 1, 12))
+        else:
+            row[field.name] = 0
+    row.update(number=number, **values)
+    return FinancialReport(**row)
+
+class FixedPointParityTests(TestCase):
+    """Целочисленный движок совпадает с построчным расчетом в Decimal до знака"""
+
+    OUTPUT_FIELDS = FixedPointSalesAnalysisEngine.OUTPUT_FIELDS
+    BACKEND = 'fixed_point'
+
+    def create_rows(self, count, seed=7):
+        rng = random.Random(seed)
+        rows = []
+        for index in range(count):
+            sales = rng.randint(0, 40)
+            returns = rng.randint(0, min(sales, 4))
+            net = sales - returns
+            cost = Decimal(rng.randint(5000, 50000)) / 100
+            rows.append(SalesAnalysis(
+                brand=f'Бренд {index % 5}', subject='Футболка', article=f'ART-{index}', size='0',
+                orders=sales + rng.randint(0, 10),
+                sales=sales,
+                returns=returns,
+                sales_with_spp=cost * 3 * max(net, 1) + Decimal(rng.randint(0, 99)) / 100,
+                sales_minus_commission=(cost * net * Decimal(rng.randint(80, 250)) / 100).quantize(Decimal('0.01')),
+                logistics=Decimal(rng.randint(0, 90000)) / 100,
+                cost_per_unit=cost,
+                total_stock_wb=rng.randint(0, 30),
+            ))
+        SalesAnalysis.objects.bulk_create(rows)
+
+    def snapshot(self):
+        return {
+            row['id']: row
+            for row in SalesAnalysis.objects.values('id', *self.OUTPUT_FIELDS)
+        }
+
+    def restore(self, snapshot):
+        SalesAnalysis.objects.bulk_update(
+            [SalesAnalysis(**row) for row in snapshot.values()], self.OUTPUT_FIELDS
+        )
+
+    def assert_parity(self):
+        initial = self.snapshot()
+
+        # Построчный расчет берет итог маржи из уже записанных строк, поэтому
+        # эталон - второй проход от исходных значений с посчитанной маржой
+        CalculationService.calculate_sales_analysis('python')
+        margins = self.snapshot()
+        self.restore({pk: {**initial[pk], 'margin_after_tax': margins[pk]['margin_after_tax']} for pk in initial})
+        CalculationService.calculate_sales_analysis('python')
+        expected = self.snapshot()
+
+        self.restore(initial)
+        CalculationService.calculate_sales_analysis(self.BACKEND)
+        actual = self.snapshot()
+
+        for pk, row in expected.items():
+            for field in self.OUTPUT_FIELDS:
+                self.assertEqual(actual[pk][field], row[field], f'{field} строки {pk}')
+
+    def test_random_rows_match_decimal(self):
+        self.create_rows(300)
+        self.assert_parity()
+
+    def test_edge_cases_match_decimal(self):
+        self.create_rows(20)
+        SalesAnalysis.objects.bulk_create([
+            # Нет заказов и продаж: IFERROR-доли остаются прежними
+            SalesAnalysis(brand='Край', subject='', article='ZERO', size='0',
+                          purchase_percentage=Decimal('0.5000'), average_check=Decimal('10.00')),
+            # Продажи равны возвратам
+            SalesAnalysis(brand='Край', subject='', article='NET0', size='0', orders=3, sales=2, returns=2,
+                          sales_with_spp=Decimal('100.00'), cost_per_unit=Decimal('10.00')),
+            # Отрицательная маржа
+            SalesAnalysis(brand='Край', subject='', article='LOSS', size='0', orders=5, sales=5,
+                          sales_with_spp=Decimal('500.00'), sales_minus_commission=Decimal('100.00'),
+                          cost_per_unit=Decimal('50.00')),
+            # Налог ровно на половине копейки: 6% от 0.25 = 0.015
+            SalesAnalysis(brand='Край', subject='', article='HALF', size='0', orders=1, sales=1,
+                          sales_with_spp=Decimal('1.25'), sales_minus_commission=Decimal('1.25'),
+                          cost_per_unit=Decimal('1.00')),
+        ])
+        self.assert_parity()
+
+
+class DatabaseEngineParityTests(FixedPointParityTests):
+    """Движок базы данных записывает те же значения, что и построчный расчет"""
+
+    BACKEND = 'database'
+
+    def test_stored_ratios_rounded(self):
+        # SQLite сохраняет float как есть: в столбце должно быть уже округленное значение
+        self.create_rows(50)
+        CalculationService.calculate_sales_analysis(self.BACKEND)
+        table = SalesAnalysis._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT average_check, margin_percent, revenue_share FROM {table}')
+            for average_check, margin_percent, revenue_share in cursor.fetchall():
+                self.assertEqual(round(average_check, 2), average_check)
+                self.assertEqual(round(margin_percent, 4), margin_percent)
+                self.assertEqual(round(revenue_share, 4), revenue_share)
+
+
+class VectorizedEngineParityTests(FixedPointParityTests):
+    """Векторный движок записывает те же значения, что и построчный расчет"""
+
+    BACKEND = 'vectorized'
+
+
+class RoundDivideTests(TestCase):
+    """Банковское округление при целочисленном делении"""
+
+    def test_half_even(self):
+        numerators = np.array([5, 7, -5, -7, 4, -4, 15, 1], dtype=np.int64)
+        denominators = np.array([2, 2, 2, 2, 3, 3, 10, 3], dtype=np.int64)
+        result = FixedPointSalesAnalysisEngine._round_divide(
+            numerators, denominators, np.ones(len(numerators), dtype=bool), 0
+        )
+        self.assertEqual(result.tolist(), [2, 4, -2, -4, 1, -1, 2, 0])
+
+    def test_condition_keeps_current(self):
+        result = FixedPointSalesAnalysisEngine._round_divide(
+            np.array([10, 10]), np.array([0, 5]), np.array([False, True]), np.array([42, 42])
+        )
+        self.assertEqual(result.tolist(), [42, 2])
+
+
+class DashboardQueryPlanTests(TestCase):
+    """Запросы дашборда читают индексы, а не всю таблицу"""
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_dashboard_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется в формате EXPLAIN QUERY PLAN SQLite')
+
+        for query in cache.DASHBOARD_QUERIES:
+            plan = query().explain()
+            with self.subTest(query=query.__name__):
+                steps = [line for line in plan.splitlines() if ' SCAN ' in line or ' SEARCH ' in line]
+                self.assertTrue(steps, plan)
+                for step in steps:
+                    self.assertIn('INDEX', step, plan)
+
+
+class DashboardEndpointTests(TestCase):
+    """Вне статического режима дашборд отдается из кеша версии данных"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(STATIC_MODE=False, DATA_VERSION_FILE=os.path.join(directory.name, 'data_version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_overview_served_from_cache(self):
+        with mock.patch.object(cache, 'get_overview', return_value={'summary': {'source': 'cache'}}) as get_overview:
+            response = self.client.get('/api/dashboard/overview/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'summary': {'source': 'cache'}})
+        get_overview.assert_called_once_with()
+
+    def test_charts_data_etag_follows_data_version(self):
+        version = cache.invalidate()
+        with mock.patch.object(cache, 'build_charts_data', return_value={'sales_by_day': []}) as build:
+            response = self.client.get('/api/dashboard/charts_data/', HTTP_HOST='localhost')
+            self.assertEqual(response.json(), {'sales_by_day': []})
+            self.assertEqual(response['ETag'], f'W/"d-{version}"')
+
+            response = self.client.get(
+                '/api/dashboard/charts_data/', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+        build.assert_called_once_with()
+
+
+class TimeseriesRangeTests(SimpleTestCase):
+    """Длина ряда ограничена, конец календаря не вызывает ошибок"""
+
+    def test_too_many_buckets_rejected(self):
+        query = TimeseriesQuery.from_params({'from': '2015-01-01', 'to': '2024-12-31'})
+        self.assertLessEqual(len(query.build([])['days']), MAX_BUCKETS)
+        with self.assertRaises(ValidationError):
+            TimeseriesQuery.from_params({'from': '0001-01-01', 'to': '9999-12-01'})
+        query = TimeseriesQuery.from_params({'from': '0001-01-01', 'granularity': 'month'})
+        with self.assertRaises(ValidationError):
+            query.build([(date(2025, 1, 1), Decimal('1'), 1)])
+
+    def test_range_ends_at_date_max(self):
+        for granularity, length in (('day', 3), ('week', 1), ('month', 1)):
+            query = TimeseriesQuery.from_params({'from': '9999-12-29', 'to': '9999-12-31', 'granularity': granularity})
+            with self.subTest(granularity=granularity):
+                self.assertEqual(len(query.build([])['days']), length)
+
+
+class DailySalesRollupTests(TestCase):
+    """Дневные итоги финотчетов и их пересчет по затронутым дням"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(STATIC_MODE=False, DATA_VERSION_FILE=os.path.join(directory.name, 'data_version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @staticmethod
+    def totals():
+        return {
+            (row.day.isoformat(), row.supplier_article): (row.report_count, row.quantity, row.wb_sold_product)
+            for row in DailySalesRollup.objects.all()
+        }
+
+    def test_rebuild_groups_by_local_day(self):
+        FinancialReport.objects.bulk_create([
+            financial_report(1, supplier_article='A', payment_basis='Продажа', quantity=1, wb_sold_product=Decimal('10.50'),
+                             sale_date=datetime(2025, 10, 1, 9, tzinfo=dt_timezone.utc)),
+            financial_report(2, supplier_article='A', payment_basis='Продажа', quantity=2, wb_sold_product=Decimal('20.00'),
+                             sale_date=datetime(2025, 10, 1, 20, tzinfo=dt_timezone.utc)),
+            financial_report(3, supplier_article='A', payment_basis='Продажа', quantity=3, wb_sold_product=Decimal('30.00'),
+                             sale_date=datetime(2025, 10, 1, 22, 30, tzinfo=dt_timezone.utc)),
+        ])
+        DailySalesRollupService.rebuild()
+        # 22:30 UTC - уже 2 октября по Москве, как TruncDate в запросах дашборда
+        self.assertEqual(self.totals(), {
+            ('2025-10-01', 'A'): (2, 3, Decimal('30.50')),
+            ('2025-10-02', 'A'): (1, 3, Decimal('30.00')),
+        })
+
+    def test_api_writes_refresh_touched_days(self):
+        first = financial_report(1, supplier_article='A', payment_basis='Продажа', quantity=1,
+                                 sale_date=timezone.make_aware(datetime(2025, 10, 1, 12)))
+        second = financial_report(2, supplier_article='B', payment_basis='Продажа', quantity=4,
+                                  sale_date=timezone.make_aware(datetime(2025, 10, 1, 12)))
+        FinancialReport.objects.bulk_create([first, second])
+        DailySalesRollupService.rebuild()
+        report = FinancialReport.objects.get(number=1)
+
+        response = self.client.patch(
+            f'/api/financial-reports/{report.pk}/', {'sale_date': '2025-10-03T12:00:00+03:00', 'quantity': 5},
+            content_type='application/json', HTTP_HOST='localhost',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totals(), {
+            ('2025-10-01', 'B'): (1, 4, Decimal('0.00')),
+            ('2025-10-03', 'A'): (1, 5, Decimal('0.00')),
+        })
+
+        response = self.client.delete(f'/api/financial-reports/{report.pk}/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.totals(), {('2025-10-01', 'B'): (1, 4, Decimal('0.00'))})
+
+
+class SalesAnalysisBuilderTests(TestCase):
+    """Построение анализа продаж из финотчетов"""
+
+    def test_commission_percent_fits_field(self):
+        # Комиссия в 16 раз больше продаж до СПП: доля ограничивается полем (5 знаков, 4 после точки)
+        FinancialReport.objects.bulk_create([
+            financial_report(1, brand='Б', supplier_article='A', size='0', payment_basis='Продажа',
+                             quantity=1, retail_price_with_discount=Decimal('10.00'),
+                             payment_to_seller=Decimal('-150.00')),
+            financial_report(2, brand='Б', supplier_article='B', size='0', payment_basis='Продажа',
+                             quantity=3, retail_price_with_discount=Decimal('30.00'),
+                             payment_to_seller=Decimal('61.00')),
+        ])
+        SalesAnalysisBuilder.build()
+
+        percents = dict(SalesAnalysis.objects.values_list('article', 'commission_percent'))
+        self.assertEqual(percents, {'A': Decimal('9.9999'), 'B': Decimal('0.3222')})
+        CalculationService.calculate_sales_analysis('python')
+
+    def test_grouped_sums_and_stale_rows(self):
+        FinancialReport.objects.bulk_create([
+            financial_report(1, brand='Б', supplier_article='A', size='42', payment_basis='Продажа', quantity=2,
+                             retail_price_with_discount=Decimal('100.00'), wb_sold_product=Decimal('180.00'),
+                             payment_to_seller=Decimal('150.00')),
+            financial_report(2, brand='Б', supplier_article='A', size='42', payment_basis='Продажа', quantity=1,
+                             retail_price_with_discount=Decimal('100.00'), wb_sold_product=Decimal('90.00'),
+                             payment_to_seller=Decimal('70.00')),
+            financial_report(3, brand='Б', supplier_article='A', size='42', payment_basis='Возврат', quantity=1,
+                             retail_price_with_discount=Decimal('100.00'), wb_sold_product=Decimal('90.00'),
+                             payment_to_seller=Decimal('60.00')),
+            financial_report(4, brand='Б', supplier_article='A', size='42', payment_basis='Логистика',
+                             delivery_count=4, return_count=1, delivery_services=Decimal('50.00')),
+        ])
+        Nomenclature.objects.create(brand='Б', subject='Футболка', size_code='', supplier_article='A',
+                                    wb_article='', size='42.0', barcode='', equipment=0, cost_price=Decimal('40.00'))
+        StockBalance.objects.create(brand='Б', subject='Шорты', supplier_article='S', item_size='0',
+                                    in_transit_to_client=1, in_transit_from_client=2, total_in_warehouses=3)
+        existing = SalesAnalysis.objects.create(brand='Б', subject='', article='A', size='42', orders=99)
+        SalesAnalysis.objects.create(brand='Старый', subject='', article='X', size='0', sales=5)
+
+        self.assertEqual(SalesAnalysisBuilder.build(), 2)
+
+        row = SalesAnalysis.objects.get(brand='Б', article='A', size='42')
+        self.assertEqual(row.pk, existing.pk)
+        self.assertEqual((row.orders, row.rejections, row.sales, row.returns), (4, 1, 3, 1))
+        self.assertEqual(row.sales_before_spp, Decimal('200.00'))
+        self.assertEqual(row.sales_with_spp, Decimal('180.00'))
+        self.assertEqual(row.sales_minus_commission, Decimal('160.00'))
+        self.assertEqual(row.commission, Decimal('40.00'))
+        self.assertEqual(row.commission_percent, Decimal('0.2000'))
+        self.assertEqual((row.logistics, row.logistics_for_returns), (Decimal('50.00'), Decimal('50.00')))
+        # Себестоимость номенклатуры с размером '42.0' сопоставлена с '42'
+        self.assertEqual(row.cost_per_unit, Decimal('40.00'))
+
+        # Товар только с остатками попадает в анализ, строка без движения удаляется
+        stock_row = SalesAnalysis.objects.get(article='S')
+        self.assertEqual((stock_row.subject, stock_row.total_stock_wb), ('Шорты', 6))
+        self.assertFalse(SalesAnalysis.objects.filter(brand='Старый').exists())
+
+
+class ChangedSalesAnalysisTests(TestCase):
+    """Инкрементальный пересчет измененных записей анализа продаж"""
+
+    def create_row(self, article, sales_minus_commission, **values):
+        values = {'orders': 2, 'sales': 2, 'sales_with_spp': Decimal('200.00'), 'cost_per_unit': Decimal('10.00'), **values}
+        return SalesAnalysis.objects.create(
+            brand='Б', subject='', article=article, size='42', sales_minus_commission=sales_minus_commission, **values
+        )
+
+    def test_reference_edits_picked_up(self):
+        nomenclature = Nomenclature.objects.create(
+            brand='Б', subject='', size_code='', supplier_article='A', wb_article='', size='42',
+            barcode='', equipment=0, cost_price=Decimal('10.00'),
+        )
+        StockBalance.objects.create(brand='Б', subject='', supplier_article='B', item_size='42',
+                                    in_transit_to_client=0, in_transit_from_client=0, total_in_warehouses=0)
+        self.create_row('A', Decimal('150.00'))
+        self.create_row('B', Decimal('150.00'))
+        self.create_row('C', Decimal('150.00'))
+        CalculationService.calculate_sales_analysis('python')
+        # Справочники изменены до расчета
+        Nomenclature.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        StockBalance.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        self.assertFalse(CalculationService.changed_sales_analysis().exists())
+
+        nomenclature.cost_price = Decimal('30.00')
+        nomenclature.save()
+        StockBalance.objects.filter(supplier_article='B').update(total_in_warehouses=7, updated_at=timezone.now())
+        changed = CalculationService.changed_sales_analysis()
+        self.assertEqual(sorted(changed.values_list('article', flat=True)), ['A', 'B'])
+
+        self.assertEqual(CalculationService.calculate_sales_analysis_changed('python'), 2)
+        row = SalesAnalysis.objects.get(article='A')
+        self.assertEqual((row.cost_per_unit, row.sold_goods_cost), (Decimal('30.00'), Decimal('60.00')))
+        self.assertEqual(SalesAnalysis.objects.get(article='B').total_stock_wb, 7)
+        self.assertFalse(CalculationService.changed_sales_analysis().exists())
+
+    def test_shares_use_table_totals(self):
+        for backend in CalculationService.BACKENDS:
+            with self.subTest(backend=backend):
+                SalesAnalysis.objects.all().delete()
+                # Маржа по всей таблице отрицательна: доля маржи остается прежней,
+                # а не считается от итога одной пересчитанной строки
+                self.create_row('A', Decimal('150.00'), margin_share=Decimal('0.1234'), revenue_share=Decimal('0.1234'))
+                self.create_row('B', Decimal('50.00'), cost_per_unit=Decimal('500.00'))
+                CalculationService.calculate_sales_analysis('python')
+                SalesAnalysis.objects.update(is_dirty=False)
+                SalesAnalysis.objects.filter(article='A').update(is_dirty=True)
+
+                self.assertEqual(CalculationService.calculate_sales_analysis_changed(backend), 1)
+                row = SalesAnalysis.objects.get(article='A')
+                self.assertEqual(row.margin_share, Decimal('0.1234'))
+                self.assertEqual(row.revenue_share, Decimal('0.7500'))
+
+
+class FormulaGraphTests(SimpleTestCase):
+    """Порядок вычисления и пересчет по графу зависимостей формул"""
+
+    def test_plan_follows_dependencies(self):
+        graph = FormulaGraph([
+            Formula('total', ['net', 'tax'], lambda net, tax: net + tax),
+            Formula('tax', ['net'], lambda net: net * 0.06),
+            Formula('net', ['sales', 'returns'], lambda sales, returns: sales - returns),
+        ])
+
+        order = [formula.name for formula in graph.plan]
+        self.assertEqual(order, ['net', 'tax', 'total'])
+        self.assertEqual(graph.sources, {'sales', 'returns'})
+        self.assertEqual(graph.evaluate({'sales': 150, 'returns': 50})['total'], 106)
+        # Только нужные ячейки: входы других ветвей можно не передавать
+        self.assertEqual(graph.evaluate({'sales': 10, 'returns': 4}, names=['net']), {'sales': 10, 'returns': 4, 'net': 6})
+        with self.assertRaises(FormulaError):
+            graph.evaluate({'sales': 10})
+
+    def test_duplicates_and_cycles_rejected(self):
+        with self.assertRaisesMessage(FormulaError, 'a'):
+            FormulaGraph([Formula('a', ['x'], abs), Formula('a', ['y'], abs)])
+        with self.assertRaisesMessage(FormulaError, 'b, c'):
+            FormulaGraph([
+                Formula('a', ['x'], abs),
+                Formula('b', ['a', 'c'], max),
+                Formula('c', ['b'], abs),
+            ])
+
+    def test_evaluate_changed_recomputes_only_dependents(self):
+        calls = []
+
+        def tracked(name, function):
+            def wrapper(*args):
+                calls.append(name)
+                return function(*args)
+            return wrapper
+
+        graph = FormulaGraph([
+            Formula('left', ['a'], tracked('left', lambda a: a * 2)),
+            Formula('right', ['b'], tracked('right', lambda b: b * 3)),
+            Formula('sum', ['left', 'right'], tracked('sum', lambda left, right: left + right)),
+        ])
+        values = graph.evaluate({'a': 1, 'b': 1})
+        calls.clear()
+
+        changed = graph.evaluate_changed(values, {'a': 5})
+        self.assertEqual(sorted(calls), ['left', 'sum'])
+        self.assertEqual(changed, graph.evaluate({'a': 5, 'b': 1}))
+        self.assertEqual(values['sum'], 5)
+
+    def test_what_if_matches_full_evaluation(self):
+        inputs = {name: Decimal(index + 1) for index, name in enumerate(sorted(FORMULAS.sources))}
+        values = FORMULAS.evaluate(inputs)
+        changes = {'sa.sold_goods_cost': Decimal('1000'), 'sa.sales_minus_returns': Decimal('0')}
+        self.assertEqual(FORMULAS.evaluate_changed(values, changes), FORMULAS.evaluate({**inputs, **changes}))
+
+
+class StaticFilterParityTests(TestCase):
+    """Фильтры статического режима дают те же записи, что запрос к базе"""
+
+    QUERIES = (
+        {'brand__gt': 'B1'}, {'brand__lte': 'B1'}, {'brand': 'b10'}, {'brand__prefix': 'B1'},
+        {'sale_date': '2025-10-01'}, {'sale_date__gt': '2025-10-01'}, {'sale_date__gte': '2025-10-01'},
+        {'sale_date__lt': '2025-10-02'}, {'sale_date__lte': '2025-10-01'},
+        {'brand': 'B2', 'sale_date__gte': '2025-10-02'},
+    )
+
+    def setUp(self):
+        moments = [
+            datetime(2025, 9, 30, 20, 59), datetime(2025, 9, 30, 21, 0),  # граница дня по Москве
+            datetime(2025, 10, 1, 12, 0), datetime(2025, 10, 1, 20, 59, 59), datetime(2025, 10, 2, 9, 0),
+        ]
+        FinancialReport.objects.bulk_create([
+            financial_report(number, brand=brand, sale_date=moment.replace(tzinfo=dt_timezone.utc))
+            for number, (brand, moment) in enumerate(
+                ((brand, moment) for brand in ('B1', 'B2', 'B10') for moment in moments), start=1
+            )
+        ])
+        data = FinancialReportSerializer(FinancialReport.objects.order_by('pk'), many=True).data
+        self.dataset = StaticDataset(json.loads(JSONRenderer().render(data)), FinancialReportViewSet.filter_fields)
+
+    def test_unknown_params_ignored(self):
+        fields = FinancialReportViewSet.filter_fields
+        spec = FilterSpec.from_params({'_': '123', 'utm_source': 'mail', 'brand': 'B1'}, fields)
+        self.assertEqual(spec.filters, [('brand', 'exact', 'B1')])
+        with self.assertRaises(ValidationError):
+            FilterSpec.from_params({'brand__contains': 'B'}, fields)
+
+    def test_static_matches_database(self):
+        fields = FinancialReportViewSet.filter_fields
+        for params in self.QUERIES:
+            spec = FilterSpec.from_params(params, fields)
+            with self.subTest(params=params):
+                expected = sorted(spec.apply_to_queryset(FinancialReport.objects.all()).values_list('id', flat=True))
+                actual = sorted(self.dataset.records[position]['id'] for position in self.dataset.positions(spec))
+                self.assertTrue(expected)
+                self.assertEqual(actual, expected)
+
+
+class KeysetPaginationTests(TestCase):
+    """Страницы по курсору проходят все записи ровно один раз, в том числе при равных датах"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(STATIC_MODE=False, DATA_VERSION_FILE=os.path.join(directory.name, 'data_version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        moments = [datetime(2025, 10, day, 12, tzinfo=dt_timezone.utc) for day in (3, 1, 2, 1, 1, 3, 2)]
+        FinancialReport.objects.bulk_create([
+            financial_report(number, brand='Nike' if number % 2 else 'Puma', sale_date=moment)
+            for number, moment in enumerate(moments, start=1)
+        ])
+        self.expected = list(FinancialReport.objects.order_by('sale_date', 'id').values_list('id', flat=True))
+
+    def test_database_pages(self):
+        url = '/api/financial-reports/?cursor=&page_size=2&count=1'
+        ids, counts = [], set()
+        while url:
+            response = self.client.get(url, HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            counts.add(data['count'])
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(counts, {7})
+
+    def test_static_pages_match_database(self):
+        records = json.loads(JSONRenderer().render(
+            FinancialReportSerializer(FinancialReport.objects.order_by('id'), many=True).data
+        ))
+        dataset = StaticDataset(records, FinancialReportViewSet.filter_fields)
+        nike = list(FinancialReport.objects.filter(brand='Nike').order_by('sale_date', 'id').values_list('id', flat=True))
+        for filters, expected in (([], self.expected), ([('brand', 'exact', 'nike')], nike)):
+            ids, after = [], None
+            while True:
+                count, page, next_key = dataset.keyset_query(
+                    FilterSpec(filters, page_size=2), FinancialReportViewSet.keyset_fields, after, with_count=True
+                )
+                ids.extend(record['id'] for record in page)
+                if next_key is None:
+                    break
+                after = decode_cursor(encode_cursor(next_key), len(FinancialReportViewSet.keyset_fields))
+            self.assertEqual(ids, expected)
+            self.assertEqual(count, len(expected))
+
+    def test_bad_cursor_rejected(self):
+        for cursor in ('not-base64!', encode_cursor([1])):
+            response = self.client.get(f'/api/financial-reports/?cursor={cursor}', HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 400)
+
+
+class StreamingExportTests(TestCase):
+    """Потоковая выгрузка финотчетов отдает те же записи, что список API"""
+
+    FIELDS = 'id,brand,sale_date,wb_sold_product'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(STATIC_MODE=False, DATA_VERSION_FILE=os.path.join(directory.name, 'data_version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        FinancialReport.objects.bulk_create([
+            financial_report(1, brand='Nike', wb_sold_product=Decimal('10.50')),
+            financial_report(2, brand='Puma', wb_sold_product=Decimal('20.00')),
+            financial_report(3, brand='nike', wb_sold_product=Decimal('0.01'),
+                             sale_date=datetime(2025, 10, 2, 12, tzinfo=dt_timezone.utc)),
+        ])
+
+    def get(self, url):
+        return self.client.get(url, HTTP_HOST='localhost')
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_matches_api_list(self):
+        query = f'brand=Nike&fields={self.FIELDS}&ordering=-sale_date'
+        expected = self.get(f'/api/financial-reports/?{query}').json()['results']
+        lines = self.content(self.get(f'/api/financial-reports/export.ndjson?{query}')).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+        self.assertEqual([row['id'] for row in expected], [3, 1])
+
+    def test_csv_has_header_and_rows(self):
+        response = self.get(f'/api/financial-reports/export.csv?fields={self.FIELDS}&brand__prefix=p')
+        self.assertIn('financial_reports.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(self.content(response))))
+        self.assertEqual(rows[0], self.FIELDS.split(','))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows[1][1], rows[1][3]), ('Puma', '20.00'))
+
+    def test_bad_params_rejected(self):
+        for query in ('fields=id,unknown', 'brand__bad=1', 'ordering=unknown'):
+            for extension in ('ndjson', 'csv'):
+                with self.subTest(query=query, extension=extension):
+                    self.assertEqual(self.get(f'/api/financial-reports/export.{extension}?{query}').status_code, 400)
+
+
+class ExcelExportJobTests(TestCase):
+    """Фоновая выгрузка Excel: одно задание на версию данных, ошибка и перезапуск"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            DATA_VERSION_FILE=os.path.join(directory.name, 'data_version'),
+            EXCEL_EXPORT_DIR=os.path.join(directory.name, 'exports'),
+            EXCEL_EXPORT_PARALLEL=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.version = cache.invalidate()
+
+        # Задания не уходят в поток: тест запускает их сам
+        executor = mock.patch.object(ExcelExportJobs, '_executor', mock.Mock())
+        self.executor = executor.start()
+        self.addCleanup(executor.stop)
+
+    def test_running_job_not_started_twice(self):
+        first = ExcelExportJobs.start()
+        second = ExcelExportJobs.start()
+
+        self.assertEqual((first.id, first.status), (self.version, ExportJob.PENDING))
+        self.assertEqual((second.id, second.status), (self.version, ExportJob.PENDING))
+        self.executor.submit.assert_called_once_with(ExcelExportJobs.run, mock.ANY)
+
+    def test_done_job_served_from_file(self):
+        ExcelExportJobs.run(ExcelExportJobs.start())
+
+        job = ExcelExportJobs.get(self.version)
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertTrue(os.path.exists(job.path))
+        self.assertFalse(os.path.exists(job.state_path))
+        self.assertEqual(ExcelExportJobs.start().status, ExportJob.DONE)
+        self.assertEqual(self.executor.submit.call_count, 1)
+
+        # Новая версия данных: выгрузка прежней удаляется после постройки новой
+        previous = job.path
+        self.version = cache.invalidate()
+        ExcelExportJobs.run(ExcelExportJobs.start())
+        self.assertFalse(os.path.exists(previous))
+
+    def test_failed_job_restarted(self):
+        with mock.patch('analytics.excel_export.build_workbook', side_effect=RuntimeError('нет места')):
+            ExcelExportJobs.run(ExcelExportJobs.start())
+
+        job = ExcelExportJobs.get(self.version)
+        self.assertEqual((job.status, job.error), (ExportJob.FAILED, 'нет места'))
+        self.assertEqual(os.listdir(settings.EXCEL_EXPORT_DIR), [os.path.basename(job.state_path)])
+
+        restarted = ExcelExportJobs.start()
+        self.assertEqual(restarted.status, ExportJob.PENDING)
+        self.assertEqual(self.executor.submit.call_count, 2)
+
+    def test_interrupted_job_reported_failed(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        job = ExportJob(self.version, ExportJob.RUNNING)
+        job.claim()
+        with open(job.state_path, encoding='utf-8') as state_file:
+            state = json.load(state_file)
+        with open(job.state_path, 'w', encoding='utf-8') as state_file:
+            json.dump({**state, 'pid': process.pid}, state_file)
+
+        self.assertEqual(ExcelExportJobs.get(self.version).status, ExportJob.FAILED)
+        self.assertEqual(ExcelExportJobs.start().status, ExportJob.PENDING)
+        self.executor.submit.assert_called_once()
+
+
+class InlineExecutor:
+    """Исполнитель в текущем процессе: задания выполняются сразу при submit"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class ParallelWorkbookTests(TestCase):
+    """Книга, собранная из листов по частям, совпадает с последовательной"""
+
+    @staticmethod
+    def sheets(path):
+        workbook = openpyxl.load_workbook(path)
+        try:
+            return {
+                ws.title: [
+                    [(cell.value, cell.number_format, cell.font.b, cell.fill.fgColor.rgb) for cell in row]
+                    for row in ws.iter_rows()
+                ]
+                for ws in workbook.worksheets
+            }
+        finally:
+            workbook.close()
+
+    def test_parallel_matches_serial(self):
+        FinancialReport.objects.bulk_create([
+            financial_report(number, brand=f'Бренд {number % 3}', size='42', quantity=number,
+                             wb_sold_product=Decimal(number) / 7, sale_date=timezone.make_aware(datetime(2025, 10, number, 15)))
+            for number in range(1, 8)
+        ])
+        Nomenclature.objects.create(brand='Б', subject='', size_code='1', supplier_article='A', wb_article='2',
+                                    size='42', barcode='3', equipment=0, cost_price=Decimal('12.34'))
+        SalesAnalysis.objects.create(brand='Б', subject='', article='A', size='42', sales=3,
+                                     sales_with_spp=Decimal('99.99'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            serial_path = os.path.join(directory, 'serial.xlsx')
+            parallel_path = os.path.join(directory, 'parallel.xlsx')
+            serial_counts = build_workbook(serial_path)
+            with mock.patch('analytics.excel_export.ProcessPoolExecutor', InlineExecutor):
+                parallel_counts = build_workbook_parallel(parallel_path)
+            serial, parallel = self.sheets(serial_path), self.sheets(parallel_path)
+
+        self.assertEqual(parallel_counts, serial_counts)
+        self.assertEqual(list(parallel), list(serial))
+        for sheet_name in serial:
+            with self.subTest(sheet=sheet_name):
+                self.assertEqual(parallel[sheet_name], serial[sheet_name])
+        self.assertEqual(serial_counts['Финотчеты (вставить)'], 7)
+
+
+class StaticExportTests(TestCase):
+    """Выгрузка static/data/ в формате исходных файлов"""
+
+    def test_decimals_exported_as_numbers(self):
+        SalesAnalysis.objects.create(
+            brand='Nike', subject='Футболка', article='A1', size='0',
+            purchase_percentage=Decimal('0.6667'), sales_before_spp=Decimal('4856.28'),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            export_static_data(directory)
+            with open(os.path.join(directory, 'sales_analysis.json'), encoding='utf-8') as f:
+                row = json.load(f)[0]
+            files = os.listdir(directory)
+
+        self.assertEqual(row['purchase_percentage'], 0.6667)
+        self.assertEqual(row['sales_before_spp'], 4856.28)
+        # Планы по выкупам в статическом режиме читаются из базы
+        self.assertNotIn('purchase_plan.json', files)
+
+
+class FinancialReportImportTests(TestCase):
+    """Потоковый импорт листа финотчетов"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(DATA_VERSION_FILE=os.path.join(directory.name, 'data_version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def workbook(self, rows):
+        """Книга с листом финотчетов; заголовки во второй строке, как в выгрузке WB"""
+        headers = ['№', 'Srid', 'Обоснование для оплаты', 'Бренд', 'Размер',
+                   'Дата заказа покупателем', 'Дата продажи', 'Кол-во', 'Вайлдберриз реализовал Товар (Пр)']
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = FINANCIAL_REPORTS_SHEET.sheet_name
+        sheet.append(['Отчет'])
+        sheet.append(headers)
+        for row in rows:
+            sheet.append([row.get(header) for header in headers])
+        path = os.path.join(self.directory, f'report{len(os.listdir(self.directory))}.xlsx')
+        workbook.save(path)
+        return path
+
+    @staticmethod
+    def row(number, srid, **values):
+        day = datetime(2025, 10, number % 28 + 1, 12)
+        row = {
+            '№': number, 'Srid': srid, 'Обоснование для оплаты': 'Продажа', 'Бренд': 'Nike',
+            'Размер': 42, 'Дата заказа покупателем': day, 'Дата продажи': day,
+            'Кол-во': 1, 'Вайлдберриз реализовал Товар (Пр)': 100.5,
+        }
+        row.update(values)
+        return row
+
+    def import_rows(self, rows, incremental=False):
+        importer = ExcelStreamImporter(self.workbook(rows), batch_size=2, incremental=incremental)
+        return importer.run([FINANCIAL_REPORTS_SHEET])[0]
+
+    def test_bulk_import_skips_duplicates_and_incomplete_rows(self):
+        stats = self.import_rows([
+            self.row(1, 'a'), self.row(2, 'b'), self.row(1, 'a-again'),
+            self.row(3, 'c', **{'Бренд': None}), self.row(4, 'd'),
+        ])
+
+        self.assertEqual((stats['read'], stats['skipped'], stats['created']), (5, 1, 3))
+        self.assertEqual(list(FinancialReport.objects.order_by('number').values_list('number', 'srid')),
+                         [(1, 'a'), (2, 'b'), (4, 'd')])
+        # Целый размер из числового столбца записывается без '.0'
+        self.assertEqual(set(FinancialReport.objects.values_list('size', flat=True)), {'42'})
+        # Повторная загрузка той же книги ничего не добавляет
+        self.assertEqual(self.import_rows([self.row(1, 'a'), self.row(4, 'd')])['created'], 0)
+
+    def test_incremental_import_counts_by_natural_key_and_hash(self):
+        first = self.import_rows([self.row(1, 'a'), self.row(2, 'b'), self.row(3, 'c')], incremental=True)
+        self.assertEqual((first['created'], first['updated'], first['unchanged']), (3, 0, 0))
+        hashes = dict(FinancialReport.objects.values_list('number', 'content_hash'))
+
+        second = self.import_rows([
+            self.row(1, 'a'),
+            self.row(2, 'b', **{'Вайлдберриз реализовал Товар (Пр)': 99.25}),
+            self.row(3, 'c'),
+            # Тот же номер с другим Srid - другая строка
+            self.row(3, 'c-2'),
+        ], incremental=True)
+
+        self.assertEqual((second['created'], second['updated'], second['unchanged']), (1, 1, 2))
+        self.assertEqual(FinancialReport.objects.count(), 4)
+        self.assertEqual(FinancialReport.objects.get(srid='b').wb_sold_product, Decimal('99.25'))
+        # Хеш неизменившейся строки совпадает с записанным: значения сравниваются в виде из базы
+        self.assertEqual(FinancialReport.objects.get(srid='a').content_hash, hashes[1])
+        self.assertNotEqual(FinancialReport.objects.get(srid='b').content_hash, hashes[2])
 
-# Create your tests here.
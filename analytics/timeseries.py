@@ -0,0 +1,166 @@
+"""
+Временные ряды продаж по дням, неделям и месяцам
+
+Ряд строится из дневных итогов: в базе - из DailySalesRollup, в
+статическом режиме - из daily_sales.json (его выгружает export_static_data).
+Дни сворачиваются в недели и месяцы на лету, поэтому стоимость запроса
+зависит от числа дней в периоде, а не от числа строк финотчетов.
+
+Ответ колоночный: массивы начал периодов, продаж и количества одной длины.
+Периоды без продаж внутри диапазона заполняются нулями.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from analytics.models import DailySalesRollup
+from analytics.static_query import FilterSpec
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+STATIC_FILENAME = 'daily_sales.json'
+STATIC_FIELDS = ('day', 'brand', 'supplier_article')
+
+# Предел длины ряда: десять лет по дням
+MAX_BUCKETS = 3660
+
+
+def bucket_start(day, granularity):
+    """Начало периода, в который попадает день: сам день, понедельник или 1-е число"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    """Начало следующего периода; None, если оно позже date.max"""
+    try:
+        if granularity == 'week':
+            return start + timedelta(days=7)
+        if granularity == 'month':
+            return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return start + timedelta(days=1)
+    except (OverflowError, ValueError):
+        return None
+
+
+def bucket_count(first, last, granularity):
+    """Число периодов ряда от first до last включительно"""
+    start, end = bucket_start(first, granularity), bucket_start(last, granularity)
+    if granularity == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    days = (end - start).days
+    return (days // 7 if granularity == 'week' else days) + 1
+
+
+def check_bucket_count(first, last, granularity, field):
+    if bucket_count(first, last, granularity) > MAX_BUCKETS:
+        raise ValidationError({field: f'Не больше {MAX_BUCKETS} периодов: сократите период или укрупните шаг'})
+
+
+class TimeseriesQuery:
+    """Параметры ряда: период, шаг и фильтры по бренду и артикулу"""
+
+    def __init__(self, date_from=None, date_to=None, granularity='day', brand=None, article=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.granularity = granularity
+        self.brand = brand
+        self.article = article
+
+    @classmethod
+    def from_params(cls, params):
+        """Разбор ?from=&to=&granularity=&brand=&article=; ошибки - 400"""
+        errors = {}
+        dates = {}
+        for name in ('from', 'to'):
+            value = params.get(name)
+            dates[name] = parse_date(value) if value else None
+            if value and dates[name] is None:
+                errors[name] = 'Дата в формате ГГГГ-ММ-ДД'
+
+        granularity = params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            errors['granularity'] = f"Допустимые значения: {', '.join(GRANULARITIES)}"
+
+        if not errors and dates['from'] and dates['to'] and dates['from'] > dates['to']:
+            errors['from'] = 'Начало периода позже конца'
+        if errors:
+            raise ValidationError(errors)
+        if dates['from'] and dates['to']:
+            check_bucket_count(dates['from'], dates['to'], granularity, 'to')
+
+        return cls(
+            dates['from'], dates['to'], granularity,
+            params.get('brand') or None, params.get('article') or None,
+        )
+
+    def database_days(self):
+        """Продажи по дням из DailySalesRollup: [(день, продажи, количество)]"""
+        queryset = DailySalesRollup.objects.all()
+        if self.date_from:
+            queryset = queryset.filter(day__gte=self.date_from)
+        if self.date_to:
+            queryset = queryset.filter(day__lte=self.date_to)
+        if self.brand:
+            queryset = queryset.filter(brand=self.brand)
+        if self.article:
+            queryset = queryset.filter(supplier_article=self.article)
+        rows = queryset.values('day').annotate(
+            sales=Sum('wb_sold_product'), quantity=Sum('quantity')
+        ).order_by('day')
+        return [(row['day'], row['sales'] or 0, row['quantity'] or 0) for row in rows]
+
+    def static_days(self, dataset):
+        """Продажи по дням из индексированного daily_sales.json"""
+        filters = []
+        if self.date_from:
+            filters.append(('day', 'gte', self.date_from.isoformat()))
+        if self.date_to:
+            filters.append(('day', 'lte', self.date_to.isoformat()))
+        if self.brand:
+            filters.append(('brand', 'exact', self.brand))
+        if self.article:
+            filters.append(('supplier_article', 'exact', self.article))
+
+        records = dataset.records
+        return [
+            (
+                parse_date(records[position]['day']),
+                Decimal(str(records[position].get('sales') or 0)),
+                records[position].get('quantity') or 0,
+            )
+            for position in dataset.positions(FilterSpec(filters, ordering='day'))
+        ]
+
+    def build(self, days):
+        """Колоночный ряд по периодам из продаж по дням"""
+        buckets = {}
+        for day, sales, quantity in days:
+            start = bucket_start(day, self.granularity)
+            bucket = buckets.setdefault(start, [Decimal('0'), 0])
+            bucket[0] += sales
+            bucket[1] += quantity
+
+        first = self.date_from or (min(buckets) if buckets else None)
+        last = self.date_to or (max(buckets) if buckets else None)
+
+        result = {'granularity': self.granularity, 'days': [], 'sales': [], 'quantity': []}
+        if first is not None and last is not None:
+            # Открытая граница периода берется по данным и тоже ограничена
+            check_bucket_count(first, last, self.granularity, 'to' if self.date_from else 'from')
+            start = bucket_start(first, self.granularity)
+            while start is not None and start <= last:
+                sales, quantity = buckets.get(start, (Decimal('0'), 0))
+                result['days'].append(start.isoformat())
+                result['sales'].append(float(round(sales, 2)))
+                result['quantity'].append(int(quantity))
+                start = next_bucket(start, self.granularity)
+        return result
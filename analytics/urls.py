@@ -5,8 +5,10 @@ from analytics.views import (
     NomenclatureViewSet, StockBalanceViewSet,
     SummaryDataViewSet, PurchasePlanViewSet, DashboardViewSet
 )
-from analytics.dashboard_views import (
-    dashboard_view, dashboard_overview, dashboard_charts_data
+from analytics.dashboard_views import dashboard_view
+from analytics.export_views import (
+    excel_export_download, excel_export_start, excel_export_status,
+    financial_reports_csv, financial_reports_ndjson
 )
 
 router = DefaultRouter()
@@ -20,7 +22,11 @@ router.register(r'dashboard', DashboardViewSet, basename='dashboard')
 
 urlpatterns = [
     path('', dashboard_view, name='dashboard'),
+    # До маршрутов router: иначе export.ndjson разбирается как запись с pk=export
+    path('api/financial-reports/export.ndjson', financial_reports_ndjson, name='financial_reports_ndjson'),
+    path('api/financial-reports/export.csv', financial_reports_csv, name='financial_reports_csv'),
+    path('api/excel-export/', excel_export_start, name='excel_export_start'),
+    path('api/excel-export/<str:job_id>/', excel_export_status, name='excel_export_status'),
+    path('api/excel-export/<str:job_id>/download/', excel_export_download, name='excel_export_download'),
     path('api/', include(router.urls)),
-    path('api/dashboard/overview/', dashboard_overview, name='dashboard_overview'),
-    path('api/dashboard/charts_data/', dashboard_charts_data, name='dashboard_charts'),
 ]
@@ -2,43 +2,247 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Sum, Avg
-from django.http import JsonResponse
-import json
-import os
+from django.http import HttpResponse, JsonResponse
 from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from analytics.models import (
     SalesAnalysis, FinancialReport, Nomenclature, 
     StockBalance, SummaryData, PurchasePlan
 )
 from analytics.services import CalculationService
+from analytics import cache, timeseries
+from analytics.conditional import conditional_response, data_validators, static_validators
+from analytics.pagination import KeysetPagination, PageSizePagination, keyset_payload
+from analytics.renderers import ColumnarJSONRenderer
+from analytics.rollups import DailySalesRollupService
+from analytics.static_data import store
+from analytics.static_query import (
+    CURSOR_PARAM, FilterSpec, decode_cursor, is_keyset_request, wants_count
+)
+from analytics.timeseries import TimeseriesQuery
 from analytics.serializers import (
     SalesAnalysisSerializer, FinancialReportSerializer, 
     NomenclatureSerializer, StockBalanceSerializer,
-    SummaryDataSerializer, PurchasePlanSerializer
+    SummaryDataSerializer, PurchasePlanSerializer, requested_fields
 )
 
 
 def load_static_data(filename):
-    """Загрузка статических данных из JSON файлов"""
+    """Загрузка статических данных из JSON файлов (разбираются один раз на процесс)"""
     try:
-        static_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'data', filename)
-        with open(static_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return store.get(filename)
     except Exception as e:
         print(f"Ошибка загрузки {filename}: {e}")
         return []
 
 
-class SalesAnalysisViewSet(viewsets.ModelViewSet):
+def static_response(request, filename):
+    """
+    Ответ с готовыми байтами JSON-файла, без разбора и сериализации;
+    если клиент поддерживает, отдается заранее сжатый вариант
+    """
+    try:
+        content, encoding = store.get_content(filename, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    except Exception as e:
+        print(f"Ошибка загрузки {filename}: {e}")
+        content, encoding = b'[]', None
+    
+    response = HttpResponse(content, content_type='application/json')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(content))
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def static_conditional_response(request, filename):
+    """Статический ответ с ETag/Last-Modified по файлу; 304 без чтения файла"""
+    return conditional_response(
+        request, static_validators(filename), lambda: static_response(request, filename)
+    )
+
+
+def static_columnar_response(filename):
+    """Весь статический файл в колоночном виде; байты строятся один раз на версию файла"""
+    content = store.get_derived(filename, 'columnar', lambda data: ColumnarJSONRenderer().render(data))
+    return HttpResponse(content, content_type='application/json')
+
+
+def static_page(request, spec, count, results):
+    """Страница результата в том же виде, что у PageNumberPagination"""
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if spec.page * spec.page_size < count:
+        next_url = replace_query_param(url, 'page', spec.page + 1)
+    if spec.page > 1:
+        previous_url = (
+            replace_query_param(url, 'page', spec.page - 1) if spec.page > 2
+            else remove_query_param(url, 'page')
+        )
+    return Response({'count': count, 'next': next_url, 'previous': previous_url, 'results': results})
+
+
+def project(records, fields):
+    """Записи только с полями fields (None - без изменений)"""
+    if not fields:
+        return records
+    return [{name: record.get(name) for name in fields} for record in records]
+
+
+class ColumnarMixin:
+    """Дополнительный формат ответа ?format=columnar для больших таблиц"""
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer]
+
+
+class StaticListMixin:
+    """
+    Список из статического файла static_filename в статическом режиме
+    (settings.STATIC_MODE), иначе - обычный список из базы данных.
+    Оба варианта поддерживают условные запросы (ETag, Last-Modified).
+    
+    Фильтры, сортировка и страница по полям filter_fields (см.
+    analytics.static_query) одинаковы в обоих режимах. В статическом режиме
+    запрос с параметрами выполняется по индексам, без них отдается файл целиком.
+    
+    ?fields=id,brand,... сужает ответ до нужных столбцов: в базе читаются
+    только они (.only()), сериализатор отдает только их, статические записи
+    проецируются по ключам.
+    
+    ?cursor= включает страницы по ключу keyset_fields (см.
+    analytics.pagination) вместо номеров страниц.
+    """
+    static_filename = None
+    filter_fields = ()
+    keyset_fields = ('id',)
+    pagination_class = PageSizePagination
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and is_keyset_request(self.request.query_params):
+            self._paginator = KeysetPagination(self.keyset_fields)
+        return super().paginator
+    
+    def filter_spec(self):
+        return FilterSpec.from_params(self.request.query_params, self.filter_fields)
+    
+    def requested_fields(self):
+        return requested_fields(self.request, self.get_serializer_class()().fields)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.requested_fields() if self.request.method == 'GET' else None
+        if fields:
+            if is_keyset_request(self.request.query_params):
+                fields = [*fields, *self.keyset_fields]
+            concrete = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = queryset.only(*[name for name in fields if name in concrete])
+        return queryset
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list':
+            queryset = self.filter_spec().apply_to_queryset(queryset)
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        if settings.STATIC_MODE and self.static_filename:
+            spec = self.filter_spec()
+            fields = self.requested_fields()
+            if is_keyset_request(request.query_params):
+                return self.static_keyset_list(request, spec, fields)
+            if spec.is_empty and not fields:
+                if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+                    return conditional_response(
+                        request, static_validators(self.static_filename),
+                        lambda: static_columnar_response(self.static_filename)
+                    )
+                return static_conditional_response(request, self.static_filename)
+            
+            def build():
+                if spec.is_empty:
+                    return Response(project(load_static_data(self.static_filename), fields))
+                dataset = store.get_dataset(self.static_filename, self.filter_fields)
+                count, results = dataset.query(spec)
+                return static_page(request, spec, count, project(results, fields))
+            return conditional_response(request, static_validators(self.static_filename), build)
+        return conditional_response(
+            request, data_validators(), lambda: super(StaticListMixin, self).list(request, *args, **kwargs)
+        )
+    
+    def static_keyset_list(self, request, spec, fields):
+        """Страница статического файла по ключу keyset_fields"""
+        after = decode_cursor(request.query_params.get(CURSOR_PARAM), len(self.keyset_fields))
+        
+        def build():
+            dataset = store.get_dataset(self.static_filename, self.filter_fields)
+            count, results, next_key = dataset.keyset_query(
+                spec, self.keyset_fields, after, wants_count(request.query_params)
+            )
+            return Response(keyset_payload(request, count, next_key, project(results, fields)))
+        return conditional_response(request, static_validators(self.static_filename), build)
+
+
+class DataVersionMixin:
+    """Запись через API меняет версию данных: кеши и ETag становятся неактуальными"""
+    
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        cache.invalidate()
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        cache.invalidate()
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        cache.invalidate()
+
+
+class DailyRollupMixin:
+    """
+    Запись финотчета через API пересчитывает дневные итоги за затронутые дни
+    (старый и новый день продажи). Ставится после DataVersionMixin, чтобы
+    версия данных менялась уже после пересчета.
+    """
+    
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+            DailySalesRollupService.refresh_dates([serializer.instance.sale_date])
+    
+    def perform_update(self, serializer):
+        previous = serializer.instance.sale_date
+        with transaction.atomic():
+            super().perform_update(serializer)
+            DailySalesRollupService.refresh_dates([previous, serializer.instance.sale_date])
+    
+    def perform_destroy(self, instance):
+        previous = instance.sale_date
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            DailySalesRollupService.refresh_dates([previous])
+
+
+class SalesAnalysisViewSet(StaticListMixin, ColumnarMixin, DataVersionMixin, viewsets.ModelViewSet):
     """API для анализа продаж"""
     queryset = SalesAnalysis.objects.all()
     serializer_class = SalesAnalysisSerializer
+    static_filename = 'sales_analysis.json'
+    filter_fields = ('brand', 'subject', 'article', 'barcode')
+    
+    def perform_create(self, serializer):
+        """Новая запись попадает в следующий инкрементальный пересчет"""
+        serializer.validated_data['is_dirty'] = True
+        super().perform_create(serializer)
     
-    def list(self, request):
-        """Возвращает статические данные анализа продаж"""
-        data = load_static_data('sales_analysis.json')
-        return Response(data)
+    def perform_update(self, serializer):
+        """Измененная запись попадает в следующий инкрементальный пересчет"""
+        serializer.validated_data['is_dirty'] = True
+        super().perform_update(serializer)
     
     @action(detail=False, methods=['post'])
     def recalculate(self, request):
@@ -48,19 +252,19 @@ class SalesAnalysisViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Получение сводных данных"""
-        data = load_static_data('summary.json')
-        return Response(data[0] if data else {})
+        def build():
+            data = load_static_data('summary.json')
+            return Response(data[0] if data else {})
+        return conditional_response(request, static_validators('summary.json'), build)
 
 
-class FinancialReportViewSet(viewsets.ModelViewSet):
+class FinancialReportViewSet(StaticListMixin, ColumnarMixin, DataVersionMixin, DailyRollupMixin, viewsets.ModelViewSet):
     """API для финансовых отчетов"""
     queryset = FinancialReport.objects.all()
     serializer_class = FinancialReportSerializer
-    
-    def list(self, request):
-        """Возвращает статические данные финансовых отчетов"""
-        data = load_static_data('financial_reports.json')
-        return Response(data)
+    static_filename = 'financial_reports.json'
+    filter_fields = ('brand', 'subject', 'supplier_article', 'barcode', 'nomenclature_code', 'sale_date')
+    keyset_fields = ('sale_date', 'id')
     
     @action(detail=False, methods=['post'])
     def bulk_import(self, request):
@@ -70,47 +274,40 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class NomenclatureViewSet(viewsets.ModelViewSet):
+class NomenclatureViewSet(StaticListMixin, DataVersionMixin, viewsets.ModelViewSet):
     """API для номенклатуры"""
     queryset = Nomenclature.objects.all()
     serializer_class = NomenclatureSerializer
-    
-    def list(self, request):
-        """Возвращает статические данные номенклатуры"""
-        data = load_static_data('nomenclature.json')
-        return Response(data)
+    static_filename = 'nomenclature.json'
+    filter_fields = ('brand', 'subject', 'supplier_article', 'barcode', 'wb_article')
     
     @action(detail=False, methods=['get'])
     def by_brand(self, request):
         """Получение номенклатуры по бренду"""
-        brand = request.query_params.get('brand')
-        data = load_static_data('nomenclature.json')
-        if brand:
-            filtered_data = [item for item in data if brand.lower() in item.get('brand', '').lower()]
-            return Response(filtered_data)
-        return Response(data)
+        def build():
+            brand = request.query_params.get('brand')
+            data = load_static_data('nomenclature.json')
+            if brand:
+                # Подстрока ищется среди различных брендов, записи берутся по индексу
+                dataset = store.get_dataset('nomenclature.json', self.filter_fields)
+                return Response(dataset.contains('brand', brand))
+            return Response(data)
+        return conditional_response(request, static_validators('nomenclature.json'), build)
 
 
-class StockBalanceViewSet(viewsets.ModelViewSet):
+class StockBalanceViewSet(StaticListMixin, DataVersionMixin, viewsets.ModelViewSet):
     """API для остатков на складах"""
     queryset = StockBalance.objects.all()
     serializer_class = StockBalanceSerializer
-    
-    def list(self, request):
-        """Возвращает статические данные остатков"""
-        data = load_static_data('stock_balance.json')
-        return Response(data)
+    static_filename = 'stock_balance.json'
+    filter_fields = ('brand', 'subject', 'supplier_article')
 
 
-class SummaryDataViewSet(viewsets.ReadOnlyModelViewSet):
+class SummaryDataViewSet(StaticListMixin, viewsets.ReadOnlyModelViewSet):
     """API для сводных данных (только чтение)"""
     queryset = SummaryData.objects.all()
     serializer_class = SummaryDataSerializer
-    
-    def list(self, request):
-        """Возвращает статические сводные данные"""
-        data = load_static_data('summary.json')
-        return Response(data)
+    static_filename = 'summary.json'
     
     @action(detail=False, methods=['post'])
     def refresh(self, request):
@@ -119,7 +316,7 @@ class SummaryDataViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(data[0] if data else {})
 
 
-class PurchasePlanViewSet(viewsets.ModelViewSet):
+class PurchasePlanViewSet(StaticListMixin, DataVersionMixin, viewsets.ModelViewSet):
     """API для планов по выкупам"""
     queryset = PurchasePlan.objects.all()
     serializer_class = PurchasePlanSerializer
@@ -132,8 +329,9 @@ class DashboardViewSet(viewsets.ViewSet):
     def overview(self, request):
         """Обзор основных показателей"""
         try:
-            data = load_static_data('dashboard_overview.json')
-            return Response(data)
+            if settings.STATIC_MODE:
+                return static_conditional_response(request, 'dashboard_overview.json')
+            return conditional_response(request, data_validators(), lambda: Response(cache.get_overview()))
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
@@ -141,7 +339,29 @@ class DashboardViewSet(viewsets.ViewSet):
     def charts_data(self, request):
         """Данные для графиков"""
         try:
-            data = load_static_data('charts_data.json')
-            return Response(data)
+            if settings.STATIC_MODE:
+                return static_conditional_response(request, 'charts_data.json')
+            return conditional_response(request, data_validators(), lambda: Response(cache.build_charts_data()))
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        """
+        Ряд продаж за период: ?from=&to=&granularity=day|week|month&brand=&article=.
+        Ответ колоночный: days[], sales[], quantity[]
+        """
+        query = TimeseriesQuery.from_params(request.query_params)
+        if settings.STATIC_MODE:
+            validators = static_validators(timeseries.STATIC_FILENAME)
+
+            def build():
+                # daily_sales.json появляется после export_static_data; до этого ряд пустой
+                if validators[0] is None:
+                    return Response(query.build([]))
+                dataset = store.get_dataset(timeseries.STATIC_FILENAME, timeseries.STATIC_FIELDS)
+                return Response(query.build(query.static_days(dataset)))
+            return conditional_response(request, validators, build)
+        return conditional_response(
+            request, data_validators(), lambda: Response(query.build(query.database_days()))
+        )
\ No newline at end of file
@@ -107,6 +107,11 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Статический режим API: списки отдаются из JSON-файлов static/data/,
+# при False - из базы данных
+STATIC_MODE = config('STATIC_MODE', default=True, cast=bool)
+STATIC_DATA_DIR = BASE_DIR / 'static' / 'data'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -120,8 +125,26 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Десятичные значения - числами, как в файлах static/data/ статического режима
+    'COERCE_DECIMAL_TO_STRING': False,
 }
 
+# Движок пересчета анализа продаж: 'python' (построчно), 'vectorized', 'database'
+# или 'fixed_point'
+CALCULATION_BACKEND = config('CALCULATION_BACKEND', default='python')
+
+# Кеш обзора дашборда: псевдоним из CACHES для общего кеша между процессами
+# (пусто - только кеш процесса)
+SUMMARY_CACHE_ALIAS = config('SUMMARY_CACHE_ALIAS', default='')
+
+# Файл с версией данных, которую меняют импорт и пересчет
+DATA_VERSION_FILE = config('DATA_VERSION_FILE', default=str(BASE_DIR / 'data_version'))
+
+# Каталог готовых выгрузок Excel (по файлу на версию данных)
+EXCEL_EXPORT_DIR = config('EXCEL_EXPORT_DIR', default=str(BASE_DIR / 'exports'))
+# Строить листы-таблицы выгрузки параллельно в отдельных процессах
+EXCEL_EXPORT_PARALLEL = config('EXCEL_EXPORT_PARALLEL', default=False, cast=bool)
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",